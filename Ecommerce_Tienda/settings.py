@@ -80,6 +80,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'panel_admin.context_processors.panel_context',
+                'carrito.context_processors.mini_carrito',
             ],
         },
     },
@@ -95,6 +96,9 @@ DATABASES = {
      'default': {
          'ENGINE': 'django.db.backends.sqlite3',
          'NAME': BASE_DIR / 'db.sqlite3',
+         # Base de tests en archivo (no en memoria): los tests con varios
+         # hilos necesitan que SQLite espere el lock en vez de fallar
+         'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
      }
  }
 # DATABASES = {
@@ -111,6 +115,31 @@ DATABASES = {
 #     }
 # }
 
+# Cache
+# Con REDIS_URL (producción con varios workers) va en Redis, compartida por
+# todos los procesos: las invalidaciones de cache_grillas, facetas, ETags,
+# el dashboard, los totales y los permisos del panel se ven en todos.
+# Sin REDIS_URL cada proceso tiene la suya en memoria (desarrollo, tests, un
+# solo worker): con varios, lo que invalida uno los demás lo ven recién
+# cuando vence la entrada. No va en la base: cada lectura sería una
+# consulta y cada escritura una transacción de escritura en SQLite.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tienda',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -175,7 +204,37 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 MERCADOPAGO_ACCESS_TOKEN = os.environ.get("MERCADOPAGO_ACCESS_TOKEN")
 MERCADOPAGO_PUBLIC_KEY = os.environ.get("MERCADOPAGO_PUBLIC_KEY")
+# Adónde manda MP las notificaciones de los pagos de cada preferencia
+# (la vista webhook_mercadopago); tiene que ser una URL pública
+MERCADOPAGO_NOTIFICATION_URL = os.environ.get(
+    "MERCADOPAGO_NOTIFICATION_URL",
+    "https://tiendalore.pythonanywhere.com/pedidos/webhooks/mercadopago/",
+)
+# Cliente HTTP: URL (para apuntar a `servidor_mp_simulado`), timeouts en
+# segundos, reintentos y circuit breaker
+MERCADOPAGO_API_URL = os.environ.get("MERCADOPAGO_API_URL", "https://api.mercadopago.com")
+MERCADOPAGO_TIMEOUT_CONEXION = 3.05
+MERCADOPAGO_TIMEOUT_LECTURA = 10
+MERCADOPAGO_REINTENTOS = 2
+MERCADOPAGO_CIRCUITO_FALLOS = 5
+MERCADOPAGO_CIRCUITO_SEGUNDOS = 30
 
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# ==============================
+# CARRITO
+# ==============================
+
+# El carrito de quien solo mira vive en la sesión (en la base, el
+# SESSION_ENGINE por defecto) y se pasa a Carrito/ItemCarrito recién en el
+# checkout (ver carrito/backends.py): agregar un producto actualiza la
+# fila de la sesión en vez de escribir el carrito y sus totales.
+# Para guardar el carrito en la base desde el primer clic:
+# CARRITO_BACKEND = 'carrito.backends.CarritoBaseDatos'
+CARRITO_BACKEND = 'carrito.backends.CarritoSesion'
+
+# Minutos que el stock de un pedido queda reservado entre el checkout y
+# el pago (ver pedidos_pagos/reservas.py y el comando liberar_reservas)
+RESERVA_STOCK_MINUTOS = 15
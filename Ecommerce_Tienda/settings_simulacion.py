@@ -0,0 +1,13 @@
+# Ecommerce_Tienda/settings_simulacion.py
+"""
+Settings para pruebas de carga locales del webhook de Mercado Pago
+(`python manage.py simular_notificaciones`), sin salir a la red:
+
+    DJANGO_SETTINGS_MODULE=Ecommerce_Tienda.settings_simulacion python manage.py runserver
+
+NUNCA usarlo en producción: cualquier id que llegue al webhook (que es
+público) se da por pago aprobado del pedido con ese id.
+"""
+from .settings import *  # noqa: F401,F403
+
+MERCADOPAGO_SIMULADO = True
@@ -0,0 +1,413 @@
+# carrito/backends.py
+"""
+Dónde vive el carrito mientras el cliente navega.
+
+settings.CARRITO_BACKEND elige la implementación:
+
+- CarritoSesion (por defecto): las líneas se guardan en la sesión
+  ({producto_id: cantidad}, hasta MAXIMO_LINEAS productos distintos).
+  Mirar y agregar productos solo actualiza la sesión. Recién en el
+  checkout (persistir()) se crean el Carrito y sus ItemCarrito, que es
+  lo que usan Pedido y el panel. La sesión se lee y se guarda entera: si
+  llegan dos cambios a la vez de la misma sesión (ej. dos pestañas),
+  gana el último que termina y el otro se pierde.
+- CarritoBaseDatos: el carrito se guarda en la base desde el primer
+  "agregar" (carrito/services.py), con UPDATEs atómicos que no pierden
+  cambios simultáneos.
+
+Las dos exponen lo mismo que Carrito/ItemCarrito para vistas y templates
+(`carrito.items.all`, `item.producto`, `item.cantidad`, `item.subtotal`,
+`carrito.total()`), más las operaciones agregar/sumar/restar/eliminar/
+vaciar y persistir().
+
+aplicar() recibe una lista de operaciones sobre líneas (la usa la API
+JSON del carrito): las valida todas contra el stock con una consulta y
+las aplica juntas, o no aplica ninguna.
+
+Cada operación deja en la sesión un resumen (unidades y total) que usan
+total(), cantidad_items() y el mini carrito del encabezado
+(carrito/context_processors.py) sin consultar la base. Al cargar las
+líneas (página del carrito, checkout) el resumen se corrige si algún
+precio cambió.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from tienda.models import Producto
+from . import services
+from .models import Carrito, ItemCarrito
+
+BACKEND_POR_DEFECTO = 'carrito.backends.CarritoSesion'
+
+CLAVE_RESUMEN = 'carrito_resumen'
+
+ACCIONES = ('fijar', 'agregar', 'eliminar')
+MAXIMO_OPERACIONES = 100
+
+
+class OperacionesInvalidas(ValueError):
+    def __init__(self, errores):
+        super().__init__('; '.join(errores))
+        self.errores = errores
+
+
+class LineasCarrito(list):
+    """Lista de líneas con la parte de la API del related manager que se usa"""
+
+    def all(self):
+        return self
+
+    def exists(self):
+        return bool(self)
+
+    def count(self):
+        return len(self)
+
+
+class LineaCarrito:
+    """Equivalente a ItemCarrito para el carrito en sesión"""
+
+    def __init__(self, producto, cantidad):
+        self.producto = producto
+        self.cantidad = cantidad
+
+    def subtotal(self):
+        return self.producto.precio * self.cantidad
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto.nombre}"
+
+
+class CarritoBackend:
+    # Productos distintos que puede tener el carrito (None = sin tope)
+    MAXIMO_LINEAS = None
+
+    def __init__(self, request):
+        self.request = request
+        self._items = None
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = LineasCarrito(self._cargar_items())
+            self._guardar_resumen(
+                sum(item.cantidad for item in self._items),
+                sum((item.subtotal() for item in self._items), Decimal('0')),
+            )
+        return self._items
+
+    def resumen(self):
+        """{'cantidad': unidades, 'total': Decimal}, leído de la sesión"""
+        datos = self.request.session.get(CLAVE_RESUMEN)
+        if not datos:
+            return {'cantidad': 0, 'total': Decimal('0')}
+        return {'cantidad': datos['cantidad'], 'total': Decimal(datos['total'])}
+
+    def total(self):
+        return self.resumen()['total']
+
+    def cantidad_items(self):
+        return self.resumen()['cantidad']
+
+    def _guardar_resumen(self, cantidad, total):
+        datos = {'cantidad': cantidad, 'total': str(total)} if cantidad else None
+        if self.request.session.get(CLAVE_RESUMEN) != datos:
+            # Solo si cambió: cada escritura vuelve a guardar la sesión
+            if datos:
+                self.request.session[CLAVE_RESUMEN] = datos
+            else:
+                self.request.session.pop(CLAVE_RESUMEN, None)
+
+    def _modificado(self):
+        self._items = None
+
+    # ---------- Operaciones en lote ----------
+
+    def aplicar(self, operaciones):
+        """
+        Aplica una lista de operaciones, todas o ninguna:
+            {'accion': 'fijar', 'producto_id': 3, 'cantidad': 2}   (0 = quitar)
+            {'accion': 'agregar', 'producto_id': 3, 'cantidad': 1}
+            {'accion': 'eliminar', 'producto_id': 3}
+        Lanza OperacionesInvalidas si alguna no es válida o pide más que
+        el stock. Devuelve la instantánea del carrito resultante.
+        """
+        operaciones = _normalizar(operaciones)
+        actuales = self._cantidades()
+        finales = dict(actuales)
+        for accion, producto_id, cantidad in operaciones:
+            if accion == 'fijar':
+                finales[producto_id] = cantidad
+            elif accion == 'agregar':
+                finales[producto_id] = finales.get(producto_id, 0) + cantidad
+            else:
+                finales[producto_id] = 0
+
+        # Una sola consulta para validar el stock y armar la respuesta
+        productos = Producto.objects.in_bulk(list(finales))
+        errores = []
+        for producto_id in {producto_id for _, producto_id, _ in operaciones}:
+            producto = productos.get(producto_id)
+            if producto is None:
+                if finales[producto_id]:
+                    errores.append(f'No existe el producto {producto_id}')
+            elif finales[producto_id] > producto.stock:
+                errores.append(f'Stock insuficiente para {producto.nombre} (stock: {producto.stock})')
+        lineas = sum(1 for producto_id, cantidad in finales.items() if cantidad and producto_id in productos)
+        if self.MAXIMO_LINEAS is not None and lineas > self.MAXIMO_LINEAS:
+            errores.append(f'Máximo {self.MAXIMO_LINEAS} productos distintos en el carrito')
+        if errores:
+            raise OperacionesInvalidas(errores)
+
+        cambios = {
+            producto_id: cantidad for producto_id, cantidad in finales.items()
+            if cantidad != actuales.get(producto_id, 0) and producto_id in productos
+        }
+        if cambios:
+            self._aplicar_cambios(cambios, productos)
+        finales = {pk: cantidad for pk, cantidad in finales.items() if cantidad and pk in productos}
+        return self._instantanea(finales, productos)
+
+    def instantanea(self):
+        return self._instantanea(
+            {item.producto.pk: item.cantidad for item in self.items},
+            {item.producto.pk: item.producto for item in self.items},
+        )
+
+    def _instantanea(self, cantidades, productos):
+        lineas = [
+            {
+                'producto_id': producto_id,
+                'nombre': productos[producto_id].nombre,
+                'precio': float(productos[producto_id].precio),
+                'stock': productos[producto_id].stock,
+                'cantidad': cantidad,
+                'subtotal': float(productos[producto_id].precio * cantidad),
+            }
+            for producto_id, cantidad in cantidades.items()
+        ]
+        resumen = self.resumen()
+        return {
+            'items': lineas,
+            'cantidad_items': resumen['cantidad'],
+            'total': float(resumen['total']),
+        }
+
+
+def _normalizar(operaciones):
+    """Lista de (accion, producto_id, cantidad) o OperacionesInvalidas"""
+    if not isinstance(operaciones, list) or not operaciones:
+        raise OperacionesInvalidas(['Se esperaba una lista de operaciones'])
+    if len(operaciones) > MAXIMO_OPERACIONES:
+        raise OperacionesInvalidas([f'Máximo {MAXIMO_OPERACIONES} operaciones por pedido'])
+
+    resultado = []
+    errores = []
+    for numero, operacion in enumerate(operaciones, start=1):
+        try:
+            accion = operacion.get('accion')
+            producto_id = int(operacion.get('producto_id'))
+            cantidad = 0 if accion == 'eliminar' else int(operacion.get('cantidad', 1))
+        except (AttributeError, TypeError, ValueError):
+            errores.append(f'Operación {numero}: formato inválido')
+            continue
+        if accion not in ACCIONES:
+            errores.append(f'Operación {numero}: acción desconocida "{accion}"')
+        elif cantidad < 0 or (accion == 'agregar' and cantidad == 0):
+            errores.append(f'Operación {numero}: cantidad inválida')
+        else:
+            resultado.append((accion, producto_id, cantidad))
+    if errores:
+        raise OperacionesInvalidas(errores)
+    return resultado
+
+
+class CarritoSesion(CarritoBackend):
+    CLAVE = 'carrito'
+    # La sesión se lee y se guarda entera en cada request: que no crezca
+    MAXIMO_LINEAS = 50
+
+    @property
+    def _lineas(self):
+        # {str(producto_id): cantidad}; las claves JSON de la sesión son texto
+        return self.request.session.get(self.CLAVE, {})
+
+    def _productos(self, *extra):
+        """{producto_id: (precio, stock)} de las líneas (y de `extra`), en una consulta"""
+        ids = {int(pk) for pk in self._lineas} | set(extra)
+        if not ids:
+            return {}
+        return {
+            pk: (precio, stock)
+            for pk, precio, stock in Producto.objects.filter(pk__in=ids).values_list('pk', 'precio', 'stock')
+        }
+
+    def _guardar(self, lineas, productos):
+        if lineas:
+            self.request.session[self.CLAVE] = lineas
+        else:
+            self.request.session.pop(self.CLAVE, None)
+        # Los precios ya vinieron en la misma consulta del stock
+        vigentes = [(productos[int(pk)][0], cantidad) for pk, cantidad in lineas.items() if int(pk) in productos]
+        self._guardar_resumen(
+            sum(cantidad for _, cantidad in vigentes),
+            sum((precio * cantidad for precio, cantidad in vigentes), Decimal('0')),
+        )
+        self._modificado()
+
+    def _cargar_items(self):
+        lineas = self._lineas
+        productos = Producto.objects.in_bulk([int(pk) for pk in lineas])
+        # Los productos borrados desde que se agregaron simplemente no se muestran
+        return [
+            LineaCarrito(productos[int(pk)], cantidad)
+            for pk, cantidad in lineas.items() if int(pk) in productos
+        ]
+
+    def agregar(self, producto_id, cantidad=1):
+        lineas = dict(self._lineas)
+        clave = str(producto_id)
+        if clave not in lineas and len(lineas) >= self.MAXIMO_LINEAS:
+            return None
+        productos = self._productos(int(producto_id))
+        stock = productos.get(int(producto_id), (None, 0))[1]
+        if not stock:
+            return None
+        lineas[clave] = min(lineas.get(clave, 0) + cantidad, stock)
+        self._guardar(lineas, productos)
+        return lineas[clave]
+
+    def sumar(self, producto_id):
+        lineas = dict(self._lineas)
+        clave = str(producto_id)
+        if clave not in lineas:
+            return False
+        productos = self._productos()
+        if lineas[clave] >= productos.get(int(producto_id), (None, 0))[1]:
+            return False
+        lineas[clave] += 1
+        self._guardar(lineas, productos)
+        return True
+
+    def restar(self, producto_id):
+        lineas = dict(self._lineas)
+        clave = str(producto_id)
+        if clave not in lineas:
+            return False
+        if lineas[clave] > 1:
+            lineas[clave] -= 1
+        else:
+            del lineas[clave]
+        self._guardar(lineas, self._productos())
+        return True
+
+    def eliminar(self, producto_id):
+        lineas = dict(self._lineas)
+        if lineas.pop(str(producto_id), None) is None:
+            return False
+        self._guardar(lineas, self._productos())
+        return True
+
+    def vaciar(self):
+        self._guardar({}, {})
+
+    def _cantidades(self):
+        return {int(pk): cantidad for pk, cantidad in self._lineas.items()}
+
+    def _aplicar_cambios(self, cambios, productos):
+        lineas = {str(pk): cantidad for pk, cantidad in self._cantidades().items()}
+        for producto_id, cantidad in cambios.items():
+            if cantidad:
+                lineas[str(producto_id)] = cantidad
+            else:
+                lineas.pop(str(producto_id), None)
+        self._guardar(lineas, {pk: (p.precio, p.stock) for pk, p in productos.items()})
+
+    def persistir(self):
+        """
+        Escribe las líneas en Carrito/ItemCarrito (checkout). Reemplaza lo
+        que hubiera de un checkout anterior de la misma sesión.
+        """
+        with transaction.atomic():
+            carrito_id = services.obtener_carrito_id(self.request)
+            ItemCarrito.objects.filter(carrito_id=carrito_id).delete()
+            ItemCarrito.objects.bulk_create([
+                ItemCarrito(carrito_id=carrito_id, producto=item.producto, cantidad=item.cantidad)
+                for item in self.items
+            ])
+            services.actualizar_totales(carrito_id)
+        return Carrito.objects.get(pk=carrito_id)
+
+
+class CarritoBaseDatos(CarritoBackend):
+    def _carrito_id(self):
+        return services.obtener_carrito_id(self.request)
+
+    def _cargar_items(self):
+        clave = services.clave_carrito(self.request, crear=False)
+        if clave is None:
+            return []
+        return ItemCarrito.objects.filter(carrito__session_key=clave).select_related('producto')
+
+    def _modificar(self, operacion, *argumentos):
+        """Aplica la operación y recalcula los totales en la misma transacción"""
+        with transaction.atomic():
+            carrito_id = self._carrito_id()
+            resultado = operacion(carrito_id, *argumentos)
+            self._guardar_resumen(*services.actualizar_totales(carrito_id))
+        self._modificado()
+        return resultado
+
+    def agregar(self, producto_id, cantidad=1):
+        return self._modificar(services.agregar, producto_id, cantidad)
+
+    def sumar(self, producto_id):
+        return self._modificar(services.sumar, producto_id)
+
+    def restar(self, producto_id):
+        return self._modificar(services.restar, producto_id)
+
+    def eliminar(self, producto_id):
+        return self._modificar(services.eliminar, producto_id)
+
+    def vaciar(self):
+        return self._modificar(services.vaciar)
+
+    def _cantidades(self):
+        return dict(
+            ItemCarrito.objects.filter(carrito_id=self._carrito_id())
+            .order_by('id').values_list('producto_id', 'cantidad')
+        )
+
+    def _aplicar_cambios(self, cambios, productos):
+        carrito_id = self._carrito_id()
+        with transaction.atomic():
+            ItemCarrito.objects.bulk_create(
+                [
+                    ItemCarrito(carrito_id=carrito_id, producto_id=producto_id, cantidad=cantidad)
+                    for producto_id, cantidad in cambios.items() if cantidad
+                ],
+                update_conflicts=True,
+                unique_fields=['carrito', 'producto'],
+                update_fields=['cantidad'],
+            )
+            ItemCarrito.objects.filter(
+                carrito_id=carrito_id,
+                producto_id__in=[producto_id for producto_id, cantidad in cambios.items() if not cantidad],
+            ).delete()
+            self._guardar_resumen(*services.actualizar_totales(carrito_id))
+        self._modificado()
+
+    def persistir(self):
+        return Carrito.objects.get(pk=self._carrito_id())
+
+
+def obtener_backend(request):
+    """El carrito del request (una instancia por request)"""
+    if not hasattr(request, '_carrito'):
+        clase = import_string(getattr(settings, 'CARRITO_BACKEND', BACKEND_POR_DEFECTO))
+        request._carrito = clase(request)
+    return request._carrito
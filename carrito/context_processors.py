@@ -0,0 +1,11 @@
+# carrito/context_processors.py
+from .backends import obtener_backend
+
+
+def mini_carrito(request):
+    """
+    Unidades y total del carrito para el ícono del encabezado. Sale del
+    resumen guardado en la sesión (ver carrito/backends.py): no consulta
+    la base en cada página.
+    """
+    return {'mini_carrito': obtener_backend(request).resumen()}
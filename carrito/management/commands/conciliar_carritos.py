@@ -0,0 +1,19 @@
+# carrito/management/commands/conciliar_carritos.py
+from django.core.management.base import BaseCommand
+
+from carrito.services import conciliar_totales
+
+
+class Command(BaseCommand):
+    help = 'Verifica (y corrige) los totales desnormalizados de los carritos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-revisar', action='store_true', help='Informa los desfasados sin corregirlos')
+
+    def handle(self, *args, **options):
+        desfasados = conciliar_totales(corregir=not options['solo_revisar'])
+        if not desfasados:
+            self.stdout.write(self.style.SUCCESS('✓ Todos los carritos tienen los totales al día'))
+            return
+        accion = 'encontrados' if options['solo_revisar'] else 'corregidos'
+        self.stdout.write(self.style.WARNING(f'{len(desfasados)} carritos desfasados {accion}'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:10
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def unificar_repetidos(apps, schema_editor):
+    # Antes de la restricción, un doble clic podía dejar el mismo producto
+    # dos veces en el carrito: se juntan en la fila más vieja
+    ItemCarrito = apps.get_model('carrito', 'ItemCarrito')
+    repetidos = (
+        ItemCarrito.objects.values('carrito_id', 'producto_id')
+        .annotate(filas=Count('id'), primera=Min('id'), total=Sum('cantidad'))
+        .filter(filas__gt=1)
+    )
+    for grupo in repetidos:
+        items = ItemCarrito.objects.filter(carrito_id=grupo['carrito_id'], producto_id=grupo['producto_id'])
+        items.exclude(id=grupo['primera']).delete()
+        items.filter(id=grupo['primera']).update(cantidad=grupo['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(unificar_repetidos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='itemcarrito',
+            constraint=models.UniqueConstraint(fields=('carrito', 'producto'), name='itemcarrito_carrito_producto_uniq'),
+        ),
+    ]
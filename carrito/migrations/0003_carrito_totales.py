@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:02
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def calcular_totales(apps, schema_editor):
+    Carrito = apps.get_model('carrito', 'Carrito')
+    for carrito in Carrito.objects.prefetch_related('items__producto'):
+        items = list(carrito.items.all())
+        carrito.cantidad_items = sum(item.cantidad for item in items)
+        carrito.monto_total = sum((item.producto.precio * item.cantidad for item in items), Decimal('0'))
+        carrito.save(update_fields=['cantidad_items', 'monto_total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0002_itemcarrito_unico'),
+        ('tienda', '0014_variantes_imagenes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carrito',
+            name='cantidad_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='carrito',
+            name='monto_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
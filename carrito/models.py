@@ -8,11 +8,17 @@ class Carrito(models.Model):
     creado = models.DateTimeField(auto_now_add=True)
     actualizado = models.DateTimeField(auto_now=True)
 
+    # Denormalizados: se recalculan en cada cambio de items
+    # (carrito/services.py::actualizar_totales) y el comando
+    # conciliar_carritos corrige los que hayan quedado desfasados
+    cantidad_items = models.PositiveIntegerField(default=0)
+    monto_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
     def __str__(self):
         return f"Carrito {self.session_key}"
 
     def total(self):
-        return sum(item.subtotal() for item in self.items.all())
+        return self.monto_total
 
 
 class ItemCarrito(models.Model):
@@ -27,6 +33,13 @@ class ItemCarrito(models.Model):
     )
     cantidad = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # Un producto aparece una sola vez por carrito: es la clave del
+            # upsert de carrito/services.py
+            models.UniqueConstraint(fields=['carrito', 'producto'], name='itemcarrito_carrito_producto_uniq'),
+        ]
+
     def subtotal(self):
         return self.producto.precio * self.cantidad
 
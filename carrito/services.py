@@ -0,0 +1,163 @@
+# carrito/services.py
+"""
+Cambios sobre el carrito hechos en una o dos sentencias SQL.
+
+Antes cada clic hacía get_or_create del carrito, get_or_create del item,
+sumaba en Python y guardaba: 3-5 consultas y, con un doble clic, dos
+requests leían la misma cantidad y se perdía una de las sumas.
+
+Acá la cuenta la hace la base (F('cantidad') + 1 o un upsert), con el
+tope de stock dentro de la misma sentencia, así que dos requests a la
+vez nunca se pisan:
+
+    1. obtener_carrito_id: upsert del carrito de la sesión (1 sentencia).
+    2. La modificación del item (1 sentencia; restar puede hacer 2).
+
+actualizar_totales recalcula los campos denormalizados del carrito
+(cantidad_items, monto_total) en un UPDATE; los backends lo llaman en la
+misma transacción que la modificación.
+"""
+from django.db import connection
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.utils.crypto import get_random_string
+
+from tienda.models import Producto
+from .models import Carrito, ItemCarrito
+
+
+CLAVE_SESION = 'carrito_clave'
+
+
+def clave_carrito(request, crear=True):
+    """
+    Identificador del carrito guardado en la sesión (va en
+    Carrito.session_key). No se usa la session_key de Django porque con
+    sesiones en cookie firmada cambia cada vez que cambia la sesión.
+    """
+    clave = request.session.get(CLAVE_SESION)
+    if clave is None and crear:
+        clave = get_random_string(32)
+        request.session[CLAVE_SESION] = clave
+    return clave
+
+
+def obtener_carrito_id(request):
+    """
+    Id del carrito de la sesión, creándolo si no existe, en un solo
+    INSERT ... ON CONFLICT (también actualiza `actualizado`).
+    Se guarda en el request para no repetirlo.
+    """
+    if hasattr(request, '_carrito_id'):
+        return request._carrito_id
+
+    carrito, = Carrito.objects.bulk_create(
+        [Carrito(session_key=clave_carrito(request))],
+        update_conflicts=True,
+        unique_fields=['session_key'],
+        update_fields=['actualizado'],
+    )
+    request._carrito_id = carrito.pk
+    return carrito.pk
+
+
+def _sql_agregar():
+    item = connection.ops.quote_name(ItemCarrito._meta.db_table)
+    producto = connection.ops.quote_name(Producto._meta.db_table)
+    # Inserta el item (con la cantidad recortada al stock) o, si ya
+    # estaba, le suma la cantidad sin pasarse del stock. Un producto sin
+    # stock no inserta nada. El WHERE del SELECT es obligatorio en SQLite
+    # para que el ON CONFLICT no se confunda con un JOIN.
+    return f"""
+        INSERT INTO {item} (carrito_id, producto_id, cantidad)
+        SELECT %s, p.id, CASE WHEN p.stock < %s THEN p.stock ELSE %s END
+        FROM {producto} p
+        WHERE p.id = %s AND p.stock > 0
+        ON CONFLICT (carrito_id, producto_id) DO UPDATE SET cantidad = (
+            SELECT CASE WHEN {item}.cantidad + %s > p.stock THEN p.stock
+                        ELSE {item}.cantidad + %s END
+            FROM {producto} p WHERE p.id = excluded.producto_id
+        )
+        RETURNING cantidad
+    """
+
+
+def agregar(carrito_id, producto_id, cantidad=1):
+    """
+    Suma `cantidad` unidades del producto (lo agrega si no estaba), sin
+    superar el stock. Devuelve la cantidad final o None si no hay stock
+    o el producto no existe.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_sql_agregar(), [carrito_id, cantidad, cantidad, producto_id, cantidad, cantidad])
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+def sumar(carrito_id, producto_id):
+    """+1 a un item que ya está en el carrito, si el stock alcanza"""
+    stock = Producto.objects.filter(pk=OuterRef('producto_id')).values('stock')
+    return ItemCarrito.objects.filter(
+        carrito_id=carrito_id,
+        producto_id=producto_id,
+        cantidad__lt=Subquery(stock),
+    ).update(cantidad=F('cantidad') + 1) > 0
+
+
+def restar(carrito_id, producto_id):
+    """-1 a un item; si quedaba una sola unidad, se quita del carrito"""
+    items = ItemCarrito.objects.filter(carrito_id=carrito_id, producto_id=producto_id)
+    if items.filter(cantidad__gt=1).update(cantidad=F('cantidad') - 1):
+        return True
+    # Si otro request bajó la cantidad entre las dos sentencias, el
+    # cantidad__lte=1 hace que este borre lo que quedó
+    return items.filter(cantidad__lte=1).delete()[0] > 0
+
+
+def eliminar(carrito_id, producto_id):
+    return ItemCarrito.objects.filter(carrito_id=carrito_id, producto_id=producto_id).delete()[0] > 0
+
+
+def vaciar(carrito_id):
+    return ItemCarrito.objects.filter(carrito_id=carrito_id).delete()[0] > 0
+
+
+def totales_reales():
+    """
+    Expresiones que calculan en SQL la cantidad de unidades y el monto
+    de un carrito (para update() o annotate() sobre Carrito)
+    """
+    items = ItemCarrito.objects.filter(carrito_id=OuterRef('pk')).order_by().values('carrito_id')
+    monto = DecimalField(max_digits=12, decimal_places=2)
+    return {
+        'cantidad_items': Coalesce(Subquery(items.annotate(suma=Sum('cantidad')).values('suma')), 0),
+        'monto_total': Coalesce(
+            # Redondeado: en SQLite el producto da un float (ej. 0.30000000000000004)
+            Subquery(items.annotate(suma=Round(Sum(F('cantidad') * F('producto__precio'), output_field=monto), 2)).values('suma')),
+            Value(0),
+            output_field=monto,
+        ),
+    }
+
+
+def actualizar_totales(carrito_id):
+    """Recalcula los totales del carrito; devuelve (cantidad_items, monto_total)"""
+    Carrito.objects.filter(pk=carrito_id).update(**totales_reales())
+    return Carrito.objects.filter(pk=carrito_id).values_list('cantidad_items', 'monto_total').get()
+
+
+def conciliar_totales(corregir=True):
+    """
+    Control periódico: compara los totales guardados con los calculados
+    desde los items y, si `corregir`, arregla los que no coinciden.
+    Devuelve la lista de ids desfasados.
+    """
+    reales = totales_reales()
+    desfasados = list(
+        Carrito.objects.annotate(cantidad_real=reales['cantidad_items'], monto_real=reales['monto_total'])
+        .exclude(cantidad_items=F('cantidad_real'), monto_total=F('monto_real'))
+        .values_list('pk', flat=True)
+    )
+    if corregir and desfasados:
+        Carrito.objects.filter(pk__in=desfasados).update(**totales_reales())
+    return desfasados
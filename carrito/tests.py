@@ -1,3 +1,290 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from tienda.models import Categoria, Producto
+from . import services
+from .backends import CarritoSesion
+from .models import Carrito, ItemCarrito
+
+
+def crear_producto(stock):
+    categoria, _ = Categoria.objects.get_or_create(nombre='Remeras')
+    return Producto.objects.create(categoria=categoria, nombre='Remera lisa', precio=Decimal('1000'), stock=stock)
+
+
+def tablas_escritas(funcion):
+    """Tablas en las que escribe `funcion` (INSERT/UPDATE/DELETE)"""
+    with CaptureQueriesContext(connection) as consultas:
+        funcion()
+    return {
+        consulta['sql'].split('"')[1] for consulta in consultas
+        if consulta['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+    }
+
+
+class ServiciosCarritoTests(TestCase):
+    def setUp(self):
+        self.carrito = Carrito.objects.create(session_key='sesion-prueba')
+        self.producto = crear_producto(stock=3)
+
+    def cantidad(self):
+        item = ItemCarrito.objects.filter(carrito=self.carrito, producto=self.producto).first()
+        return item.cantidad if item else 0
+
+    def test_agregar_es_una_sola_sentencia(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(services.agregar(self.carrito.pk, self.producto.pk), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(services.agregar(self.carrito.pk, self.producto.pk), 2)
+
+    def test_agregar_no_pasa_el_stock(self):
+        self.assertEqual(services.agregar(self.carrito.pk, self.producto.pk, cantidad=5), 3)
+        self.assertEqual(services.agregar(self.carrito.pk, self.producto.pk), 3)
+        self.assertEqual(self.cantidad(), 3)
+
+    def test_agregar_sin_stock_no_hace_nada(self):
+        self.producto.stock = 0
+        self.producto.save()
+        self.assertIsNone(services.agregar(self.carrito.pk, self.producto.pk))
+        self.assertIsNone(services.agregar(self.carrito.pk, 999999))
+        self.assertFalse(ItemCarrito.objects.exists())
+
+    def test_sumar_respeta_el_stock(self):
+        services.agregar(self.carrito.pk, self.producto.pk, cantidad=2)
+        with self.assertNumQueries(1):
+            self.assertTrue(services.sumar(self.carrito.pk, self.producto.pk))
+        self.assertFalse(services.sumar(self.carrito.pk, self.producto.pk))
+        self.assertEqual(self.cantidad(), 3)
+
+    def test_restar_borra_la_ultima_unidad(self):
+        services.agregar(self.carrito.pk, self.producto.pk, cantidad=2)
+        with self.assertNumQueries(1):
+            self.assertTrue(services.restar(self.carrito.pk, self.producto.pk))
+        self.assertEqual(self.cantidad(), 1)
+        self.assertTrue(services.restar(self.carrito.pk, self.producto.pk))
+        self.assertFalse(ItemCarrito.objects.exists())
+
+    def test_totales_y_conciliacion(self):
+        services.agregar(self.carrito.pk, self.producto.pk, cantidad=2)
+        self.assertEqual(services.actualizar_totales(self.carrito.pk), (2, Decimal('2000')))
+
+        Carrito.objects.filter(pk=self.carrito.pk).update(cantidad_items=7)
+        self.assertEqual(services.conciliar_totales(corregir=False), [self.carrito.pk])
+        self.assertEqual(services.conciliar_totales(), [self.carrito.pk])
+        self.assertEqual(services.conciliar_totales(), [])
+        self.carrito.refresh_from_db()
+        self.assertEqual((self.carrito.cantidad_items, self.carrito.total()), (2, Decimal('2000')))
+
+    @override_settings(CARRITO_BACKEND='carrito.backends.CarritoBaseDatos')
+    def test_vistas(self):
+        self.client.get(f'/carrito/agregar/{self.producto.pk}/')
+        self.client.get(f'/carrito/agregar/{self.producto.pk}/')
+        self.client.get(f'/carrito/restar/{self.producto.pk}/')
+        item = ItemCarrito.objects.get()
+        self.assertEqual(item.cantidad, 1)
+        self.assertEqual(item.carrito.session_key, self.client.session[services.CLAVE_SESION])
+        self.assertEqual(item.carrito.cantidad_items, 1)
+        self.assertEqual(item.carrito.monto_total, Decimal('1000'))
+        self.assertEqual(self.client.get('/carrito/agregar/999999/').status_code, 404)
+
+
+@override_settings(CARRITO_BACKEND='carrito.backends.CarritoSesion')
+class CarritoSesionTests(TestCase):
+    def setUp(self):
+        self.producto = crear_producto(stock=3)
+
+    def test_navegar_y_agregar_solo_escribe_la_sesion(self):
+        # Ni Carrito ni ItemCarrito: solo la fila de la sesión
+        self.assertEqual(tablas_escritas(lambda: self.client.get(f'/carrito/agregar/{self.producto.pk}/')),
+                         {'django_session'})
+        self.assertEqual(tablas_escritas(lambda: self.client.get(f'/carrito/agregar/{self.producto.pk}/')),
+                         {'django_session'})
+        self.client.get(f'/carrito/sumar/{self.producto.pk}/')
+        self.client.get(f'/carrito/sumar/{self.producto.pk}/')  # ya está en el tope de stock
+        self.client.get(f'/carrito/restar/{self.producto.pk}/')
+
+        self.assertFalse(Carrito.objects.exists())
+        respuesta = self.client.get('/carrito/ver/')
+        self.assertEqual([(i.producto, i.cantidad) for i in respuesta.context['items']], [(self.producto, 2)])
+        self.assertEqual(respuesta.context['total'], Decimal('2000'))
+
+    def test_mini_carrito_sin_consultas(self):
+        self.client.get(f'/carrito/agregar/{self.producto.pk}/')
+        self.client.get(f'/carrito/agregar/{self.producto.pk}/')
+        # Solo la lectura de la sesión
+        with self.assertNumQueries(1):
+            respuesta = self.client.get('/ubicacion/')
+        self.assertEqual(respuesta.context['mini_carrito'], {'cantidad': 2, 'total': Decimal('2000')})
+        self.assertContains(respuesta, '<span class="mini-carrito-cantidad">2</span>', html=True)
+
+    def test_el_resumen_se_corrige_al_ver_el_carrito(self):
+        self.client.get(f'/carrito/agregar/{self.producto.pk}/')
+        Producto.objects.filter(pk=self.producto.pk).update(precio=Decimal('1500'))
+        self.assertEqual(self.client.get('/ubicacion/').context['mini_carrito']['total'], Decimal('1000'))
+        self.assertEqual(self.client.get('/carrito/ver/').context['total'], Decimal('1500'))
+        self.assertEqual(self.client.get('/ubicacion/').context['mini_carrito']['total'], Decimal('1500'))
+
+    def test_tope_de_lineas(self):
+        otros = Producto.objects.bulk_create([
+            Producto(categoria=self.producto.categoria, nombre=f'Buzo {n}', precio=Decimal('10'), stock=5)
+            for n in range(3)
+        ])
+        with mock.patch.object(CarritoSesion, 'MAXIMO_LINEAS', 2):
+            for producto in [self.producto] + otros:
+                self.client.get(f'/carrito/agregar/{producto.pk}/')
+            # El tercero no entra, pero sumar a uno que ya está sí
+            self.client.get(f'/carrito/agregar/{self.producto.pk}/')
+            items = self.client.get('/carrito/ver/').context['items']
+            self.assertEqual([(i.producto, i.cantidad) for i in items], [(self.producto, 2), (otros[0], 1)])
+
+            respuesta = self.client.post('/carrito/api/lineas/', {'operaciones': [
+                {'accion': 'agregar', 'producto_id': otros[1].pk},
+            ]}, content_type='application/json')
+            self.assertEqual(respuesta.json()['errores'], ['Máximo 2 productos distintos en el carrito'])
+            # Cambiar uno por otro sí
+            respuesta = self.client.post('/carrito/api/lineas/', {'operaciones': [
+                {'accion': 'eliminar', 'producto_id': otros[0].pk},
+                {'accion': 'agregar', 'producto_id': otros[1].pk},
+            ]}, content_type='application/json')
+            self.assertEqual(respuesta.status_code, 200)
+
+    def test_el_checkout_guarda_el_carrito(self):
+        self.client.get(f'/carrito/agregar/{self.producto.pk}/')
+        self.assertEqual(self.client.get('/pedidos/checkout/').status_code, 200)
+        self.assertFalse(Carrito.objects.exists())
+
+        self.client.post('/pedidos/checkout/', {'email': 'cliente@example.com', 'telefono': '123'})
+        carrito = Carrito.objects.get()
+        self.assertEqual(carrito.session_key, self.client.session[services.CLAVE_SESION])
+        self.assertEqual(list(carrito.items.values_list('producto_id', 'cantidad')), [(self.producto.pk, 1)])
+        self.assertEqual((carrito.cantidad_items, carrito.monto_total), (1, Decimal('1000')))
+        self.assertEqual(carrito.pedido.items.get().cantidad, 1)
+
+        # Un segundo checkout reemplaza las líneas del mismo carrito
+        self.client.get(f'/carrito/agregar/{self.producto.pk}/')
+        self.client.post('/pedidos/checkout/', {'email': 'cliente@example.com', 'telefono': '123'})
+        self.assertEqual(Carrito.objects.get().items.get().cantidad, 2)
+
+
+class ApiLineasTests(TestCase):
+    URL = '/carrito/api/lineas/'
+
+    def setUp(self):
+        self.remera = crear_producto(stock=3)
+        self.buzo = Producto.objects.create(
+            categoria=self.remera.categoria, nombre='Buzo', precio=Decimal('2500'), stock=1
+        )
+
+    def enviar(self, *operaciones):
+        return self.client.post(self.URL, {'operaciones': list(operaciones)}, content_type='application/json')
+
+    def probar_backend(self):
+        respuesta = self.enviar(
+            {'accion': 'agregar', 'producto_id': self.remera.pk, 'cantidad': 2},
+            {'accion': 'fijar', 'producto_id': self.buzo.pk, 'cantidad': 1},
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(
+            [(i['producto_id'], i['cantidad']) for i in datos['items']],
+            [(self.remera.pk, 2), (self.buzo.pk, 1)],
+        )
+        self.assertEqual((datos['cantidad_items'], datos['total']), (3, 4500.0))
+
+        # Si una operación no alcanza el stock no se aplica ninguna
+        respuesta = self.enviar(
+            {'accion': 'eliminar', 'producto_id': self.remera.pk},
+            {'accion': 'agregar', 'producto_id': self.buzo.pk},
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('Stock insuficiente para Buzo (stock: 1)', respuesta.json()['errores'])
+        self.assertEqual(respuesta.json()['carrito']['cantidad_items'], 3)
+
+        respuesta = self.enviar(
+            {'accion': 'eliminar', 'producto_id': self.remera.pk},
+            {'accion': 'fijar', 'producto_id': self.buzo.pk, 'cantidad': 0},
+        )
+        self.assertEqual(respuesta.json(), {'items': [], 'cantidad_items': 0, 'total': 0.0})
+        self.assertEqual(self.client.get(self.URL).json()['items'], [])
+
+    def test_carrito_en_sesion(self):
+        with self.settings(CARRITO_BACKEND='carrito.backends.CarritoSesion'):
+            self.probar_backend()
+        self.assertFalse(Carrito.objects.exists())
+
+    def test_carrito_en_base(self):
+        with self.settings(CARRITO_BACKEND='carrito.backends.CarritoBaseDatos'):
+            self.probar_backend()
+        self.assertEqual(Carrito.objects.get().cantidad_items, 0)
+
+    def test_una_consulta_de_productos_para_validar(self):
+        operaciones = [{'accion': 'fijar', 'producto_id': self.remera.pk, 'cantidad': 1},
+                       {'accion': 'fijar', 'producto_id': self.buzo.pk, 'cantidad': 1}]
+        with self.settings(CARRITO_BACKEND='carrito.backends.CarritoSesion'), \
+                CaptureQueriesContext(connection) as consultas:
+            self.enviar(*operaciones)
+        self.assertEqual(len([c for c in consultas if 'tienda_producto' in c['sql']]), 1)
+
+    def test_operaciones_invalidas(self):
+        self.assertEqual(self.client.post(self.URL, 'no es json', content_type='application/json').status_code, 400)
+        respuesta = self.enviar(
+            {'accion': 'vaciar', 'producto_id': self.remera.pk},
+            {'accion': 'fijar', 'producto_id': 'x'},
+            {'accion': 'fijar', 'producto_id': self.remera.pk, 'cantidad': -1},
+            {'accion': 'agregar', 'producto_id': 999999},
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(len(respuesta.json()['errores']), 3)
+        self.assertEqual(self.enviar({'accion': 'agregar', 'producto_id': 999999}).json()['errores'],
+                         ['No existe el producto 999999'])
+
+
+class ConcurrenciaCarritoTests(TransactionTestCase):
+    """Varios hilos (cada uno con su conexión) sumando sobre el mismo item"""
+
+    HILOS = 8
+    CLICS_POR_HILO = 25
+
+    def correr_en_hilos(self, funcion):
+        errores = []
+        barrera = threading.Barrier(self.HILOS)
+
+        def trabajo():
+            try:
+                barrera.wait()
+                for _ in range(self.CLICS_POR_HILO):
+                    funcion()
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=trabajo) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+
+    def test_no_se_pierden_sumas(self):
+        carrito = Carrito.objects.create(session_key='concurrente')
+        producto = crear_producto(stock=1000)
+
+        self.correr_en_hilos(lambda: services.agregar(carrito.pk, producto.pk))
+
+        item = ItemCarrito.objects.get(carrito=carrito, producto=producto)
+        self.assertEqual(item.cantidad, self.HILOS * self.CLICS_POR_HILO)
+
+    def test_el_tope_de_stock_se_respeta_en_paralelo(self):
+        carrito = Carrito.objects.create(session_key='concurrente')
+        producto = crear_producto(stock=50)
+        services.agregar(carrito.pk, producto.pk)
+
+        self.correr_en_hilos(lambda: services.sumar(carrito.pk, producto.pk))
+
+        self.assertEqual(ItemCarrito.objects.get(carrito=carrito, producto=producto).cantidad, 50)
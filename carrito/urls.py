@@ -8,4 +8,5 @@ urlpatterns = [
     path('eliminar/<int:producto_id>/', views.eliminar_producto, name='carrito_eliminar'),
      path('sumar/<int:producto_id>/', views.sumar_producto, name='carrito_sumar'),
     path('restar/<int:producto_id>/', views.restar_producto, name='carrito_restar'),
+    path('api/lineas/', views.api_lineas, name='carrito_api_lineas'),
 ]
@@ -1,42 +1,31 @@
-from django.http import JsonResponse
+import json
+from django.http import JsonResponse, Http404
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_http_methods
 from tienda.models import Producto
 from .models import Carrito, ItemCarrito
+from .backends import obtener_backend, OperacionesInvalidas
 from django.shortcuts import render 
 from django.shortcuts import redirect
 
 def obtener_carrito(request):
     """
-    Devuelve el carrito asociado a la sesión actual.
-    Si no existe, lo crea.
+    Devuelve el carrito (Carrito de la base) asociado a la sesión actual.
+    Si no existe, lo crea: con el carrito en sesión esto escribe las
+    líneas en la base, así que solo se usa al hacer el pedido.
     """
-    if not request.session.session_key:
-        request.session.create()
-
-    session_key = request.session.session_key
-
-    carrito, _ = Carrito.objects.get_or_create(
-        session_key=session_key
-    )
-
-    return carrito
+    return obtener_backend(request).persistir()
 
 
 
 
 
 def agregar_producto(request, producto_id):
-    carrito = obtener_carrito(request)
-    producto = get_object_or_404(Producto, id=producto_id)
+    cantidad = obtener_backend(request).agregar(producto_id)
 
-    item, creado = ItemCarrito.objects.get_or_create(
-        carrito=carrito,
-        producto=producto
-    )
-
-    if not creado:
-        item.cantidad += 1
-        item.save()
+    # None = no se agregó nada: sin stock, carrito lleno o producto inexistente
+    if cantidad is None and not Producto.objects.filter(id=producto_id).exists():
+        raise Http404("Producto no encontrado")
 
     # 👉 ACÁ ESTÁ LA CLAVE
     return redirect('carrito_ver')
@@ -44,21 +33,12 @@ def agregar_producto(request, producto_id):
 
 
 def ver_carrito(request):
-    items = []
-    total = 0
-
-    if request.session.session_key:
-        carrito = Carrito.objects.filter(
-            session_key=request.session.session_key
-        ).first()
-
-        if carrito:
-            items = carrito.items.select_related("producto")
-            total = carrito.total()
+    carrito = obtener_backend(request)
+    items = carrito.items.all()
 
     return render(request, "carrito/carrito.html", {
         "items": items,
-        "total": total
+        "total": carrito.total() if items else 0
     })
 
 
@@ -66,52 +46,41 @@ def eliminar_producto(request, producto_id):
     """
     Elimina un producto del carrito.
     """
-    carrito = obtener_carrito(request)
-
-    item = ItemCarrito.objects.filter(
-        carrito=carrito,
-        producto_id=producto_id
-    ).first()
-
-    if item:
-        item.delete()
-    return redirect('carrito_ver')
-
+    obtener_backend(request).eliminar(producto_id)
     return redirect('carrito_ver')
 
 
 
 def sumar_producto(request, producto_id):
-    carrito = obtener_carrito(request)
-
-    item = get_object_or_404(
-        ItemCarrito,
-        carrito=carrito,
-        producto_id=producto_id
-    )
-
     # no pasar stock
-    if item.producto.stock > item.cantidad:
-        item.cantidad += 1
-        item.save()
-
+    obtener_backend(request).sumar(producto_id)
     return redirect("carrito_ver")
 
 
 def restar_producto(request, producto_id):
-    carrito = obtener_carrito(request)
+    obtener_backend(request).restar(producto_id)
+    return redirect("carrito_ver")
 
-    item = get_object_or_404(
-        ItemCarrito,
-        carrito=carrito,
-        producto_id=producto_id
-    )
 
-    item.cantidad -= 1
+@require_http_methods(["GET", "POST"])
+def api_lineas(request):
+    """
+    API del carrito para el JavaScript de la tienda.
+    GET: el carrito actual. POST: {"operaciones": [...]} (ver
+    CarritoBackend.aplicar), todas en una transacción; devuelve el
+    carrito resultante para que la página se actualice sin recargar.
+    """
+    carrito = obtener_backend(request)
 
-    if item.cantidad <= 0:
-        item.delete()
-    else:
-        item.save()
+    if request.method == "GET":
+        return JsonResponse(carrito.instantanea())
 
-    return redirect("carrito_ver")
+    try:
+        operaciones = json.loads(request.body.decode("utf-8"))["operaciones"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"errores": ["Se esperaba un JSON con la clave 'operaciones'"]}, status=400)
+
+    try:
+        return JsonResponse(carrito.aplicar(operaciones))
+    except OperacionesInvalidas as e:
+        return JsonResponse({"errores": e.errores, "carrito": carrito.instantanea()}, status=400)
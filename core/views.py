@@ -21,21 +21,26 @@ from tienda.models import Producto
 #     # Esto se los manda al HTML con el nombre 'productos'
 #     return render(request, 'core/index.html', {'productos': productos_db})
 # core/views.py - FUNCIÓN INDEX MODIFICADA
-from tienda.models import Producto, Categoria  # AGREGAR Categoria aquí
+from tienda.models import Producto, Categoria, TarjetaProducto  # AGREGAR Categoria aquí
+from tienda import cache_grillas
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+def _destacados_html():
+    # Traemos los productos activos desde las tarjetas (ya tienen imagen y cuota)
+    productos_db = TarjetaProducto.objects.filter(activo=True)[:8]
+    return mark_safe(render_to_string('core/productos_destacados.html', {'productos': productos_db}))
+
 
 def index(request):
-    # Traemos los productos activos y sus imágenes
-    productos_db = Producto.objects.filter(activo=True).prefetch_related('imagenes')[:8] 
-    
-    # Les agregamos el cálculo de la cuota a cada uno antes de mandarlos al HTML
-    for p in productos_db:
-        p.cuota = p.precio / 3
+    # La grilla de destacados sale de la cache de fragmentos (se invalida con las señales)
+    destacados_html = cache_grillas.obtener_fragmento(cache_grillas.TODAS, ('destacados',), _destacados_html)
     
     # TRAEMOS LAS CATEGORÍAS ACTIVAS CON IMAGEN DE FONDO
     categorias_db = Categoria.objects.filter(activo=True).exclude(imagen_fondo='').order_by('nombre')[:4]
     
     return render(request, 'core/index.html', {
-        'productos': productos_db,
+        'destacados_html': destacados_html,
         'categorias': categorias_db  # NUEVO: pasamos categorías al template
     })
 #yo
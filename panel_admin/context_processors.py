@@ -1,32 +1,19 @@
 # panel_admin/context_processors.py
+from .permisos import permisos_de
+
+
 def panel_context(request):
     """Context processor para el panel admin"""
-    context = {}
-    
-    if request.user.is_authenticated:
-        # Obtener los grupos del usuario
-        user_groups = list(request.user.groups.values_list('name', flat=True))
-        
-        context.update({
-            'user_groups': user_groups,
-            'es_superusuario': request.user.is_superuser,
-            'es_staff': request.user.is_staff,
-            'puede_ver_estadisticas': request.user.is_superuser or 'Administradores' in user_groups,
-            'puede_ver_usuarios': request.user.is_superuser or 'Administradores' in user_groups,
-            'puede_ver_productos': request.user.is_superuser or 'Administradores' in user_groups or 'Empleados' in user_groups,
-            'puede_ver_categorias': request.user.is_superuser or 'Administradores' in user_groups or 'Empleados' in user_groups,
-            'puede_ver_pedidos': request.user.is_superuser or 'Administradores' in user_groups or 'Empleados' in user_groups or 'Vendedores' in user_groups,
-        })
-    else:
-        context.update({
-            'user_groups': [],
-            'es_superusuario': False,
-            'es_staff': False,
-            'puede_ver_estadisticas': False,
-            'puede_ver_usuarios': False,
-            'puede_ver_productos': False,
-            'puede_ver_categorias': False,
-            'puede_ver_pedidos': False,
-        })
-    
-    return context
\ No newline at end of file
+    # Grupos desde la cache (ver panel_admin/permisos.py); el anónimo no consulta nada
+    permisos = permisos_de(request.user)
+
+    return {
+        'user_groups': permisos.grupos,
+        'es_superusuario': permisos.superusuario,
+        'es_staff': permisos.staff,
+        'puede_ver_estadisticas': permisos.puede('estadisticas'),
+        'puede_ver_usuarios': permisos.puede('usuarios'),
+        'puede_ver_productos': permisos.puede('productos'),
+        'puede_ver_categorias': permisos.puede('categorias'),
+        'puede_ver_pedidos': permisos.puede('pedidos'),
+    }
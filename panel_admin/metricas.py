@@ -0,0 +1,129 @@
+# panel_admin/metricas.py
+"""
+Datos del dashboard del panel.
+
+Antes cada carga hacía unas diez consultas (cuatro COUNT de pedidos, el
+de productos, el de usuarios, la suma del mes y tres listados) más dos
+COUNT y un SUM por pedido reciente desde el template. Ahora son tres:
+
+1. Los contadores en una sola fila: los de pedidos con agregación
+   condicional (COUNT ... FILTER) sobre la tabla de pedidos, y los de
+   productos, usuarios y ventas del mes como subconsultas escalares
+   (productos también en una pasada, como un objeto JSON).
+2. Los pedidos recientes, con el total guardado (total_pago) y las
+   unidades (Pedido.objects.con_totales()).
+3. Las alertas de stock: las primeras LIMITE_LISTAS sin stock y con stock
+   bajo, en una consulta con ROW_NUMBER() por grupo.
+
+El resultado son dicts y listas (se puede guardar en la cache y devolver
+como JSON) y se cachea DURACION segundos. Las señales de signals.py lo
+descartan cuando se guarda o borra un Pedido o un Producto.
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Count, DecimalField, ExpressionWrapper, F, Q, Subquery, Sum, Value, Window,
+)
+from django.db.models.functions import Coalesce, JSONObject, RowNumber
+from django.utils import timezone
+
+from pedidos_pagos.models import Pedido, VentaDiaria
+from tienda.models import Producto
+
+CLAVE = 'panel:dashboard'
+DURACION = 60  # segundos
+LIMITE_LISTAS = 5
+STOCK_BAJO = 10
+
+MONTO = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _una_fila(queryset):
+    # Agrupar por una constante: Django no emite GROUP BY y los agregados
+    # devuelven siempre una fila (aunque la tabla esté vacía)
+    return queryset.order_by().annotate(_fila=Value(1)).values('_fila')
+
+
+def _contadores():
+    inicio_mes = timezone.localdate().replace(day=1)
+
+    productos = _una_fila(Producto.objects).annotate(datos=JSONObject(
+        total=Count('pk'),
+        stock_bajo=Count('pk', filter=Q(stock__gt=0, stock__lt=STOCK_BAJO)),
+        sin_stock=Count('pk', filter=Q(stock=0)),
+    )).values('datos')
+    usuarios_inactivos = _una_fila(User.objects.filter(is_active=False)).annotate(
+        total=Count('pk'),
+    ).values('total')
+    ventas_mes = _una_fila(VentaDiaria.objects.filter(fecha__gte=inicio_mes)).annotate(
+        total=Coalesce(Sum('ingresos'), Value(0), output_field=MONTO),
+    ).values('total')
+
+    return _una_fila(Pedido.objects).annotate(
+        total_pedidos=Count('pk'),
+        pedidos_pendientes=Count('pk', filter=Q(estado='pendiente')),
+        pedidos_pagados=Count('pk', filter=Q(estado='pagado')),
+        productos=Subquery(productos),
+        usuarios_inactivos=Subquery(usuarios_inactivos),
+        ventas_mes=Subquery(ventas_mes, output_field=MONTO),
+    ).values(
+        'total_pedidos', 'pedidos_pendientes', 'pedidos_pagados',
+        'productos', 'usuarios_inactivos', 'ventas_mes',
+    ).get()
+
+
+def _alertas_stock():
+    filas = (
+        Producto.objects.filter(stock__lt=STOCK_BAJO)
+        .annotate(
+            agotado=ExpressionWrapper(Q(stock=0), output_field=BooleanField()),
+            orden=Window(RowNumber(), partition_by=[F('agotado')], order_by=[F('stock'), F('nombre')]),
+        )
+        .filter(orden__lte=LIMITE_LISTAS)
+        .order_by('stock', 'nombre')
+        .values('id', 'nombre', 'stock', 'agotado')
+    )
+    sin_stock, stock_bajo = [], []
+    for fila in filas:
+        agotado = fila.pop('agotado')
+        (sin_stock if agotado else stock_bajo).append(fila)
+    return sin_stock, stock_bajo
+
+
+def calcular():
+    """Arma los datos del dashboard (tres consultas)"""
+    contadores = _contadores()
+    productos = contadores.pop('productos')
+
+    pedidos_recientes = list(
+        Pedido.objects.con_totales().order_by('-fecha_creacion')
+        .values('id', 'fecha_creacion', 'estado', 'total_pago', 'unidades')[:LIMITE_LISTAS]
+    )
+    productos_sin_stock, productos_stock_bajo = _alertas_stock()
+
+    return {
+        **contadores,
+        'total_productos': productos['total'],
+        'total_stock_bajo': productos['stock_bajo'],
+        'total_sin_stock': productos['sin_stock'],
+        'alertas_stock': productos['stock_bajo'] + productos['sin_stock'],
+        'pedidos_recientes': pedidos_recientes,
+        'productos_stock_bajo': productos_stock_bajo,
+        'productos_sin_stock': productos_sin_stock,
+    }
+
+
+def datos_dashboard():
+    """Los datos del dashboard desde la cache (o calculados si no estaban)"""
+    datos = cache.get(CLAVE)
+    if datos is None:
+        datos = calcular()
+        cache.set(CLAVE, datos, DURACION)
+    return datos
+
+
+def invalidar():
+    # Después del commit: si se borrara antes, otro request podría volver
+    # a cachear los datos viejos mientras la transacción sigue abierta
+    transaction.on_commit(lambda: cache.delete(CLAVE))
@@ -0,0 +1,178 @@
+# panel_admin/paginacion.py
+"""
+Paginación de los listados del panel (pedidos, productos, usuarios).
+
+Con Paginator cada página hacía un COUNT(*) exacto del conjunto filtrado
+y leía con OFFSET: con millones de pedidos las dos cosas recorren la
+tabla. Acá:
+
+- Las páginas van por cursor (tienda/paginacion.py) sobre la fecha de
+  alta + id, de la más nueva a la más vieja. Con el índice de esas
+  columnas cualquier página cuesta lo mismo que la primera.
+- El total es exacto solo si el conjunto es chico: se cuenta con un
+  LIMIT de LIMITE_EXACTO + 1 filas. Si es más grande se muestra el último
+  total calculado (de la cache) y se recalcula en segundo plano cuando
+  tiene más de REFRESCAR segundos. Mientras no hay ninguno se muestra
+  "más de LIMITE_EXACTO". Si al recalcularlo ya no pasa de LIMITE_EXACTO
+  se descarta y se vuelve al total exacto.
+
+PANEL_CONTEOS_HILOS = 0 cuenta en el mismo hilo (útil en tests).
+"""
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from tienda.paginacion import CursorInvalido, PaginaCursor, paginar_por_cursor
+
+logger = logging.getLogger(__name__)
+
+# (campo, descendente): mismo formato que tienda/paginacion.py
+COLUMNAS_PEDIDOS = (('fecha_creacion', True), ('pk', True))
+COLUMNAS_PRODUCTOS = (('creado', True), ('pk', True))
+COLUMNAS_USUARIOS = (('date_joined', True), ('pk', True))
+
+LIMITE_EXACTO = 10000
+REFRESCAR = 5 * 60           # segundos hasta recalcular un total grande
+DURACION_TOTAL = 24 * 60 * 60
+
+_PREFIJO = 'panel:total'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PaginaPanel(PaginaCursor):
+    """PaginaCursor + total del listado y los links a las páginas vecinas"""
+
+    def __init__(self, pagina, total, total_estimado, parametros):
+        super().__init__(pagina.items, pagina.cursor_siguiente, pagina.cursor_anterior)
+        self.total = total
+        self.total_estimado = total_estimado
+        self._parametros = parametros
+
+    def _url(self, cursor):
+        parametros = self._parametros.copy()
+        parametros['cursor'] = cursor
+        return f'?{parametros.urlencode()}'
+
+    @property
+    def total_texto(self):
+        """El total para mostrar: '1234', '~1234' (de la cache) o 'más de 10000'"""
+        if self.total is None:
+            return f'más de {LIMITE_EXACTO}'
+        if self.total_estimado:
+            return f'~{self.total}'
+        return str(self.total)
+
+    @property
+    def url_siguiente(self):
+        return self._url(self.cursor_siguiente) if self.cursor_siguiente else None
+
+    @property
+    def url_anterior(self):
+        return self._url(self.cursor_anterior) if self.cursor_anterior else None
+
+
+# ==================== TOTALES ====================
+
+def _hilos():
+    return getattr(settings, 'PANEL_CONTEOS_HILOS', 1)
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_hilos(), thread_name_prefix='panel-conteos')
+        return _pool
+
+
+def _clave(queryset):
+    # El SQL identifica el listado con sus filtros
+    sql, parametros = queryset.order_by().query.sql_with_params()
+    digest = hashlib.md5(repr((sql, parametros)).encode('utf-8')).hexdigest()
+    return f'{_PREFIJO}:{digest}'
+
+
+def _contar(queryset, clave):
+    try:
+        total = queryset.order_by().count()
+        if total > LIMITE_EXACTO:
+            cache.set(clave, (total, time.time()), DURACION_TOTAL)
+        else:
+            # El listado se achicó: de nuevo se cuenta exacto en cada request
+            cache.delete(clave)
+    except Exception:
+        logger.exception('No se pudo calcular el total de %s', queryset.model.__name__)
+    finally:
+        cache.delete(f'{clave}:calculando')
+
+
+def _contar_en_segundo_plano(queryset, clave):
+    # Un solo cálculo a la vez por listado, aunque lleguen muchos requests
+    if not cache.add(f'{clave}:calculando', 1, REFRESCAR):
+        return
+    if not _hilos():
+        _contar(queryset, clave)
+        return
+
+    def tarea():
+        try:
+            _contar(queryset, clave)
+        finally:
+            # Corre en un hilo del pool: no dejamos la conexión abierta
+            connection.close()
+
+    _obtener_pool().submit(tarea)
+
+
+def total_listado(queryset):
+    """
+    (total, estimado). Exacto si hay hasta LIMITE_EXACTO filas; si hay más,
+    el último total calculado (o None si todavía no hay uno).
+    """
+    clave = _clave(queryset)
+    guardado = cache.get(clave)
+    if guardado is not None:
+        total, calculado = guardado
+        if time.time() - calculado > REFRESCAR:
+            _contar_en_segundo_plano(queryset, clave)
+        return total, True
+
+    total = queryset.order_by().values('pk')[:LIMITE_EXACTO + 1].count()
+    if total <= LIMITE_EXACTO:
+        return total, False
+
+    _contar_en_segundo_plano(queryset, clave)
+    guardado = cache.get(clave)
+    if guardado is not None:
+        # Se calculó en este mismo hilo (PANEL_CONTEOS_HILOS = 0)
+        return guardado[0], False
+    return None, True
+
+
+# ==================== PÁGINAS ====================
+
+def paginar(request, queryset, columnas, nombre, por_pagina):
+    """
+    Página del listado `nombre` según ?cursor= (los demás parámetros del
+    request se mantienen en los links). Un cursor inválido vuelve a la
+    primera página.
+    """
+    cursor = request.GET.get('cursor')
+    try:
+        pagina = paginar_por_cursor(queryset, orden=nombre, cursor=cursor, por_pagina=por_pagina, columnas=columnas)
+    except CursorInvalido:
+        pagina = paginar_por_cursor(queryset, orden=nombre, por_pagina=por_pagina, columnas=columnas)
+
+    total, estimado = total_listado(queryset)
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
+    parametros.pop('page', None)
+    return PaginaPanel(pagina, total, estimado, parametros)
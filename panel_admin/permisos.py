@@ -0,0 +1,130 @@
+# panel_admin/permisos.py
+"""
+Qué puede hacer cada usuario en el panel, calculado una vez.
+
+Antes el context processor consultaba los grupos del usuario en cada
+página del sitio (la tienda incluida) y cada decorador requiere_* y el
+dashboard los volvían a consultar en el mismo request.
+
+Ahora los grupos y permisos del usuario se guardan en la cache (una
+entrada por usuario) y en el mismo objeto user durante el request:
+
+- El usuario anónimo no consulta nada.
+- Cada entrada lleva la versión global; las señales de signals.py borran
+  la entrada del usuario cuando cambian sus grupos o sus permisos, y
+  cambian la versión (todas las entradas dejan de valer) cuando cambian
+  los permisos de un grupo o se renombra/borra un grupo.
+- Las entradas duran DURACION (minutos): aunque una invalidación se
+  pierda (ej. un cambio hecho directo en la base), a un usuario al que
+  le sacaron un grupo no le dura el acceso más que eso. La cache es la
+  compartida de settings.CACHES, así la invalidación llega a todos los
+  procesos.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+GRUPOS_PANEL = ('Administradores', 'Empleados', 'Vendedores')
+
+# Sección -> grupos que la pueden ver (el superusuario ve todas)
+SECCIONES = {
+    'dashboard': GRUPOS_PANEL,
+    'pedidos': GRUPOS_PANEL,
+    'productos': ('Administradores', 'Empleados'),
+    'categorias': ('Administradores', 'Empleados'),
+    'estadisticas': ('Administradores',),
+    'usuarios': ('Administradores',),
+}
+
+DURACION = 5 * 60
+DURACION_VERSION = 60 * 60
+
+_PREFIJO = 'panel:permisos'
+CLAVE_VERSION = f'{_PREFIJO}:version'
+_ATRIBUTO = '_permisos_panel'
+
+
+class PermisosPanel:
+    """Lo que el usuario puede hacer en el panel (sin consultas)"""
+
+    def __init__(self, user, grupos=(), permisos=()):
+        self.autenticado = user.is_authenticated
+        self.activo = user.is_active
+        self.superusuario = user.is_superuser
+        self.staff = user.is_staff
+        self.grupos = list(grupos)
+        self.permisos = frozenset(permisos)
+
+    @property
+    def acceso_panel(self):
+        return self.superusuario or self.staff or any(g in GRUPOS_PANEL for g in self.grupos)
+
+    def puede(self, seccion):
+        return self.superusuario or any(g in SECCIONES[seccion] for g in self.grupos)
+
+    def tiene_permiso(self, permiso):
+        """Como User.has_perm('app.codigo') con el backend de modelos"""
+        if not self.activo:
+            return False
+        return self.superusuario or permiso in self.permisos
+
+
+def _clave(user_id):
+    return f'{_PREFIJO}:{user_id}'
+
+
+def _nuevo_sello():
+    # Basado en el reloj, como en tienda/cache_grillas.py
+    return int(time.time() * 1000)
+
+
+def _calcular(user):
+    grupos = list(user.groups.values_list('name', flat=True))
+    # El superusuario tiene todos: no hace falta leerlos
+    permisos = [] if user.is_superuser else sorted(user.get_all_permissions())
+    return grupos, permisos
+
+
+def permisos_de(user):
+    """PermisosPanel del usuario: del request, de la cache o calculados"""
+    if not user.is_authenticated:
+        return PermisosPanel(user)
+
+    guardados = getattr(user, _ATRIBUTO, None)
+    if guardados is not None:
+        return guardados
+
+    clave = _clave(user.pk)
+    valores = cache.get_many([clave, CLAVE_VERSION])
+    version = valores.get(CLAVE_VERSION)
+    if version is None:
+        version = cache.get_or_set(CLAVE_VERSION, _nuevo_sello, DURACION_VERSION)
+
+    entrada = valores.get(clave)
+    if entrada is not None and entrada['version'] == version:
+        grupos, permisos = entrada['grupos'], entrada['permisos']
+    else:
+        grupos, permisos = _calcular(user)
+        cache.set(clave, {'version': version, 'grupos': grupos, 'permisos': permisos}, DURACION)
+
+    resultado = PermisosPanel(user, grupos, permisos)
+    setattr(user, _ATRIBUTO, resultado)
+    return resultado
+
+
+def _despues_del_commit(funcion):
+    # Ahora y otra vez al confirmar: si otro request recalcula mientras la
+    # transacción sigue abierta, guardaría los grupos viejos
+    funcion()
+    transaction.on_commit(funcion)
+
+
+def invalidar_usuarios(user_ids):
+    claves = [_clave(pk) for pk in user_ids if pk]
+    if claves:
+        _despues_del_commit(lambda: cache.delete_many(claves))
+
+
+def invalidar_todo():
+    _despues_del_commit(lambda: cache.set(CLAVE_VERSION, _nuevo_sello(), DURACION_VERSION))
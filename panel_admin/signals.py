@@ -0,0 +1,52 @@
+# panel_admin/signals.py
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from pedidos_pagos.models import Pedido
+from tienda.models import Producto
+from . import metricas, permisos
+
+
+# ==================== DATOS DEL DASHBOARD ====================
+
+@receiver(post_save, sender=Pedido)
+@receiver(post_delete, sender=Pedido)
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_dashboard(sender, raw=False, **kwargs):
+    if raw:
+        return
+    metricas.invalidar()
+
+
+# ==================== PERMISOS DEL PANEL ====================
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidar_permisos_usuario(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        permisos.invalidar_usuarios([instance.pk])
+    elif action == 'post_clear':
+        # grupo.user_set.clear(): no se sabe a quiénes afectó
+        permisos.invalidar_todo()
+    else:
+        # grupo.user_set.add(...): pk_set son usuarios
+        permisos.invalidar_usuarios(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidar_permisos_grupo(sender, action, **kwargs):
+    if action.startswith('post_'):
+        permisos.invalidar_todo()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidar_permisos_grupos(sender, created=False, raw=False, **kwargs):
+    # Un grupo nuevo todavía no tiene usuarios
+    if raw or created:
+        return
+    permisos.invalidar_todo()
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, Group, Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from pedidos_pagos.models import ItemPedido, Pedido, VentaDiaria
+from tienda.models import Categoria, Producto
+from . import metricas, paginacion, permisos
+
+class EstadisticasTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@tienda.com', 'clave'))
+        categoria = Categoria.objects.create(nombre='Remeras')
+        self.producto = Producto.objects.create(categoria=categoria, nombre='Remera', precio=Decimal('100'), stock=5)
+        hoy = timezone.localdate()
+        VentaDiaria.objects.bulk_create([
+            VentaDiaria(fecha=hoy - timedelta(days=dias), producto=self.producto, categoria=categoria,
+                        unidades=dias + 1, ingresos=Decimal(100 * (dias + 1)), pedidos=1)
+            for dias in (0, 1, 40)
+        ])
+
+    def test_lee_del_resumen_diario(self):
+        respuesta = self.client.get('/panel_admin/estadisticas/')
+        self.assertEqual(respuesta.status_code, 200)
+        # Los últimos 30 días por defecto
+        self.assertEqual([dia['total'] for dia in respuesta.context['ventas_por_dia']], [Decimal('200'), Decimal('100')])
+        self.assertEqual(respuesta.context['productos_mas_vendidos'][0]['total_vendido'], 44)
+        self.assertEqual(respuesta.context['categorias_populares'][0].total_vendidos, 44)
+
+    def test_rango_de_fechas(self):
+        desde = (timezone.localdate() - timedelta(days=60)).isoformat()
+        respuesta = self.client.get('/panel_admin/estadisticas/', {'fecha_desde': desde})
+        self.assertEqual(len(respuesta.context['ventas_por_dia']), 3)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@tienda.com', 'clave'))
+        User.objects.create_user('baja', is_active=False)
+        categoria = Categoria.objects.create(nombre='Remeras')
+        Producto.objects.bulk_create([
+            Producto(categoria=categoria, nombre=f'Producto {i}', precio=Decimal('100'), stock=stock)
+            for i, stock in enumerate([0, 0, 3, 8, 9, 20] + [1] * 6)
+        ])
+        for estado in ('pendiente', 'pendiente', 'pagado', 'enviado'):
+            Pedido.objects.create(email='cliente@tienda.com', estado=estado, total_pago=Decimal('150'))
+        VentaDiaria.objects.create(
+            fecha=timezone.localdate(), producto=Producto.objects.first(), categoria=categoria,
+            unidades=2, ingresos=Decimal('300'), pedidos=1,
+        )
+
+    def test_contadores_y_listas(self):
+        datos = metricas.calcular()
+        self.assertEqual(datos['total_pedidos'], 4)
+        self.assertEqual(datos['pedidos_pendientes'], 2)
+        self.assertEqual(datos['pedidos_pagados'], 1)
+        self.assertEqual(datos['total_productos'], 12)
+        self.assertEqual(datos['total_sin_stock'], 2)
+        self.assertEqual(datos['total_stock_bajo'], 9)
+        self.assertEqual(datos['alertas_stock'], 11)
+        self.assertEqual(datos['usuarios_inactivos'], 1)
+        self.assertEqual(datos['ventas_mes'], Decimal('300'))
+        self.assertEqual(len(datos['pedidos_recientes']), 4)
+        self.assertEqual(datos['pedidos_recientes'][0]['total_pago'], Decimal('150'))
+        self.assertEqual([p['stock'] for p in datos['productos_sin_stock']], [0, 0])
+        # Las primeras cinco con stock bajo, las más urgentes primero
+        self.assertEqual([p['stock'] for p in datos['productos_stock_bajo']], [1, 1, 1, 1, 1])
+
+    def test_tablas_vacias(self):
+        Pedido.objects.all().delete()
+        Producto.objects.all().delete()
+        datos = metricas.calcular()
+        self.assertEqual(datos['total_pedidos'], 0)
+        self.assertEqual(datos['total_productos'], 0)
+        self.assertEqual(datos['pedidos_recientes'], [])
+        self.assertEqual(datos['productos_sin_stock'], [])
+
+    def test_tres_consultas_sin_cache_y_ninguna_con_cache(self):
+        with self.assertNumQueries(3):
+            metricas.datos_dashboard()
+        with self.assertNumQueries(0):
+            metricas.datos_dashboard()
+
+    def test_pagina_caliente_con_la_cache_de_settings(self):
+        # Sin override de CACHES: con los datos y los permisos ya en la
+        # cache solo quedan la sesión y el usuario del request
+        for url in ('/panel_admin/', '/panel_admin/dashboard/datos/'):
+            with self.subTest(url=url):
+                self.client.get(url)
+                with self.assertNumQueries(2):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_pagina_y_json(self):
+        respuesta = self.client.get('/panel_admin/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['alertas_stock'], 11)
+
+        respuesta = self.client.get('/panel_admin/dashboard/datos/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['pedidos_pendientes'], 2)
+
+    def test_json_solo_para_staff(self):
+        self.client.force_login(User.objects.create_user('cliente'))
+        respuesta = self.client.get('/panel_admin/dashboard/datos/')
+        self.assertEqual(respuesta.status_code, 302)
+
+    def test_se_invalida_al_guardar_pedidos_y_productos(self):
+        metricas.datos_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            Pedido.objects.create(email='otro@tienda.com', total_pago=Decimal('10'))
+        self.assertEqual(metricas.datos_dashboard()['pedidos_pendientes'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.filter(stock=20).get().delete()
+        self.assertEqual(metricas.datos_dashboard()['total_productos'], 11)
+
+
+class PedidosListaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@tienda.com', 'clave'))
+        categoria = Categoria.objects.create(nombre='Remeras')
+        self.producto = Producto.objects.create(categoria=categoria, nombre='Remera', precio=Decimal('100'), stock=50)
+
+    def crear_pedidos(self, cantidad):
+        for _ in range(cantidad):
+            pedido = Pedido.objects.create(total_pago=Decimal('200'))
+            ItemPedido.objects.create(pedido=pedido, producto=self.producto, nombre_producto='Remera',
+                                      precio_unitario=Decimal('100'), cantidad=2)
+
+    def consultas_lista(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get('/panel_admin/pedidos/')
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas)
+
+    def test_consultas_no_dependen_de_la_cantidad_de_pedidos(self):
+        self.crear_pedidos(1)
+        # La primera calcula los permisos del usuario (después salen de la cache)
+        self.consultas_lista()
+        con_uno = self.consultas_lista()
+        self.crear_pedidos(10)
+        self.assertEqual(self.consultas_lista(), con_uno)
+
+    def test_detalle_usa_total_pago(self):
+        self.crear_pedidos(1)
+        pedido = Pedido.objects.get()
+        respuesta = self.client.get(f'/panel_admin/pedidos/{pedido.pk}/')
+        self.assertEqual(respuesta.context['total_pedido'], Decimal('200'))
+        self.assertEqual(respuesta.context['pedido'].unidades, 2)
+
+
+@override_settings(PANEL_CONTEOS_HILOS=0)
+class PaginacionPanelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@tienda.com', 'clave'))
+        self.pedidos = [Pedido.objects.create(total_pago=Decimal('10')) for _ in range(35)]
+
+    def recorrer(self, url):
+        vistos, paginas = [], 0
+        while url:
+            respuesta = self.client.get(url)
+            pagina = respuesta.context['page_obj']
+            vistos += [pedido.pk for pedido in pagina]
+            paginas += 1
+            url = pagina.url_siguiente and '/panel_admin/pedidos/' + pagina.url_siguiente
+        return vistos, paginas
+
+    def test_recorre_todos_los_pedidos_por_cursor(self):
+        vistos, paginas = self.recorrer('/panel_admin/pedidos/')
+        self.assertEqual(paginas, 3)
+        self.assertEqual(vistos, sorted((p.pk for p in self.pedidos), reverse=True))
+
+    def test_volver_a_la_pagina_anterior(self):
+        primera = self.client.get('/panel_admin/pedidos/').context['page_obj']
+        segunda = self.client.get('/panel_admin/pedidos/' + primera.url_siguiente).context['page_obj']
+        anterior = self.client.get('/panel_admin/pedidos/' + segunda.url_anterior).context['page_obj']
+        self.assertEqual(list(anterior), list(primera))
+        self.assertFalse(anterior.tiene_anterior)
+
+    def test_los_links_mantienen_los_filtros(self):
+        Pedido.objects.filter(pk__in=[p.pk for p in self.pedidos[:20]]).update(estado='pagado')
+        pagina = self.client.get('/panel_admin/pedidos/', {'estado': 'pagado'}).context['page_obj']
+        self.assertIn('estado=pagado', pagina.url_siguiente)
+        self.assertEqual((pagina.total, pagina.total_estimado), (20, False))
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        respuesta = self.client.get('/panel_admin/pedidos/', {'cursor': 'cualquiera'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.context['page_obj']), 15)
+
+    def test_total_grande_se_guarda_y_no_se_vuelve_a_contar(self):
+        pedidos_qs = Pedido.objects.all()
+        with mock.patch.object(paginacion, 'LIMITE_EXACTO', 10):
+            self.assertEqual(paginacion.total_listado(pedidos_qs), (35, False))
+            Pedido.objects.create()
+            # Sale de la cache (sin consultas) hasta que se recalcula
+            with self.assertNumQueries(0):
+                self.assertEqual(paginacion.total_listado(pedidos_qs), (35, True))
+            with mock.patch.object(paginacion.time, 'time', return_value=time.time() + paginacion.REFRESCAR + 1):
+                paginacion.total_listado(pedidos_qs)
+            self.assertEqual(paginacion.total_listado(pedidos_qs), (36, True))
+        self.assertEqual(paginacion.PaginaPanel(paginacion.PaginaCursor([]), None, True, QueryDict()).total_texto,
+                         f'más de {paginacion.LIMITE_EXACTO}')
+
+    def test_si_el_listado_se_achica_vuelve_al_total_exacto(self):
+        pedidos_qs = Pedido.objects.filter(estado='pendiente')
+        with mock.patch.object(paginacion, 'LIMITE_EXACTO', 10):
+            self.assertEqual(paginacion.total_listado(pedidos_qs), (35, False))
+            pedidos_qs.filter(pk__in=[p.pk for p in self.pedidos[5:]]).update(estado='pagado')
+            self.assertEqual(paginacion.total_listado(pedidos_qs), (35, True))
+
+            # Al recalcular encuentra 5: descarta el total guardado
+            with mock.patch.object(paginacion.time, 'time', return_value=time.time() + paginacion.REFRESCAR + 1):
+                paginacion.total_listado(pedidos_qs)
+            self.assertIsNone(cache.get(paginacion._clave(pedidos_qs)))
+            self.assertEqual(paginacion.total_listado(pedidos_qs), (5, False))
+
+    def test_productos_y_usuarios(self):
+        categoria = Categoria.objects.create(nombre='Remeras')
+        Producto.objects.bulk_create([
+            Producto(categoria=categoria, nombre=f'Remera {n}', precio=Decimal('100'), stock=5) for n in range(25)
+        ])
+        pagina = self.client.get('/panel_admin/productos/').context['page_obj']
+        self.assertEqual((len(pagina), pagina.total, pagina.tiene_siguiente), (20, 25, True))
+
+        pagina = self.client.get('/panel_admin/usuarios/').context['page_obj']
+        self.assertEqual((len(pagina), pagina.total, pagina.tiene_siguiente), (1, 1, False))
+
+
+class PermisosPanelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.administradores = Group.objects.create(name='Administradores')
+        self.empleados = Group.objects.create(name='Empleados')
+        self.empleado = User.objects.create_user('empleado', password='clave')
+        self.empleado.groups.add(self.empleados)
+
+    def consultas_de_grupos(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertIn(respuesta.status_code, (200, 302))
+        return [c['sql'] for c in consultas if 'auth_group' in c['sql'] or 'auth_permission' in c['sql']]
+
+    def permisos(self, user):
+        # Un objeto nuevo, como en otro request
+        return permisos.permisos_de(User.objects.get(pk=user.pk))
+
+    def test_paginas_publicas_sin_consultas_de_grupos(self):
+        self.assertEqual(self.consultas_de_grupos('/'), [])
+
+        self.client.force_login(User.objects.create_user('cliente'))
+        self.consultas_de_grupos('/')
+        self.assertEqual(self.consultas_de_grupos('/'), [])
+
+    def test_panel_calcula_una_vez_y_despues_sale_de_la_cache(self):
+        self.client.force_login(self.empleado)
+        self.assertLessEqual(len(self.consultas_de_grupos('/panel_admin/productos/')), 3)
+        self.assertEqual(self.consultas_de_grupos('/panel_admin/productos/'), [])
+
+    def test_secciones_segun_grupo(self):
+        self.client.force_login(self.empleado)
+        self.assertEqual(self.client.get('/panel_admin/productos/').status_code, 200)
+        self.assertRedirects(self.client.get('/panel_admin/estadisticas/'), '/panel_admin/')
+
+    def test_se_invalida_al_cambiar_los_grupos_del_usuario(self):
+        self.assertFalse(self.permisos(self.empleado).puede('usuarios'))
+        self.empleado.groups.add(self.administradores)
+        self.assertTrue(self.permisos(self.empleado).puede('usuarios'))
+
+        # Desde el otro lado de la relación
+        self.administradores.user_set.remove(self.empleado)
+        self.assertFalse(self.permisos(self.empleado).puede('usuarios'))
+        self.empleados.user_set.clear()
+        self.assertFalse(self.permisos(self.empleado).acceso_panel)
+
+    def test_se_invalida_al_cambiar_los_permisos_de_un_grupo(self):
+        self.assertFalse(self.permisos(self.empleado).tiene_permiso('tienda.add_producto'))
+        self.empleados.permissions.add(Permission.objects.get(codename='add_producto'))
+        self.assertTrue(self.permisos(self.empleado).tiene_permiso('tienda.add_producto'))
+
+    def test_se_invalida_al_renombrar_un_grupo(self):
+        self.empleados.name = 'Administradores viejos'
+        self.empleados.save()
+        self.assertFalse(self.permisos(self.empleado).acceso_panel)
+
+    def test_un_cambio_sin_senales_dura_como_mucho_duracion(self):
+        self.assertTrue(self.permisos(self.empleado).acceso_panel)
+        # Borrar la fila de la relación directo no manda m2m_changed
+        User.groups.through.objects.filter(user=self.empleado).delete()
+        self.assertTrue(self.permisos(self.empleado).acceso_panel)
+
+        despues = time.time() + permisos.DURACION + 1
+        with mock.patch('time.time', return_value=despues):
+            self.assertFalse(self.permisos(self.empleado).acceso_panel)
+
+    def test_anonimo(self):
+        anonimo = permisos.permisos_de(AnonymousUser())
+        self.assertFalse(anonimo.acceso_panel)
+        self.assertFalse(anonimo.puede('pedidos'))
@@ -7,6 +7,7 @@ app_name = 'panel_admin'
 urlpatterns = [
     # Dashboard
     path('', views.dashboard, name='dashboard'),
+    path('dashboard/datos/', views.dashboard_datos, name='dashboard_datos'),
     
     # Autenticación
     path('login/', views.login_panel, name='login'),
@@ -17,6 +18,7 @@ urlpatterns = [
     path('productos/nuevo/', views.producto_nuevo, name='producto_nuevo'),
     path('productos/editar/<int:id>/', views.producto_editar, name='producto_editar'),
     path('productos/eliminar/<int:id>/', views.producto_eliminar, name='producto_eliminar'),
+    path('productos/importar/', views.productos_importar, name='productos_importar'),
     
     # Talles y Colores rápidos
     path('talles/agregar-rapido/', views.agregar_talle_rapido, name='agregar_talle_rapido'),
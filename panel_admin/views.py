@@ -3,16 +3,24 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Sum, Q, F, DecimalField, ExpressionWrapper
+from django.db.models import Count, Sum, Q, F, DecimalField, ExpressionWrapper, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 from tienda.models import Producto, Categoria, ImagenProducto
-from pedidos_pagos.models import Pedido, ItemPedido
+from pedidos_pagos.models import Pedido, ItemPedido, VentaDiaria
 from carrito.models import Carrito
-from django.core.paginator import Paginator
+from carrito import services as carrito_services
+from pedidos_pagos import reservas
 from django.http import JsonResponse
 from tienda.forms import ProductoForm
-from django.db import models
+from tienda.busqueda import filtrar_por_texto
+from tienda.importacion import importar_productos, LECTORES, formato_de
+from . import metricas, paginacion
+from .permisos import permisos_de
+import codecs
+import csv
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
 from functools import wraps
@@ -48,7 +56,7 @@ def requiere_permiso(permiso_codename):
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
-            if not request.user.has_perm(permiso_codename):
+            if not permisos_de(request.user).tiene_permiso(permiso_codename):
                 if request.user.is_authenticated:
                     raise PermissionDenied
                 else:
@@ -58,10 +66,8 @@ def requiere_permiso(permiso_codename):
     return decorator
 
 def es_staff(user):
-    if user.is_superuser or user.is_staff:
-        return True
-    grupos_con_acceso = ['Administradores', 'Empleados', 'Vendedores']
-    return user.groups.filter(name__in=grupos_con_acceso).exists()
+    # Grupos desde la cache y una sola vez por request (ver panel_admin/permisos.py)
+    return permisos_de(user).acceso_panel
 
 def admin_required(view_func):
     @wraps(view_func)
@@ -76,19 +82,17 @@ def admin_required(view_func):
     return _wrapped_view
 
 def puede_ver_dashboard(user):
-    if user.is_superuser:
-        return True
-    return user.groups.filter(name__in=['Administradores', 'Empleados', 'Vendedores']).exists()
+    return permisos_de(user).puede('dashboard')
 
 def puede_gestionar_usuarios(user):
-    return user.is_superuser or user.groups.filter(name='Administradores').exists()
+    return permisos_de(user).puede('usuarios')
 
 # ==================== DECORADORES ESPECÍFICOS POR SECCIÓN ====================
 
 def requiere_ver_dashboard(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.is_superuser or request.user.groups.filter(name__in=['Administradores', 'Empleados', 'Vendedores']).exists():
+        if permisos_de(request.user).puede('dashboard'):
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, 'No tienes permisos para acceder al panel')
@@ -98,7 +102,7 @@ def requiere_ver_dashboard(view_func):
 def requiere_ver_productos(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.is_superuser or request.user.groups.filter(name__in=['Administradores', 'Empleados']).exists():
+        if permisos_de(request.user).puede('productos'):
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, 'No tienes permisos para acceder a la sección de Productos')
@@ -108,7 +112,7 @@ def requiere_ver_productos(view_func):
 def requiere_ver_categorias(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.is_superuser or request.user.groups.filter(name__in=['Administradores', 'Empleados']).exists():
+        if permisos_de(request.user).puede('categorias'):
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, 'No tienes permisos para acceder a la sección de Categorías')
@@ -118,7 +122,7 @@ def requiere_ver_categorias(view_func):
 def requiere_ver_pedidos(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.is_superuser or request.user.groups.filter(name__in=['Administradores', 'Empleados', 'Vendedores']).exists():
+        if permisos_de(request.user).puede('pedidos'):
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, 'No tienes permisos para acceder a la sección de Pedidos')
@@ -129,7 +133,7 @@ def requiere_ver_pedidos(view_func):
 def requiere_ver_estadisticas(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.is_superuser or request.user.groups.filter(name='Administradores').exists():
+        if permisos_de(request.user).puede('estadisticas'):
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, 'No tienes permisos para acceder a Estadísticas')
@@ -140,7 +144,7 @@ def requiere_ver_estadisticas(view_func):
 def requiere_ver_usuarios(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.is_superuser or request.user.groups.filter(name='Administradores').exists():
+        if permisos_de(request.user).puede('usuarios'):
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, 'No tienes permisos para acceder a la sección de Usuarios')
@@ -196,48 +200,31 @@ def dashboard(request):
         messages.error(request, 'No tienes permisos para acceder al panel')
         return redirect('/')
     
-    user_groups = list(request.user.groups.values_list('name', flat=True))
-    
-    total_productos = Producto.objects.count()
-    total_pedidos = Pedido.objects.count()
-    pedidos_pendientes = Pedido.objects.filter(estado='pendiente').count()
-    pedidos_pagados = Pedido.objects.filter(estado='pagado').count()
-    
-    hoy = timezone.now()
-    inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    ventas_mes = ItemPedido.objects.filter(
-        pedido__estado__in=['pagado', 'enviado', 'entregado'],
-        pedido__fecha_creacion__gte=inicio_mes
-    ).aggregate(
-        total=Sum(F('precio_unitario') * F('cantidad'), output_field=DecimalField(max_digits=12, decimal_places=2))
-    )['total'] or 0
-    
-    pedidos_recientes = Pedido.objects.order_by('-fecha_creacion')[:5]
-    productos_stock_bajo = Producto.objects.filter(stock__lt=10, stock__gt=0)[:5]
-    productos_sin_stock = Producto.objects.filter(stock=0)[:5]
-    usuarios_inactivos = User.objects.filter(is_active=False).count()
+    user_groups = permisos_de(request.user).grupos
     
+    # Contadores, pedidos recientes y alertas de stock en tres consultas,
+    # cacheados unos segundos (ver panel_admin/metricas.py)
     context = {
-        'total_productos': total_productos,
-        'total_pedidos': total_pedidos,
-        'pedidos_pendientes': pedidos_pendientes,
-        'pedidos_pagados': pedidos_pagados,
-        'ventas_mes': ventas_mes,
-        'pedidos_recientes': pedidos_recientes,
-        'productos_stock_bajo': productos_stock_bajo,
-        'productos_sin_stock': productos_sin_stock,
-        'usuarios_inactivos': usuarios_inactivos,
+        **metricas.datos_dashboard(),
         'user_groups': user_groups,
     }
     
     return render(request, 'panel_admin/dashboard.html', context)
+
+
+@login_required
+@user_passes_test(es_staff)
+def dashboard_datos(request):
+    """Los mismos datos del dashboard en JSON, para cargar widgets aparte"""
+    return JsonResponse(metricas.datos_dashboard())
+
 # ==================== PRODUCTOS ====================
 @login_required
 @user_passes_test(es_staff)
 @requiere_ver_productos
 def productos_lista(request):
-    productos = Producto.objects.all().order_by('-creado')
+    # La tarjeta trae la imagen principal ya resuelta (sin consultas por fila)
+    productos = Producto.objects.select_related('categoria', 'tarjeta').order_by('-creado')
     
     categoria_id = request.GET.get('categoria')
     if categoria_id:
@@ -251,14 +238,12 @@ def productos_lista(request):
     
     busqueda = request.GET.get('q')
     if busqueda:
-        productos = productos.filter(
-            Q(nombre__icontains=busqueda) | 
-            Q(descripcion__icontains=busqueda)
-        )
+        # Mismo índice FTS5 que la búsqueda de la tienda: busca palabras que
+        # empiecen con lo escrito, no el texto en cualquier parte del nombre
+        productos = filtrar_por_texto(productos, busqueda)
     
-    paginator = Paginator(productos, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Por cursor (fecha de alta + id) y con total estimado si son muchos
+    page_obj = paginacion.paginar(request, productos, paginacion.COLUMNAS_PRODUCTOS, 'productos', por_pagina=20)
     
     categorias = Categoria.objects.all()
     
@@ -430,6 +415,32 @@ def producto_editar(request, id):
         'accion': 'Actualizar'
     })
 
+@login_required
+@user_passes_test(es_staff)
+@requiere_ver_productos
+def productos_importar(request):
+    """Carga masiva desde un CSV/NDJSON de proveedor (ver tienda/importacion.py)"""
+    resultado = None
+    if request.method == 'POST':
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            messages.error(request, 'Seleccioná un archivo CSV o NDJSON')
+        else:
+            # Se lee línea por línea desde el archivo subido, sin cargarlo entero
+            lector = LECTORES[formato_de(archivo.name)]
+            try:
+                resultado = importar_productos(lector(codecs.iterdecode(archivo, 'utf-8-sig')))
+            except (UnicodeDecodeError, csv.Error) as e:
+                messages.error(request, f'No se pudo leer el archivo: {e}')
+            else:
+                messages.success(
+                    request,
+                    f'Importación terminada: {resultado.creados} creados, '
+                    f'{resultado.actualizados} actualizados, {resultado.cantidad_errores} con error'
+                )
+
+    return render(request, 'panel_admin/productos/importar.html', {'resultado': resultado})
+
 @login_required
 @user_passes_test(es_staff)
 @requiere_ver_productos  
@@ -491,7 +502,8 @@ def producto_eliminar(request, id):
 @user_passes_test(es_staff)
 @requiere_ver_pedidos 
 def pedidos_lista(request):
-    pedidos = Pedido.objects.all().order_by('-fecha_creacion')
+    # Unidades por pedido en la misma consulta; el total es la columna total_pago
+    pedidos = Pedido.objects.con_totales().select_related('carrito').order_by('-fecha_creacion')
     
     estado = request.GET.get('estado')
     if estado:
@@ -505,12 +517,15 @@ def pedidos_lista(request):
     if fecha_hasta:
         pedidos = pedidos.filter(fecha_creacion__lte=fecha_hasta)
     
-    paginator = Paginator(pedidos, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Por cursor (fecha de alta + id) y con total estimado si son muchos
+    page_obj = paginacion.paginar(request, pedidos, paginacion.COLUMNAS_PEDIDOS, 'pedidos', por_pagina=15)
     
-    total_pendientes = Pedido.objects.filter(estado='pendiente').count()
-    total_pagados = Pedido.objects.filter(estado='pagado').count()
+    conteos = Pedido.objects.aggregate(
+        pendientes=Count('pk', filter=Q(estado='pendiente')),
+        pagados=Count('pk', filter=Q(estado='pagado')),
+    )
+    total_pendientes = conteos['pendientes']
+    total_pagados = conteos['pagados']
     
     # Obtener estados disponibles
     ESTADOS_PEDIDO = [
@@ -537,19 +552,25 @@ def pedidos_lista(request):
 @user_passes_test(es_staff)
 @requiere_ver_pedidos 
 def pedido_detalle(request, id):
-    pedido = get_object_or_404(Pedido, id=id)
+    pedido = get_object_or_404(Pedido.objects.con_totales(), id=id)
     
-    total_pedido = pedido.get_total_db()
+    total_pedido = pedido.total_pago
     
     if request.method == 'POST':
         nuevo_estado = request.POST.get('estado')
         if nuevo_estado in dict(Pedido.ESTADOS).keys():
             estado_anterior = pedido.estado
-            pedido.estado = nuevo_estado
-            pedido.save()
+            # El resumen de ventas se actualiza en la misma transacción (señales de Pedido)
+            with transaction.atomic():
+                pedido.estado = nuevo_estado
+                pedido.save()
             
-            if nuevo_estado == 'entregado' and pedido.carrito:
-                pedido.carrito.items.all().delete()
+                if nuevo_estado == 'cancelado':
+                    reservas.liberar(pedido)
+
+                if nuevo_estado == 'entregado' and pedido.carrito:
+                    carrito_services.vaciar(pedido.carrito_id)
+                    carrito_services.actualizar_totales(pedido.carrito_id)
             
             messages.success(request, 
                 f'Pedido #{pedido.id} cambiado de "{estado_anterior}" a "{nuevo_estado}"'
@@ -594,11 +615,17 @@ def cambiar_estado_pedido(request, id):
         
         if nuevo_estado in dict(Pedido.ESTADOS).keys():
             estado_anterior = pedido.estado
-            pedido.estado = nuevo_estado
-            pedido.save()
+            # El resumen de ventas se actualiza en la misma transacción (señales de Pedido)
+            with transaction.atomic():
+                pedido.estado = nuevo_estado
+                pedido.save()
             
-            if nuevo_estado in ['entregado', 'cancelado'] and pedido.carrito:
-                pedido.carrito.items.all().delete()
+                if nuevo_estado == 'cancelado':
+                    reservas.liberar(pedido)
+
+                if nuevo_estado in ['entregado', 'cancelado'] and pedido.carrito:
+                    carrito_services.vaciar(pedido.carrito_id)
+                    carrito_services.actualizar_totales(pedido.carrito_id)
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
@@ -623,55 +650,52 @@ def cambiar_estado_pedido(request, id):
         return redirect('panel_admin:pedidos')
 
 # ==================== ESTADÍSTICAS ====================
+def _fecha_parametro(valor, por_defecto):
+    try:
+        return date.fromisoformat(valor) if valor else por_defecto
+    except ValueError:
+        return por_defecto
+
 @login_required
 @requiere_ver_estadisticas
 def estadisticas(request):
-    hoy = timezone.now()
+    hoy = timezone.localdate()
     
-    fecha_inicio = hoy - timedelta(days=30)
+    fecha_hasta = _fecha_parametro(request.GET.get('fecha_hasta'), hoy)
+    fecha_desde = _fecha_parametro(request.GET.get('fecha_desde'), fecha_hasta - timedelta(days=30))
     
-    ventas_por_dia = ItemPedido.objects.filter(
-        pedido__fecha_creacion__gte=fecha_inicio,
-        pedido__estado__in=['pagado', 'enviado', 'entregado']
-    ).annotate(
-        subtotal_db=ExpressionWrapper(
-            F('precio_unitario') * F('cantidad'),
-            output_field=DecimalField(max_digits=12, decimal_places=2)
-        )
-    ).extra(
-        select={'fecha': 'DATE(pedidos_pagos_pedido.fecha_creacion)'}
-    ).values('fecha').annotate(
-        total=Sum('subtotal_db'),
-        cantidad_pedidos=Count('pedido', distinct=True)
+    # Todo sale del resumen VentaDiaria (una fila por día y producto, ver
+    # pedidos_pagos/ventas.py) en vez de recorrer todos los items vendidos
+    ventas_periodo = VentaDiaria.objects.filter(fecha__gte=fecha_desde, fecha__lte=fecha_hasta)
+    
+    ventas_por_dia = ventas_periodo.values('fecha').annotate(
+        total=Sum('ingresos'),
     ).order_by('fecha')
     
-    productos_mas_vendidos = ItemPedido.objects.filter(
-        pedido__estado__in=['pagado', 'enviado', 'entregado']
-    ).annotate(
-        subtotal_db=ExpressionWrapper(
-            F('precio_unitario') * F('cantidad'),
-            output_field=DecimalField(max_digits=12, decimal_places=2)
-        )
-    ).values(
+    productos_mas_vendidos = VentaDiaria.objects.values(
         'producto__id', 
         'producto__nombre',
         'producto__precio'
     ).annotate(
-        total_vendido=Sum('cantidad'),
-        total_ingresos=Sum('subtotal_db')
+        total_vendido=Sum('unidades'),
+        total_ingresos=Sum('ingresos')
     ).order_by('-total_vendido')[:10]
     
+    vendidos_categoria = VentaDiaria.objects.filter(
+        categoria=OuterRef('pk')
+    ).order_by().values('categoria').annotate(total=Sum('unidades')).values('total')
+    
     categorias_populares = Categoria.objects.annotate(
         total_productos=Count('producto'),
-        total_vendidos=Count('producto__itempedido')
+        total_vendidos=Coalesce(Subquery(vendidos_categoria), 0)
     ).order_by('-total_vendidos')[:5]
     
     context = {
         'ventas_por_dia': list(ventas_por_dia),
         'productos_mas_vendidos': productos_mas_vendidos,
         'categorias_populares': categorias_populares,
-        'hoy': hoy.date(),
-        'hace_30_dias': (hoy - timedelta(days=30)).date(),
+        'hoy': fecha_hasta,
+        'hace_30_dias': fecha_desde,
     }
     
     return render(request, 'panel_admin/estadisticas.html', context)
@@ -846,7 +870,8 @@ def usuarios_lista(request):
     # Inicializar grupos si no existen
     inicializar_grupos_basicos()
     
-    usuarios = User.objects.all().order_by('-date_joined')
+    # Los grupos de cada fila en una consulta para toda la página
+    usuarios = User.objects.prefetch_related('groups').order_by('-date_joined')
     
     tipo = request.GET.get('tipo')
     if tipo == 'staff':
@@ -867,9 +892,8 @@ def usuarios_lista(request):
             Q(email__icontains=busqueda)
         )
     
-    paginator = Paginator(usuarios, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Por cursor (fecha de alta + id) y con total estimado si son muchos
+    page_obj = paginacion.paginar(request, usuarios, paginacion.COLUMNAS_USUARIOS, 'usuarios', por_pagina=15)
     
     staff_count = User.objects.filter(is_staff=True).count()
     superusers_count = User.objects.filter(is_superuser=True).count()
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Pedido, ItemPedido, Pago
+from .models import Pedido, ItemPedido, Pago, ReservaStock, NotificacionPago
+from . import notificaciones
 
 class ItemPedidoInline(admin.TabularInline):
     model = ItemPedido
@@ -35,7 +36,8 @@ class PedidoAdmin(admin.ModelAdmin):
         'estado',
         'email',
         'telefono',
-        'total',
+        'total_pago',
+        'mostrar_unidades',
         'fecha_creacion',
     )
 
@@ -54,11 +56,20 @@ class PedidoAdmin(admin.ModelAdmin):
         'telefono',
         'estado',
         'fecha_creacion',
-        'total',
+        'total_pago',
     )
 
     inlines = [ItemPedidoInline]
 
+    def get_queryset(self, request):
+        # Unidades en la misma consulta del listado (no una por fila)
+        return super().get_queryset(request).con_totales()
+
+    def mostrar_unidades(self, obj):
+        return obj.unidades
+    mostrar_unidades.short_description = "Unidades"
+    mostrar_unidades.admin_order_field = 'unidades'
+
 
 
 
@@ -90,3 +101,65 @@ class PagoAdmin(admin.ModelAdmin):
         'referencia_externa',
         'fecha_creacion',
     )
+
+
+@admin.register(ReservaStock)
+class ReservaStockAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'pedido',
+        'producto',
+        'cantidad',
+        'estado',
+        'vence',
+    )
+
+    list_filter = (
+        'estado',
+    )
+
+    search_fields = (
+        'pedido__id',
+        'producto__nombre',
+    )
+
+
+@admin.register(NotificacionPago)
+class NotificacionPagoAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'tipo',
+        'recurso_id',
+        'estado',
+        'intentos',
+        'proximo_intento',
+        'recibida',
+    )
+
+    list_filter = (
+        'estado',
+        'tipo',
+    )
+
+    search_fields = (
+        'clave',
+        'recurso_id',
+    )
+
+    readonly_fields = (
+        'clave',
+        'tipo',
+        'recurso_id',
+        'cuerpo',
+        'intentos',
+        'ultimo_error',
+        'recibida',
+        'procesada',
+    )
+
+    actions = ['reintentar']
+
+    @admin.action(description="Reintentar las notificaciones fallidas")
+    def reintentar(self, request, queryset):
+        total = notificaciones.reintentar(queryset)
+        self.message_user(request, f"{total} notificaciones vuelven a la cola")
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PedidosPagosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pedidos_pagos'
+
+    def ready(self):
+        from . import signals  # noqa: F401
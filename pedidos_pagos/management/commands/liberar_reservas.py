@@ -0,0 +1,12 @@
+# pedidos_pagos/management/commands/liberar_reservas.py
+from django.core.management.base import BaseCommand
+
+from pedidos_pagos.reservas import liberar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Libera las reservas de stock vencidas (correrlo cada pocos minutos, ej. con cron)'
+
+    def handle(self, *args, **kwargs):
+        total = liberar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} reservas vencidas liberadas'))
@@ -0,0 +1,53 @@
+# pedidos_pagos/management/commands/medir_mercadopago.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from pedidos_pagos.services import mercadopago
+
+
+class Command(BaseCommand):
+    help = ('Crea preferencias en paralelo con el cliente de Mercado Pago y muestra tiempos, reintentos '
+            'y estado del circuito. Pensado para correr contra `servidor_mp_simulado`')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cantidad', type=int, default=200, help='Preferencias a crear (default: 200)')
+        parser.add_argument('--hilos', type=int, default=16, help='Llamadas en paralelo (default: 16)')
+
+    def handle(self, *args, **options):
+        cliente = mercadopago.obtener_cliente()
+        datos = {
+            'items': [{'title': 'Prueba', 'quantity': 1, 'unit_price': 100.0, 'currency_id': 'ARS'}],
+            'binary_mode': True,
+        }
+        resultados = {'ok': 0, 'error': 0, 'circuito': 0}
+
+        def crear(_):
+            try:
+                cliente.crear_preferencia(datos)
+                return 'ok'
+            except mercadopago.CircuitoAbierto:
+                return 'circuito'
+            except mercadopago.ErrorMercadoPago:
+                return 'error'
+
+        self.stdout.write(f"Creando {options['cantidad']} preferencias en {cliente.url} "
+                          f"con {options['hilos']} hilos...")
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            for resultado in pool.map(crear, range(options['cantidad'])):
+                resultados[resultado] += 1
+        duracion = time.perf_counter() - inicio
+
+        estadisticas = cliente.estadisticas()
+        self.stdout.write(f"Tiempo total: {duracion:.2f}s ({options['cantidad'] / duracion:.0f}/s)")
+        self.stdout.write(f"Por llamada: p50 {estadisticas['p50_ms']} ms, p95 {estadisticas['p95_ms']} ms, "
+                          f"p99 {estadisticas['p99_ms']} ms")
+        self.stdout.write(f"Intentos: {estadisticas['intentos']} para {estadisticas['llamadas']} llamadas, "
+                          f"circuito {estadisticas['circuito']}")
+        self.stdout.write(self.style.SUCCESS(f"✓ {resultados['ok']} creadas"))
+        if resultados['error'] or resultados['circuito']:
+            self.stdout.write(self.style.ERROR(
+                f"✗ {resultados['error']} con error, {resultados['circuito']} cortadas por el circuito"
+            ))
@@ -0,0 +1,44 @@
+# pedidos_pagos/management/commands/procesar_notificaciones.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pedidos_pagos.notificaciones import procesar_lote
+
+
+class Command(BaseCommand):
+    help = 'Procesa las notificaciones de Mercado Pago guardadas por el webhook (por lotes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help='Notificaciones por lote (default: 50)')
+        parser.add_argument('--continuo', action='store_true',
+                            help='No termina: sigue esperando notificaciones nuevas')
+        parser.add_argument('--espera', type=float, default=1.0,
+                            help='Segundos entre consultas cuando no hay nada que procesar (default: 1)')
+
+    def handle(self, *args, **options):
+        totales = {'procesadas': 0, 'reintentos': 0, 'fallidas': 0}
+        try:
+            while True:
+                close_old_connections()
+                resultado = procesar_lote(options['lote'])
+                for clave, valor in resultado.items():
+                    totales[clave] += valor
+
+                if any(resultado.values()):
+                    if options['continuo']:
+                        self.stdout.write(self._resumen(resultado))
+                    # Puede haber más: el siguiente lote sin esperar
+                    continue
+                if not options['continuo']:
+                    break
+                time.sleep(options['espera'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"✓ {self._resumen(totales)}"))
+
+    def _resumen(self, resultado):
+        return (f"{resultado['procesadas']} procesadas, {resultado['reintentos']} para reintentar, "
+                f"{resultado['fallidas']} fallidas")
@@ -0,0 +1,25 @@
+# pedidos_pagos/management/commands/reconstruir_ventas.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos_pagos.ventas import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el resumen de ventas diarias (VentaDiaria) a partir de los pedidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Solo desde esta fecha (AAAA-MM-DD); por defecto todo')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError('--desde tiene que ser una fecha AAAA-MM-DD')
+
+        self.stdout.write("Recalculando ventas diarias...")
+        total = reconstruir(desde)
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} filas de ventas diarias'))
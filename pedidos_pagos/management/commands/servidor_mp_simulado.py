@@ -0,0 +1,86 @@
+# pedidos_pagos/management/commands/servidor_mp_simulado.py
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Servidor local que imita la API de Mercado Pago (preferencias y pagos) para medir el flujo '
+            'de pago sin red. Usarlo con MERCADOPAGO_API_URL=http://127.0.0.1:<puerto>')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puerto', type=int, default=8001)
+        parser.add_argument('--latencia', type=float, default=150,
+                            help='Milisegundos que tarda cada respuesta (default: 150)')
+        parser.add_argument('--variacion', type=float, default=50,
+                            help='Milisegundos de variación al azar sobre la latencia (default: 50)')
+        parser.add_argument('--errores', type=float, default=0.0,
+                            help='Fracción de respuestas 503, para probar reintentos y circuito (default: 0)')
+
+    def handle(self, *args, **options):
+        latencia, variacion, errores = options['latencia'], options['variacion'], options['errores']
+        preferencias = {}
+
+        class Manejador(BaseHTTPRequestHandler):
+            # HTTP/1.1 para que el cliente pueda reusar la conexión (keep-alive)
+            protocol_version = 'HTTP/1.1'
+
+            def _responder(self, status, datos):
+                cuerpo = json.dumps(datos).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def _esperar(self):
+                time.sleep(max(0, latencia + random.uniform(-variacion, variacion)) / 1000)
+                return random.random() < errores
+
+            def do_POST(self):
+                largo = int(self.headers.get('Content-Length') or 0)
+                datos = json.loads(self.rfile.read(largo) or b'{}')
+                if self._esperar():
+                    return self._responder(503, {'message': 'simulated error'})
+                if self.path != '/checkout/preferences':
+                    return self._responder(404, {'message': 'not found'})
+
+                # Misma X-Idempotency-Key -> misma preferencia, como MP
+                clave = self.headers.get('X-Idempotency-Key') or uuid.uuid4().hex
+                if clave not in preferencias:
+                    id_preferencia = f"SIM-{uuid.uuid4().hex[:12]}"
+                    preferencias[clave] = {
+                        'id': id_preferencia,
+                        'items': datos.get('items', []),
+                        'init_point': f"http://127.0.0.1:{options['puerto']}/checkout?pref_id={id_preferencia}",
+                        'sandbox_init_point': f"http://127.0.0.1:{options['puerto']}/checkout?pref_id={id_preferencia}",
+                    }
+                self._responder(201, preferencias[clave])
+
+            def do_GET(self):
+                if self._esperar():
+                    return self._responder(503, {'message': 'simulated error'})
+                if self.path.startswith('/v1/payments/'):
+                    pago_id = self.path.rsplit('/', 1)[-1]
+                    return self._responder(200, {'id': pago_id, 'status': 'approved', 'external_reference': pago_id})
+                self._responder(404, {'message': 'not found'})
+
+            def log_message(self, *args):
+                pass
+
+        servidor = ThreadingHTTPServer(('127.0.0.1', options['puerto']), Manejador)
+        servidor.daemon_threads = True
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Mercado Pago simulado en http://127.0.0.1:{options['puerto']} "
+            f"(latencia {latencia:.0f}±{variacion:.0f} ms, errores {errores:.0%})"
+        ))
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
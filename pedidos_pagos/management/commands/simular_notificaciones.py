@@ -0,0 +1,83 @@
+# pedidos_pagos/management/commands/simular_notificaciones.py
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos_pagos.models import Pedido
+
+
+class Command(BaseCommand):
+    help = ('Simula a Mercado Pago mandando notificaciones al webhook, en paralelo y con repetidas, '
+            'y mide cuánto tarda en responder. Para procesarlas sin red, el servidor tiene que correr con '
+            'DJANGO_SETTINGS_MODULE=Ecommerce_Tienda.settings_simulacion')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/pedidos/webhooks/mercadopago/')
+        parser.add_argument('--cantidad', type=int, default=1000, help='Notificaciones a mandar (default: 1000)')
+        parser.add_argument('--hilos', type=int, default=16, help='Envíos en paralelo (default: 16)')
+        parser.add_argument('--repetidas', type=float, default=0.2,
+                            help='Fracción que se manda dos veces, como los reintentos de MP (default: 0.2)')
+        # En modo simulado el pago de MP tiene el mismo id que el pedido
+        # (su external_reference), así que se notifican ids de pedidos
+        parser.add_argument('--pedidos', default='',
+                            help='Ids de Pedido separados por coma (default: los pendientes)')
+
+    def handle(self, *args, **options):
+        if options['pedidos']:
+            pedidos = [int(p) for p in options['pedidos'].split(',') if p.strip()]
+        else:
+            pedidos = list(Pedido.objects.filter(estado='pendiente').values_list('pk', flat=True))
+        if not pedidos:
+            raise CommandError('No hay pedidos pendientes para notificar (crear algunos o usar --pedidos)')
+
+        numeros = count(int(time.time() * 1000))
+        notificaciones = []
+        for _ in range(options['cantidad']):
+            cuerpo = {
+                'id': next(numeros),
+                'type': 'payment',
+                'action': 'payment.updated',
+                'live_mode': False,
+                'data': {'id': str(random.choice(pedidos))},
+            }
+            notificaciones.append(cuerpo)
+            if random.random() < options['repetidas']:
+                notificaciones.append(cuerpo)
+        random.shuffle(notificaciones)
+
+        sesiones = {}
+
+        def enviar(cuerpo):
+            # Una sesión (conexión keep-alive) por hilo
+            sesion = sesiones.setdefault(threading.get_ident(), requests.Session())
+            inicio = time.perf_counter()
+            try:
+                respuesta = sesion.post(options['url'], json=cuerpo, timeout=10)
+                estado = respuesta.status_code
+            except requests.RequestException:
+                estado = None
+            return estado, (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            resultados = list(pool.map(enviar, notificaciones))
+        duracion = time.perf_counter() - inicio
+
+        tiempos = sorted(ms for _, ms in resultados)
+        errores = sum(1 for estado, _ in resultados if estado != 200)
+        percentil = lambda p: tiempos[min(len(tiempos) - 1, int(len(tiempos) * p))]
+
+        self.stdout.write(f"Enviadas: {len(resultados)} ({len(resultados) - options['cantidad']} repetidas) "
+                          f"en {duracion:.2f}s ({len(resultados) / duracion:.0f}/s)")
+        self.stdout.write(f"Respuesta: media {statistics.mean(tiempos):.1f} ms, p50 {percentil(0.5):.1f} ms, "
+                          f"p95 {percentil(0.95):.1f} ms, p99 {percentil(0.99):.1f} ms")
+        if errores:
+            self.stdout.write(self.style.ERROR(f"✗ {errores} sin respuesta 200"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✓ Todas respondieron 200"))
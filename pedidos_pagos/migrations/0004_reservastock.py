@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_pagos', '0003_pedido_total_pago'),
+        ('tienda', '0014_variantes_imagenes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('vence', models.DateTimeField()),
+                ('estado', models.CharField(choices=[('activa', 'Activa'), ('convertida', 'Convertida en venta'), ('liberada', 'Liberada')], default='activa', max_length=20)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='pedidos_pagos.pedido')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='tienda.producto')),
+            ],
+            options={
+                'verbose_name': 'Reserva de stock',
+                'verbose_name_plural': 'Reservas de stock',
+                'indexes': [models.Index(fields=['producto', 'estado', 'vence'], name='reserva_producto_idx'), models.Index(fields=['estado', 'vence'], name='reserva_estado_vence_idx')],
+            },
+        ),
+    ]
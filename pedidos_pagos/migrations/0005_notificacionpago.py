@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:27
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_pagos', '0004_reservastock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=200, unique=True)),
+                ('tipo', models.CharField(blank=True, max_length=50)),
+                ('recurso_id', models.CharField(blank=True, max_length=100)),
+                ('cuerpo', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesada', 'Procesada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lote', models.CharField(blank=True, max_length=32)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('recibida', models.DateTimeField(auto_now_add=True)),
+                ('procesada', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Notificación de pago',
+                'verbose_name_plural': 'Notificaciones de pago',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='notificacion_pendiente_idx'), models.Index(fields=['lote'], name='notificacion_lote_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_pagos', '0005_notificacionpago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='mp_huella',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='mp_init_point',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='mp_preferencia_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='mp_vence',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Round, TruncDate
+
+
+def calcular_ventas(apps, schema_editor):
+    # Lo mismo que pedidos_pagos.ventas.reconstruir(), con los modelos históricos
+    ItemPedido = apps.get_model('pedidos_pagos', 'ItemPedido')
+    VentaDiaria = apps.get_model('pedidos_pagos', 'VentaDiaria')
+    filas = (
+        ItemPedido.objects.filter(pedido__estado__in=['pagado', 'enviado', 'entregado'])
+        .annotate(fecha=TruncDate('pedido__fecha_creacion'))
+        .order_by()
+        .values('fecha', 'producto_id', 'producto__categoria_id')
+        .annotate(
+            unidades_total=Sum('cantidad'),
+            ingresos_total=Round(Sum(F('precio_unitario') * F('cantidad'),
+                                     output_field=DecimalField(max_digits=12, decimal_places=2)), 2),
+            pedidos_total=Count('pedido', distinct=True),
+        )
+    )
+    VentaDiaria.objects.bulk_create([
+        VentaDiaria(
+            fecha=fila['fecha'],
+            producto_id=fila['producto_id'],
+            categoria_id=fila['producto__categoria_id'],
+            unidades=fila['unidades_total'],
+            ingresos=fila['ingresos_total'],
+            pedidos=fila['pedidos_total'],
+        )
+        for fila in filas
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_pagos', '0006_pedido_preferencia_mp'),
+        ('tienda', '0014_variantes_imagenes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pedidos', models.IntegerField(default=0)),
+                ('categoria', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ventas_diarias', to='tienda.categoria')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='tienda.producto')),
+            ],
+            options={
+                'verbose_name': 'Venta diaria',
+                'verbose_name_plural': 'Ventas diarias',
+                'indexes': [models.Index(fields=['categoria', 'fecha'], name='ventadiaria_categoria_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'producto'), name='ventadiaria_fecha_producto_uniq')],
+            },
+        ),
+        migrations.RunPython(calcular_ventas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Round
+
+
+def completar_total_pago(apps, schema_editor):
+    # Los pedidos anteriores a total_pago (0003) quedaron en 0: se completa
+    # desde los items para que los listados puedan leer la columna
+    Pedido = apps.get_model('pedidos_pagos', 'Pedido')
+    ItemPedido = apps.get_model('pedidos_pagos', 'ItemPedido')
+    monto = DecimalField(max_digits=12, decimal_places=2)
+    totales = (
+        ItemPedido.objects.filter(pedido=OuterRef('pk')).order_by().values('pedido')
+        .annotate(total=Round(Sum(F('precio_unitario') * F('cantidad'), output_field=monto), 2))
+        .values('total')
+    )
+    Pedido.objects.filter(total_pago=0, items__isnull=False).distinct().update(
+        total_pago=Subquery(totales, output_field=monto),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_pagos', '0007_ventadiaria'),
+    ]
+
+    operations = [
+        migrations.RunPython(completar_total_pago, migrations.RunPython.noop),
+    ]
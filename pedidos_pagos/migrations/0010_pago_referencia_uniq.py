@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_pagos', '0009_pedido_fecha_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='pago',
+            constraint=models.UniqueConstraint(condition=models.Q(('referencia_externa__isnull', False), models.Q(('referencia_externa', ''), _negated=True)), fields=('referencia_externa',), name='pago_referencia_uniq'),
+        ),
+    ]
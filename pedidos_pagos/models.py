@@ -1,11 +1,48 @@
 # pedidos_pagos/models.py
 from django.db import models
-from django.db.models import Sum, F
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
 from tienda.models import Producto
 from carrito.models import Carrito
 
 
+class PedidoQuerySet(models.QuerySet):
+
+    @staticmethod
+    def _de_items(agregado):
+        # Subconsulta correlacionada: solo se calcula para las filas que
+        # se traen (una página, los recientes), sin GROUP BY en la consulta
+        # principal, así se puede seguir filtrando y paginando
+        items = ItemPedido.objects.filter(pedido=OuterRef('pk')).order_by().values('pedido')
+        return Subquery(items.annotate(valor=agregado).values('valor'))
+
+    def con_totales(self):
+        """
+        Agrega a cada pedido el total calculado desde los items
+        (total_items), la cantidad de líneas (cantidad_items) y de unidades
+        (unidades), en la misma consulta. Los listados muestran total_pago,
+        que se guarda al crear el pedido (services/pedidos.py); total_items
+        sirve para controlarlo.
+        """
+        monto = DecimalField(max_digits=12, decimal_places=2)
+        return self.annotate(
+            total_items=Coalesce(
+                self._de_items(Round(Sum(F('precio_unitario') * F('cantidad'), output_field=monto), 2)),
+                Value(0), output_field=monto,
+            ),
+            cantidad_items=Coalesce(self._de_items(Count('pk')), Value(0), output_field=IntegerField()),
+            unidades=Coalesce(self._de_items(Sum('cantidad')), Value(0), output_field=IntegerField()),
+        )
+
+    def recalcular_totales(self):
+        """Vuelve a guardar total_pago desde los items (una sola sentencia)"""
+        return self.con_totales().update(total_pago=F('total_items'))
+
+
 class Pedido(models.Model):
+
+    objects = PedidoQuerySet.as_manager()
     
     @classmethod
     def get_estados(cls):
@@ -41,17 +78,35 @@ class Pedido(models.Model):
 
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    # Última preferencia de Mercado Pago creada para el pedido. Se reusa
+    # mientras no venza y los items no cambien (mp_huella, ver
+    # services/mercadopago.py), así volver a "Pagar" no llama a MP
+    mp_preferencia_id = models.CharField(max_length=100, blank=True)
+    mp_init_point = models.URLField(max_length=500, blank=True)
+    mp_huella = models.CharField(max_length=64, blank=True)
+    mp_vence = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Paginación por cursor del listado del panel (panel_admin/paginacion.py)
+        indexes = [
+            models.Index(fields=['fecha_creacion', 'id'], name='pedido_fecha_id_idx'),
+        ]
+
     def __str__(self):
         return f"Pedido #{self.id}"
 
     @property
     def total(self):
         """Calcula el total sumando los subtotales de los items"""
+        if hasattr(self, 'total_items'):
+            # Viene de Pedido.objects.con_totales()
+            return self.total_items
         return sum(item.subtotal for item in self.items.all())
     
     def get_total_db(self):
         """Versión que funciona en consultas de base de datos"""
-        from django.db.models import Sum, F
+        if hasattr(self, 'total_items'):
+            return self.total_items
         total = self.items.aggregate(
             total=Sum(F('precio_unitario') * F('cantidad'))
         )['total'] or 0
@@ -130,5 +185,160 @@ class Pago(models.Model):
 
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Un pago de MP ("MP-<id>") corresponde a un solo Pago, aunque
+            # lleguen dos notificaciones a la vez (ver notificaciones.py)
+            models.UniqueConstraint(
+                fields=['referencia_externa'],
+                condition=models.Q(referencia_externa__isnull=False) & ~models.Q(referencia_externa=''),
+                name='pago_referencia_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Pago #{self.id} - {self.estado}"
+
+class ReservaStock(models.Model):
+    """
+    Unidades apartadas para un pedido entre el checkout y el pago (ver
+    pedidos_pagos/reservas.py). Mientras está activa y no venció, se
+    descuenta del stock disponible para los demás.
+    """
+
+    ESTADOS = [
+        ('activa', 'Activa'),
+        ('convertida', 'Convertida en venta'),
+        ('liberada', 'Liberada'),
+    ]
+
+    pedido = models.ForeignKey(
+        Pedido,
+        on_delete=models.CASCADE,
+        related_name='reservas'
+    )
+
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='reservas'
+    )
+
+    cantidad = models.PositiveIntegerField()
+    vence = models.DateTimeField()
+
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADOS,
+        default='activa'
+    )
+
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Reserva de stock'
+        verbose_name_plural = 'Reservas de stock'
+        indexes = [
+            # Disponibilidad: reservas activas de un conjunto de productos
+            models.Index(fields=['producto', 'estado', 'vence'], name='reserva_producto_idx'),
+            # Barrido de vencidas
+            models.Index(fields=['estado', 'vence'], name='reserva_estado_vence_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reserva {self.cantidad} x {self.producto_id} (pedido #{self.pedido_id})"
+
+
+class NotificacionPago(models.Model):
+    """
+    Bandeja de entrada de las notificaciones (webhooks) de Mercado Pago.
+    El webhook solo guarda la notificación y responde; el comando
+    `procesar_notificaciones` las procesa por lotes (ver
+    pedidos_pagos/notificaciones.py). `clave` hace que una notificación
+    repetida no se guarde dos veces.
+    """
+
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesada', 'Procesada'),
+        # Agotó los reintentos o no se puede procesar: queda para revisar a mano
+        ('fallida', 'Fallida'),
+    ]
+
+    clave = models.CharField(max_length=200, unique=True)
+    tipo = models.CharField(max_length=50, blank=True)
+    recurso_id = models.CharField(max_length=100, blank=True)
+    cuerpo = models.JSONField(default=dict, blank=True)
+
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADOS,
+        default='pendiente'
+    )
+
+    intentos = models.PositiveIntegerField(default=0)
+    # Cuándo puede tomarla el procesador (reintentos con espera, y plazo
+    # para que otro la retome si el que la tomó se cayó)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    lote = models.CharField(max_length=32, blank=True)
+    ultimo_error = models.TextField(blank=True)
+
+    recibida = models.DateTimeField(auto_now_add=True)
+    procesada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Notificación de pago'
+        verbose_name_plural = 'Notificaciones de pago'
+        indexes = [
+            # Pendientes listas para procesar, en orden
+            models.Index(fields=['estado', 'proximo_intento'], name='notificacion_pendiente_idx'),
+            models.Index(fields=['lote'], name='notificacion_lote_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notificación {self.tipo} {self.recurso_id} - {self.estado}"
+
+
+class VentaDiaria(models.Model):
+    """
+    Resumen de ventas por día y producto (ver pedidos_pagos/ventas.py).
+    Se actualiza cuando un pedido entra o sale de los estados vendidos
+    (pagado, enviado, entregado); el comando `reconstruir_ventas` lo
+    recalcula desde los pedidos. El dashboard y las estadísticas leen
+    de acá en vez de sumar todos los items de todos los pedidos.
+    """
+
+    # Día de la venta (fecha de creación del pedido, en la zona horaria local)
+    fecha = models.DateField()
+
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='ventas_diarias'
+    )
+
+    # Categoría del producto al momento de la venta
+    categoria = models.ForeignKey(
+        'tienda.Categoria',
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='ventas_diarias'
+    )
+
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Pedidos de ese día que incluyen el producto
+    pedidos = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Venta diaria'
+        verbose_name_plural = 'Ventas diarias'
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'producto'], name='ventadiaria_fecha_producto_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['categoria', 'fecha'], name='ventadiaria_categoria_idx'),
+        ]
+
     def __str__(self):
-        return f"Pago #{self.id} - {self.estado}"
\ No newline at end of file
+        return f"{self.fecha} - {self.producto_id}: {self.unidades} u."
@@ -0,0 +1,208 @@
+# pedidos_pagos/notificaciones.py
+"""
+Notificaciones (webhooks) de Mercado Pago en dos pasos.
+
+1. El webhook solo las guarda en NotificacionPago con un INSERT ... ON
+   CONFLICT DO NOTHING sobre `clave` y responde 200 enseguida: MP
+   reintenta si tardamos, y una notificación repetida no se guarda dos
+   veces.
+2. El comando `procesar_notificaciones` las toma por lotes y las procesa
+   fuera del request (consultar el pago en MP, aprobar, descontar stock).
+
+Si procesar una falla se reintenta más tarde con espera exponencial (más
+un poco de azar para que no se reintenten todas juntas). Después de
+MAX_INTENTOS, o si el error no se arregla reintentando (ej. no hay
+stock), queda 'fallida' para revisarla a mano desde el admin.
+
+Tomar un lote le pone `lote` y corre `proximo_intento` PLAZO_PROCESO
+segundos: si el procesador se cae en el medio, pasado ese plazo otro
+las vuelve a tomar.
+
+El external_reference del pago es el id del Pedido (lo manda
+services/mercadopago.py en la preferencia). Cada pago de MP se guarda en
+un Pago con referencia_externa "MP-<id>": el pendiente del pedido si hay
+uno sin referencia, o uno nuevo.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from . import reservas
+from .models import NotificacionPago, Pago, Pedido
+from .services import mercadopago, pedidos
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = 5
+ESPERA_BASE = 30       # segundos; se duplica en cada intento
+PLAZO_PROCESO = 300    # segundos que un lote tomado no lo toca otro procesador
+
+
+class ErrorDefinitivo(Exception):
+    """Reintentar no lo arregla: la notificación pasa directo a 'fallida'"""
+
+
+def datos_notificacion(cuerpo, parametros):
+    """
+    (clave, tipo, recurso_id) de una notificación. MP manda el formato
+    webhook ({"id", "type", "action", "data": {"id"}}) o el viejo IPN
+    (?topic=payment&id=123); se aceptan los dos.
+    """
+    datos = cuerpo.get("data") if isinstance(cuerpo.get("data"), dict) else {}
+    tipo = str(cuerpo.get("type") or cuerpo.get("topic") or parametros.get("type") or parametros.get("topic") or "")
+    recurso_id = str(datos.get("id") or parametros.get("data.id") or parametros.get("id") or "")
+
+    # El id de la notificación se repite en los reintentos de MP; si no
+    # viene, la misma acción sobre el mismo recurso se toma como repetida
+    if cuerpo.get("id"):
+        clave = f"{tipo}:{cuerpo['id']}"
+    else:
+        clave = f"{tipo}:{recurso_id}:{cuerpo.get('action', '')}"
+    return clave[:200], tipo[:50], recurso_id[:100]
+
+
+def registrar(cuerpo, parametros=None):
+    """Guarda la notificación (una sola sentencia; si ya estaba no hace nada)"""
+    clave, tipo, recurso_id = datos_notificacion(cuerpo, parametros or {})
+    NotificacionPago.objects.bulk_create(
+        [NotificacionPago(clave=clave, tipo=tipo, recurso_id=recurso_id, cuerpo=cuerpo)],
+        ignore_conflicts=True,
+    )
+    return clave
+
+
+def espera_reintento(intentos):
+    """Segundos hasta el próximo intento: 30, 60, 120... más hasta ESPERA_BASE de azar"""
+    return ESPERA_BASE * 2 ** (intentos - 1) + random.uniform(0, ESPERA_BASE)
+
+
+def tomar_lote(tamanio=50):
+    """
+    Toma hasta `tamanio` notificaciones listas para procesar. El UPDATE
+    elige y marca en una sola sentencia, así que dos procesadores a la
+    vez no toman las mismas.
+    """
+    lote = get_random_string(32)
+    ahora = timezone.now()
+    listas = (
+        NotificacionPago.objects.filter(estado='pendiente', proximo_intento__lte=ahora)
+        .order_by('proximo_intento', 'pk')
+        .values('pk')[:tamanio]
+    )
+    NotificacionPago.objects.filter(pk__in=Subquery(listas)).update(
+        lote=lote,
+        intentos=F('intentos') + 1,
+        proximo_intento=ahora + timedelta(seconds=PLAZO_PROCESO),
+    )
+    return list(NotificacionPago.objects.filter(lote=lote).order_by('pk'))
+
+
+def _pago_de(pedido, pago_mp_id):
+    """El Pago del pedido que corresponde al pago `pago_mp_id` de MP"""
+    referencia = f"MP-{pago_mp_id}"
+    pago = Pago.objects.filter(referencia_externa=referencia).first()
+    if pago is None:
+        # El pendiente que se creó al confirmar el pedido (si hay); el
+        # UPDATE condicional evita que dos pagos de MP tomen el mismo
+        libre = (
+            Pago.objects.filter(pedido=pedido, estado='pendiente', referencia_externa__isnull=True)
+            .order_by('pk').values_list('pk', flat=True).first()
+        )
+        if libre is not None and Pago.objects.filter(
+            pk=libre, referencia_externa__isnull=True,
+        ).update(referencia_externa=referencia):
+            return Pago.objects.get(pk=libre)
+        try:
+            with transaction.atomic():
+                return Pago.objects.create(
+                    pedido=pedido, monto=pedido.total_pago, referencia_externa=referencia,
+                )
+        except IntegrityError:
+            # Otra notificación del mismo pago lo creó recién
+            pago = Pago.objects.get(referencia_externa=referencia)
+
+    if pago.pedido_id != pedido.pk:
+        raise ErrorDefinitivo(f"El pago {pago_mp_id} es del pedido {pago.pedido_id}, no del {pedido.pk}")
+    return pago
+
+
+def _procesar_pago(notificacion):
+    datos = mercadopago.consultar_pago(notificacion.recurso_id)
+    try:
+        pedido_id = int(datos.get("external_reference") or "")
+    except ValueError:
+        raise ErrorDefinitivo(f"external_reference inválida: {datos.get('external_reference')!r}")
+    pedido = Pedido.objects.filter(pk=pedido_id).first()
+    if pedido is None:
+        raise ErrorDefinitivo(f"No existe el pedido {pedido_id}")
+
+    estado = datos.get("status")
+    if estado not in ("approved", "rejected", "cancelled"):
+        # pending / in_process: llegará otra notificación cuando cambie
+        return
+    pago = _pago_de(pedido, datos.get("id") or notificacion.recurso_id)
+    try:
+        if estado == "approved":
+            pedidos.confirmar_pago(pago.pk)
+        else:
+            pedidos.rechazar_pago(pago.pk)
+    except pedidos.PagoNoPendiente:
+        # Ya se procesó (por otra notificación o por confirmar-pago)
+        pass
+    except reservas.StockInsuficiente as e:
+        raise ErrorDefinitivo(f"Stock insuficiente: {e}")
+
+
+PROCESADORES = {
+    "payment": _procesar_pago,
+}
+
+
+def procesar(notificacion):
+    procesador = PROCESADORES.get(notificacion.tipo)
+    if procesador is not None:
+        procesador(notificacion)
+
+
+def procesar_lote(tamanio=50):
+    """Procesa un lote; devuelve {'procesadas': n, 'reintentos': n, 'fallidas': n}"""
+    resultado = {'procesadas': 0, 'reintentos': 0, 'fallidas': 0}
+    procesadas = []
+
+    for notificacion in tomar_lote(tamanio):
+        try:
+            procesar(notificacion)
+        except Exception as e:
+            definitivo = isinstance(e, ErrorDefinitivo) or notificacion.intentos >= MAX_INTENTOS
+            if definitivo:
+                logger.error('Notificación %s fallida: %s', notificacion.clave, e)
+            else:
+                logger.warning('Notificación %s (intento %s): %s', notificacion.clave, notificacion.intentos, e)
+            NotificacionPago.objects.filter(pk=notificacion.pk).update(
+                estado='fallida' if definitivo else 'pendiente',
+                proximo_intento=timezone.now() + timedelta(seconds=espera_reintento(notificacion.intentos)),
+                ultimo_error=str(e)[:2000],
+                lote='',
+            )
+            resultado['fallidas' if definitivo else 'reintentos'] += 1
+        else:
+            procesadas.append(notificacion.pk)
+
+    if procesadas:
+        NotificacionPago.objects.filter(pk__in=procesadas).update(
+            estado='procesada', procesada=timezone.now(), ultimo_error='', lote='',
+        )
+    resultado['procesadas'] = len(procesadas)
+    return resultado
+
+
+def reintentar(queryset):
+    """Vuelve a encolar notificaciones fallidas (acción del admin)"""
+    return queryset.filter(estado='fallida').update(
+        estado='pendiente', intentos=0, proximo_intento=timezone.now(), lote='',
+    )
@@ -0,0 +1,134 @@
+# pedidos_pagos/reservas.py
+"""
+Reservas de stock con vencimiento.
+
+Cuando el checkout arma el Pedido se reservan sus unidades por
+RESERVA_STOCK_MINUTOS (ReservaStock). Mientras la reserva está activa y
+no venció, esas unidades no están disponibles para otros checkouts, así
+que en una promo no pasan la validación más compradores que unidades.
+
+    disponible = stock - reservas activas no vencidas (de otros pedidos)
+
+Al aprobarse el pago las reservas se marcan 'convertida' (el stock ya se
+descontó); si el pedido se cancela o la reserva vence, pasan a
+'liberada'. El comando `liberar_reservas` barre las vencidas; igual,
+una reserva vencida deja de contar aunque el comando no haya corrido.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from tienda.models import Producto
+from .models import ReservaStock
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, faltantes):
+        # faltantes: [(nombre del producto, unidades disponibles)]
+        self.faltantes = faltantes
+        super().__init__(', '.join(f"{nombre} (disponible: {disponible})" for nombre, disponible in faltantes))
+
+
+def minutos_reserva():
+    return getattr(settings, 'RESERVA_STOCK_MINUTOS', 15)
+
+
+def _vigentes(prefijo='', excluir_pedido=None):
+    condicion = Q(**{f'{prefijo}estado': 'activa', f'{prefijo}vence__gt': timezone.now()})
+    if excluir_pedido is not None:
+        condicion &= ~Q(**{f'{prefijo}pedido_id': excluir_pedido})
+    return condicion
+
+
+def disponibilidad(producto_ids, excluir_pedido=None):
+    """
+    {producto_id: producto} con `producto.reservado` y `producto.disponible`
+    (stock menos las reservas vigentes), en una sola consulta.
+    `excluir_pedido` no cuenta las reservas de ese pedido (las propias).
+    """
+    productos = Producto.objects.filter(pk__in=list(producto_ids)).annotate(
+        reservado=Coalesce(
+            Sum('reservas__cantidad', filter=_vigentes('reservas__', excluir_pedido)), 0
+        )
+    )
+    resultado = {}
+    for producto in productos:
+        producto.disponible = producto.stock - producto.reservado
+        resultado[producto.pk] = producto
+    return resultado
+
+
+def _faltantes(disponibles, cantidades, ya_reservadas=False):
+    faltantes = []
+    for producto_id, cantidad in cantidades.items():
+        producto = disponibles.get(producto_id)
+        if producto is None:
+            faltantes.append((f'Producto {producto_id}', 0))
+            continue
+        disponible = producto.disponible + (cantidad if ya_reservadas else 0)
+        if disponible < cantidad:
+            faltantes.append((producto.nombre, max(disponible, 0)))
+    return faltantes
+
+
+def verificar(cantidades, excluir_pedido=None):
+    """
+    `cantidades` es {producto_id: unidades}. Lanza StockInsuficiente con
+    todos los que no alcanzan; devuelve {producto_id: producto}.
+    """
+    disponibles = disponibilidad(cantidades, excluir_pedido)
+    faltantes = _faltantes(disponibles, cantidades)
+    if faltantes:
+        raise StockInsuficiente(faltantes)
+    return disponibles
+
+
+def reservar(pedido, cantidades):
+    """
+    Reserva las unidades del pedido (reemplaza las reservas activas que ya
+    tuviera, ej: si volvió al checkout). Lanza StockInsuficiente y no
+    deja nada reservado si algún producto no alcanza.
+
+    Primero se insertan las reservas y después se verifica contando
+    también las propias: en SQLite el INSERT toma el lock de escritura,
+    así que de dos checkouts simultáneos el segundo ve al primero.
+    """
+    vence = timezone.now() + timedelta(minutes=minutos_reserva())
+    with transaction.atomic():
+        liberar(pedido)
+        ReservaStock.objects.bulk_create([
+            ReservaStock(pedido=pedido, producto_id=producto_id, cantidad=cantidad, vence=vence)
+            for producto_id, cantidad in cantidades.items()
+        ])
+        faltantes = _faltantes(disponibilidad(cantidades), cantidades, ya_reservadas=True)
+        if faltantes:
+            raise StockInsuficiente(faltantes)
+    return vence
+
+
+def vencimiento(pedido):
+    """
+    Cuándo vence la reserva del pedido (la primera de sus líneas en
+    vencer), o None si no tiene una reserva activa que siga vigente.
+    """
+    vence = ReservaStock.objects.filter(pedido=pedido, estado='activa').aggregate(vence=Min('vence'))['vence']
+    if vence is None or vence <= timezone.now():
+        return None
+    return vence
+
+
+def convertir(pedido):
+    """El pago se aprobó: las reservas pasan a ser venta"""
+    return ReservaStock.objects.filter(pedido=pedido, estado='activa').update(estado='convertida')
+
+
+def liberar(pedido):
+    return ReservaStock.objects.filter(pedido=pedido, estado='activa').update(estado='liberada')
+
+
+def liberar_vencidas():
+    return ReservaStock.objects.filter(estado='activa', vence__lte=timezone.now()).update(estado='liberada')
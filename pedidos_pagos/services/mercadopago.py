@@ -1,128 +1,384 @@
-# import mercadopago
-# from django.conf import settings
-
-# print("MP TOKEN:", settings.MERCADOPAGO_ACCESS_TOKEN)
-
-# def crear_preferencia_pago(pedido):
-#     sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
-
-#     items = []
-#     for item in pedido.items.all():
-#         items.append({
-#             "title": item.nombre_producto,
-#             "quantity": item.cantidad,
-#             "unit_price": float(item.precio_unitario),
-#             "currency_id": "ARS",
-#         })
-
-#     # preference_data = {
-#     #     "items": items,
-#     #     "external_reference": str(pedido.id),
-#     #     #"notification_url": "http://localhost:8000/webhooks/mercadopago/",
-#     #     "back_urls": {
-#     #         "success": "http://localhost:8000/pago-exitoso/",
-#     #         "failure": "http://localhost:8000/pago-fallido/",
-#     #         "pending": "http://localhost:8000/pago-pendiente/",
-#     #     },
-#     #     "auto_return": "approved",
-#     # }
-#     preference_data = {
-#     "items": items,
-#     "external_reference": str(pedido.id),
-# }
-
-#     preference = sdk.preference().create(preference_data)
-#     return preference["response"]
-import mercadopago
-from django.conf import settings
+# pedidos_pagos/services/mercadopago.py
+"""
+Cliente HTTP de Mercado Pago.
 
-print("MP TOKEN:", settings.MERCADOPAGO_ACCESS_TOKEN)
+Antes cada clic en "Pagar" abría una conexión nueva con requests.post y
+podía dejar un worker bloqueado 10 s si MP no respondía. Ahora:
 
-def crear_preferencia_pago(pedido):
-    sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
-
-    items = []
-    for item in pedido.items.all():
-        items.append({
-            "title": item.nombre_producto,
-            "quantity": item.cantidad,
-            "unit_price": float(item.precio_unitario),
-            "currency_id": "ARS",
-        })
-
-    # preference_data = {
-    #     "items": items,
-    #     "external_reference": str(pedido.id),
-    #     #"notification_url": "http://localhost:8000/webhooks/mercadopago/",
-    #     "back_urls": {
-    #         "success": "http://localhost:8000/pago-exitoso/",
-    #         "failure": "http://localhost:8000/pago-fallido/",
-    #         "pending": "http://localhost:8000/pago-pendiente/",
-    #     },
-    #     "auto_return": "approved",
-    # }
-# import mercadopago
-# from django.conf import settings
-
-# def crear_preferencia_pago(pedido):
-#     sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
-
-#     preference_data = {
-#         "items": [
-#             {
-#                 "title": "Producto de prueba",
-#                 "quantity": 1,
-#                 "unit_price": 100.0,
-#                 "currency_id": "ARS",
-#             }
-#         ]
-#     }
-
-#     preference = sdk.preference().create(preference_data)
-
-#     print("RESPUESTA MERCADO PAGO ↓↓↓")
-#     print(preference)
-
-#     return preference.get("response")
+- Una sola requests.Session por proceso, con pool de conexiones
+  keep-alive (no se repite el handshake TLS en cada pago).
+- Timeouts separados de conexión y de lectura.
+- Reintentos con espera exponencial y azar ("full jitter") ante errores
+  de red, 429 y 5xx. La creación de preferencias manda
+  X-Idempotency-Key, así un reintento no crea dos.
+- Circuit breaker: después de MERCADOPAGO_CIRCUITO_FALLOS fallas
+  seguidas se deja de llamar a MP por MERCADOPAGO_CIRCUITO_SEGUNDOS y se
+  falla enseguida con CircuitoAbierto (en vez de colgar a cada cliente).
+- Cada llamada deja su tiempo en el log (logger "pedidos_pagos.mercadopago",
+  con los datos en `extra`) y en estadisticas().
+
+La preferencia de cada pedido se guarda en el Pedido y se reusa
+mientras no venza y sus items no cambien (preparar_preferencia), así
+reintentar el pago no vuelve a llamar a MP.
+
+Las versiones async (crear_preferencia_pago_async) corren la llamada en
+un pool de hilos acotado, así una vista async bajo ASGI no bloquea el
+event loop mientras espera a MP.
+
+MERCADOPAGO_API_URL permite apuntar a un servidor simulado para medir
+todo el flujo sin red (ver el comando `servidor_mp_simulado`).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
 
-MP_PREFERENCES_URL = "https://api.mercadopago.com/checkout/preferences"
+from pedidos_pagos import reservas
+from pedidos_pagos.models import Pedido
 
+logger = logging.getLogger('pedidos_pagos.mercadopago')
 
-def crear_preferencia_pago(pedido):
-    headers = {
-        "Authorization": f"Bearer {settings.MERCADOPAGO_ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
+REINTENTABLES = {429, 500, 502, 503, 504}
+# Una preferencia guardada que vence antes de esto ya no se reusa
+MARGEN_VENCIMIENTO = timedelta(minutes=1)
+
+
+class ReservaVencida(Exception):
+    """El pedido no tiene una reserva de stock vigente: no se puede pagar"""
+
+
+def _config(nombre, defecto):
+    return getattr(settings, f"MERCADOPAGO_{nombre}", defecto)
+
+
+class ErrorMercadoPago(Exception):
+    def __init__(self, mensaje, status=None, respuesta=None):
+        self.status = status
+        self.respuesta = respuesta
+        super().__init__(mensaje)
+
+
+class CircuitoAbierto(ErrorMercadoPago):
+    """MP viene fallando: no se lo llama hasta que pase el enfriamiento"""
+
+
+class Circuito:
+    """
+    cerrado -> (N fallas seguidas) -> abierto -> (pasan S segundos) ->
+    semiabierto: deja pasar una llamada de prueba; si anda se cierra,
+    si falla vuelve a abrirse.
+    """
+
+    def __init__(self, fallos, segundos):
+        self.fallos_maximos = fallos
+        self.segundos = segundos
+        self.fallos = 0
+        self.abierto_desde = None
+        self.probando = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.abierto_desde is None:
+            return 'cerrado'
+        if time.monotonic() - self.abierto_desde >= self.segundos:
+            return 'semiabierto'
+        return 'abierto'
+
+    def permitir(self):
+        with self._lock:
+            estado = self.estado
+            if estado == 'cerrado':
+                return True
+            if estado == 'semiabierto' and not self.probando:
+                self.probando = True
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            self.fallos = 0
+            self.abierto_desde = None
+            self.probando = False
+
+    def fallo(self):
+        with self._lock:
+            self.fallos += 1
+            if self.probando or self.fallos >= self.fallos_maximos:
+                self.abierto_desde = time.monotonic()
+            self.probando = False
+
+
+class ClienteMercadoPago:
+    def __init__(self):
+        self.url = _config("API_URL", "https://api.mercadopago.com").rstrip("/")
+        self.timeout = (_config("TIMEOUT_CONEXION", 3.05), _config("TIMEOUT_LECTURA", 10))
+        self.reintentos = _config("REINTENTOS", 2)
+        self.espera_base = _config("ESPERA_BASE", 0.2)
+        self.circuito = Circuito(_config("CIRCUITO_FALLOS", 5), _config("CIRCUITO_SEGUNDOS", 30))
+
+        conexiones = _config("CONEXIONES", 20)
+        self.sesion = requests.Session()
+        # Sin reintentos propios de urllib3: los maneja _llamar con su espera
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexiones, max_retries=0)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+
+        self._tiempos = deque(maxlen=1000)
+        self._contadores = {'llamadas': 0, 'intentos': 0, 'errores': 0, 'rechazadas_por_circuito': 0, 'reutilizadas': 0}
+        self._lock = threading.Lock()
+
+    def _cabeceras(self, extra=None):
+        cabeceras = {"Authorization": f"Bearer {settings.MERCADOPAGO_ACCESS_TOKEN}"}
+        cabeceras.update(extra or {})
+        return cabeceras
+
+    def _contar(self, clave, ms=None):
+        with self._lock:
+            self._contadores[clave] += 1
+            if ms is not None:
+                self._tiempos.append(ms)
+
+    def _llamar(self, metodo, ruta, **kwargs):
+        """Devuelve la respuesta (2xx o 4xx); lanza ErrorMercadoPago si no hubo forma"""
+        if not self.circuito.permitir():
+            self._contar('rechazadas_por_circuito')
+            raise CircuitoAbierto("Mercado Pago no responde, probá de nuevo en unos segundos")
 
-    items = []
-    for item in pedido.items.all():
-        items.append({
-            "title": item.nombre_producto,
-            "quantity": item.cantidad,
-            "unit_price": float(item.precio_unitario),
-            "currency_id": "ARS",
-        })
-
-    payload = {
-        "items": items,
+        self._contar('llamadas')
+        inicio = time.perf_counter()
+        error = None
+        for intento in range(self.reintentos + 1):
+            if intento:
+                # Full jitter: entre 0 y base * 2^intento
+                time.sleep(random.uniform(0, self.espera_base * 2 ** intento))
+            self._contar('intentos')
+            try:
+                respuesta = self.sesion.request(metodo, self.url + ruta, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                error = ErrorMercadoPago(f"Error de conexión con Mercado Pago: {e}")
+                continue
+            if respuesta.status_code in REINTENTABLES:
+                error = ErrorMercadoPago(f"Mercado Pago respondió {respuesta.status_code}",
+                                         respuesta.status_code, respuesta.text[:500])
+                continue
+
+            ms = (time.perf_counter() - inicio) * 1000
+            self.circuito.exito()
+            with self._lock:
+                self._tiempos.append(ms)
+            logger.info(
+                "%s %s -> %s en %.0f ms", metodo, ruta, respuesta.status_code, ms,
+                extra={"mp_metodo": metodo, "mp_ruta": ruta, "mp_status": respuesta.status_code,
+                       "mp_ms": round(ms, 1), "mp_intentos": intento + 1},
+            )
+            return respuesta
+
+        ms = (time.perf_counter() - inicio) * 1000
+        self.circuito.fallo()
+        self._contar('errores', ms)
+        logger.warning(
+            "%s %s falló después de %s intentos (%.0f ms): %s", metodo, ruta, self.reintentos + 1, ms, error,
+            extra={"mp_metodo": metodo, "mp_ruta": ruta, "mp_status": error.status,
+                   "mp_ms": round(ms, 1), "mp_intentos": self.reintentos + 1, "mp_circuito": self.circuito.estado},
+        )
+        raise error
+
+    def crear_preferencia(self, datos):
+        # La misma clave en todos los reintentos: MP no crea dos preferencias
+        respuesta = self._llamar(
+            "POST", "/checkout/preferences", json=datos,
+            headers=self._cabeceras({"X-Idempotency-Key": uuid.uuid4().hex}),
+        )
+        if respuesta.status_code not in (200, 201):
+            raise ErrorMercadoPago(f"Mercado Pago rechazó la preferencia ({respuesta.status_code})",
+                                   respuesta.status_code, respuesta.text[:500])
+        return respuesta.json()
+
+    def consultar_pago(self, pago_mp_id):
+        respuesta = self._llamar("GET", f"/v1/payments/{pago_mp_id}", headers=self._cabeceras())
+        if respuesta.status_code != 200:
+            raise ErrorMercadoPago(f"No se pudo consultar el pago {pago_mp_id} ({respuesta.status_code})",
+                                   respuesta.status_code, respuesta.text[:500])
+        return respuesta.json()
+
+    def estadisticas(self):
+        with self._lock:
+            tiempos = sorted(self._tiempos)
+            datos = dict(self._contadores)
+        percentil = lambda p: round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * p))], 1) if tiempos else None
+        datos.update(circuito=self.circuito.estado, p50_ms=percentil(0.5), p95_ms=percentil(0.95),
+                     p99_ms=percentil(0.99))
+        return datos
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+_pool = None
+
+
+def obtener_cliente():
+    """Cliente compartido por todo el proceso (y su pool de conexiones)"""
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = ClienteMercadoPago()
+    return _cliente
+
+
+def reiniciar_cliente():
+    """Descarta el cliente (ej. en tests, después de cambiar la configuración)"""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is not None:
+            _cliente.sesion.close()
+        _cliente = None
+
+
+def estadisticas():
+    return obtener_cliente().estadisticas()
+
+
+def _pool_hilos():
+    global _pool
+    if _pool is None:
+        with _cliente_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=_config("CONEXIONES", 20), thread_name_prefix="mercadopago")
+    return _pool
+
+
+def preparar_preferencia(pedido):
+    """
+    (huella, datos, vence) de la preferencia del pedido, en dos consultas.
+    La huella resume los items y el total: si cambia algo, cambia.
+    La preferencia vence junto con la reserva de stock del pedido (la
+    primera de sus líneas en vencer), así no se puede pagar algo que ya no
+    está reservado. Sin una reserva vigente lanza ReservaVencida.
+
+    external_reference es el id del pedido: es lo que devuelve MP al
+    consultar el pago y con eso notificaciones.py encuentra el pedido.
+    """
+    vence = reservas.vencimiento(pedido)
+    if vence is None:
+        raise ReservaVencida(f"La reserva del pedido #{pedido.pk} venció")
+    items = list(pedido.items.order_by('pk').values_list(
+        'producto_id', 'nombre_producto', 'cantidad', 'precio_unitario'
+    ))
+    referencia = str(pedido.pk)
+    notification_url = _config("NOTIFICATION_URL", "")
+    huella = hashlib.sha256(json.dumps(
+        [[str(valor) for valor in item] for item in items]
+        + [str(pedido.total_pago), referencia, notification_url]
+    ).encode()).hexdigest()
+    datos = {
+        "items": [
+            {
+                "title": nombre,
+                "quantity": cantidad,
+                "unit_price": float(precio),
+                "currency_id": "ARS",
+            }
+            for _, nombre, cantidad, precio in items
+        ],
         # importante en sandbox unificado
         "binary_mode": True,
+        "expires": True,
+        "expiration_date_to": timezone.localtime(vence).isoformat(timespec="milliseconds"),
+        "external_reference": referencia,
     }
+    if notification_url:
+        datos["notification_url"] = notification_url
+    return huella, datos, vence
+
+
+def _guardada(pedido, huella, vence):
+    """La preferencia guardada en el pedido, si sirve todavía (y no dura más que la reserva)"""
+    vigente = (
+        pedido.mp_vence is not None
+        and timezone.now() + MARGEN_VENCIMIENTO < pedido.mp_vence <= vence
+    )
+    if pedido.mp_init_point and pedido.mp_huella == huella and vigente:
+        obtener_cliente()._contar('reutilizadas')
+        return {"id": pedido.mp_preferencia_id, "init_point": pedido.mp_init_point, "reutilizada": True}
+    return None
 
-    response = requests.post(
-        MP_PREFERENCES_URL,
-        json=payload,
-        headers=headers,
-        timeout=10,
+
+def _guardar(pedido, huella, vence, preferencia):
+    if not preferencia.get("init_point"):
+        return
+    Pedido.objects.filter(pk=pedido.pk).update(
+        mp_preferencia_id=str(preferencia.get("id", "")),
+        mp_init_point=preferencia["init_point"],
+        mp_huella=huella,
+        mp_vence=vence,
     )
 
-    print("STATUS MP:", response.status_code)
-    print("RESPUESTA MP:", response.text)
 
-    if response.status_code not in (200, 201):
+def crear_preferencia_pago(pedido):
+    """
+    Preferencia de pago del pedido: la guardada si los items no cambiaron
+    y no venció, si no una nueva. Devuelve la respuesta de MP (con
+    init_point) o None si MP la rechazó o no se pudo crear; lanza
+    ReservaVencida si la reserva de stock del pedido ya venció.
+    """
+    huella, datos, vence = preparar_preferencia(pedido)
+    guardada = _guardada(pedido, huella, vence)
+    if guardada:
+        return guardada
+    try:
+        preferencia = obtener_cliente().crear_preferencia(datos)
+    except CircuitoAbierto:
+        raise
+    except ErrorMercadoPago as e:
+        logger.warning("No se pudo crear la preferencia del pedido #%s: %s", pedido.pk, e)
         return None
+    _guardar(pedido, huella, vence, preferencia)
+    return preferencia
+
+
+async def crear_preferencia_pago_async(pedido):
+    huella, datos, vence = await sync_to_async(preparar_preferencia)(pedido)
+    guardada = _guardada(pedido, huella, vence)
+    if guardada:
+        return guardada
+    loop = asyncio.get_running_loop()
+    try:
+        preferencia = await loop.run_in_executor(_pool_hilos(), obtener_cliente().crear_preferencia, datos)
+    except CircuitoAbierto:
+        raise
+    except ErrorMercadoPago as e:
+        logger.warning("No se pudo crear la preferencia del pedido #%s: %s", pedido.pk, e)
+        return None
+    await sync_to_async(_guardar)(pedido, huella, vence, preferencia)
+    return preferencia
+
+
+def consultar_pago(pago_mp_id):
+    """
+    Datos de un pago en Mercado Pago (status, external_reference, ...).
+    Las notificaciones solo traen el id, el estado hay que pedirlo.
 
-    return response.json()
+    Con MERCADOPAGO_SIMULADO = True no sale a la red: el pago se da por
+    aprobado y su external_reference (el id del pedido) es el mismo id.
+    Solo lo activan los tests y Ecommerce_Tienda/settings_simulacion.py
+    (pruebas de carga con `simular_notificaciones`): el webhook es público
+    y así cualquiera podría marcar un pedido como pagado.
+    """
+    if getattr(settings, "MERCADOPAGO_SIMULADO", False):
+        return {"id": pago_mp_id, "status": "approved", "external_reference": str(pago_mp_id)}
+    return obtener_cliente().consultar_pago(pago_mp_id)
@@ -0,0 +1,238 @@
+# pedidos_pagos/services/pedidos.py
+"""
+Armado de pedidos. Todos los caminos que crean un Pedido (checkout,
+crear pedido desde el carrito, checkout de cliente externo) pasan por
+crear_pedido(), que hace siempre la misma cantidad de consultas sin
+importar cuántos productos tenga el pedido:
+
+1. Una consulta trae todos los productos con su stock disponible
+   (descontando reservas, ver pedidos_pagos/reservas.py).
+2. Se valida todo antes de escribir nada: cantidades, productos
+   inexistentes y stock. Los errores se juntan en PedidoInvalido.
+3. En una transacción: el Pedido, sus items con un solo bulk_create y la
+   reserva de stock.
+
+Al aprobarse el pago, confirmar_pago() lo marca aprobado y
+descontar_stock() baja el stock con UPDATEs condicionales (ver abajo).
+Lo usan la vista confirmar_pago y el procesador de notificaciones de
+Mercado Pago (pedidos_pagos/notificaciones.py).
+"""
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+
+from pedidos_pagos import reservas
+from pedidos_pagos.models import Pedido, ItemPedido, Pago
+from tienda import cache_grillas, exportacion, tarjetas
+from tienda.models import Producto
+
+
+class PagoNoPendiente(Exception):
+    """El pago no existe o ya fue procesado (ej: notificación repetida)"""
+
+
+class PedidoInvalido(Exception):
+    def __init__(self, errores, no_encontrados=()):
+        self.errores = errores
+        self.no_encontrados = list(no_encontrados)
+        super().__init__(', '.join(errores))
+
+
+def normalizar_lineas(items):
+    """
+    [{'producto_id': 1, 'cantidad': 2}, ...] -> {producto_id: cantidad}
+    (un producto repetido suma sus cantidades)
+    """
+    cantidades = {}
+    errores = []
+    for item in items:
+        try:
+            producto_id = int(item.get("producto_id"))
+            cantidad = int(item.get("cantidad", 1))
+        except (AttributeError, TypeError, ValueError):
+            errores.append("Item inválido")
+            continue
+        if cantidad <= 0:
+            errores.append("Cantidad inválida")
+            continue
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    if errores:
+        raise PedidoInvalido(errores)
+    return cantidades
+
+
+def lineas_del_carrito(carrito):
+    """{producto_id: cantidad} de un Carrito de la base, en una consulta"""
+    return dict(carrito.items.values_list('producto_id', 'cantidad'))
+
+
+def crear_pedido(cantidades, carrito=None, email=None, telefono=None, reutilizar=False):
+    """
+    Crea el pedido con sus items y reserva el stock.
+
+    `cantidades` es {producto_id: cantidad}. Con `reutilizar` y un
+    carrito, si el carrito ya tenía pedido se actualiza ese (el cliente
+    volvió al checkout) en lugar de crear otro.
+    Lanza PedidoInvalido si algo no valida; en ese caso no escribe nada.
+    """
+    if not cantidades:
+        raise PedidoInvalido(["No hay items"])
+
+    existente = None
+    if reutilizar and carrito is not None:
+        existente = Pedido.objects.filter(carrito=carrito).first()
+
+    # 1️⃣ Productos + disponible, en una consulta (sin contar lo que ya
+    # reservó este mismo pedido si se está rehaciendo)
+    productos = reservas.disponibilidad(cantidades, excluir_pedido=existente.pk if existente else None)
+
+    # 2️⃣ Validar todo antes de escribir
+    no_encontrados = [producto_id for producto_id in cantidades if producto_id not in productos]
+    errores = [f"No existe el producto {producto_id}" for producto_id in no_encontrados]
+    errores += [
+        f"Stock insuficiente para {productos[producto_id].nombre} (disponible: {max(productos[producto_id].disponible, 0)})"
+        for producto_id, cantidad in cantidades.items()
+        if producto_id in productos and productos[producto_id].disponible < cantidad
+    ]
+    if errores:
+        raise PedidoInvalido(errores, no_encontrados)
+
+    total = sum(productos[producto_id].precio * cantidad for producto_id, cantidad in cantidades.items())
+
+    # 3️⃣ Escribir
+    with transaction.atomic():
+        if existente:
+            existente.email = email
+            existente.telefono = telefono
+            existente.estado = 'pendiente'
+            existente.total_pago = total
+            existente.save(update_fields=['email', 'telefono', 'estado', 'total_pago'])
+            pedido = existente
+            # Los items viejos se reemplazan para no duplicar
+            ItemPedido.objects.filter(pedido=pedido).delete()
+        else:
+            pedido = Pedido.objects.create(
+                carrito=carrito,
+                email=email,
+                telefono=telefono,
+                estado='pendiente',
+                total_pago=total,
+            )
+
+        ItemPedido.objects.bulk_create([
+            ItemPedido(
+                pedido=pedido,
+                producto=productos[producto_id],
+                nombre_producto=productos[producto_id].nombre,
+                precio_unitario=productos[producto_id].precio,
+                cantidad=cantidad,
+            )
+            for producto_id, cantidad in cantidades.items()
+        ])
+
+        # Vuelve a verificar con el lock de escritura tomado: si otro
+        # checkout se llevó las unidades en el medio, no queda nada creado
+        try:
+            reservas.reservar(pedido, cantidades)
+        except reservas.StockInsuficiente as e:
+            raise PedidoInvalido([f"Stock insuficiente: {e}"])
+
+    return pedido
+
+
+def crear_pedido_desde_carrito(carrito, email=None, telefono=None):
+    """Atajo: pedido nuevo con las líneas de un Carrito de la base"""
+    return crear_pedido(lineas_del_carrito(carrito), carrito=carrito, email=email, telefono=telefono)
+
+
+def descontar_stock(pedido):
+    """
+    Descuenta las unidades del pedido, una sentencia por producto:
+
+        UPDATE producto SET stock = stock - n WHERE id = ? AND stock >= n
+
+    La condición la evalúa la base en el mismo UPDATE, así que dos
+    confirmaciones a la vez nunca dejan el stock negativo ni se pisan
+    (antes se leía el producto, se restaba en Python y se guardaba la
+    fila entera). Si algún producto no alcanza lanza StockInsuficiente y
+    no queda nada descontado.
+    """
+    unidades = dict(
+        pedido.items.order_by().values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total')
+    )
+    ahora = timezone.now()
+    with transaction.atomic():
+        # Por id para que dos pedidos con los mismos productos tomen las filas en el mismo orden
+        sin_stock = [
+            producto_id
+            for producto_id, cantidad in sorted(unidades.items())
+            if not Producto.objects.filter(pk=producto_id, stock__gte=cantidad).update(
+                stock=F('stock') - cantidad, actualizado=ahora
+            )
+        ]
+        if sin_stock:
+            raise reservas.StockInsuficiente(list(
+                Producto.objects.filter(pk__in=sin_stock).values_list('nombre', 'stock')
+            ))
+
+        # update() no dispara las señales de Producto: se actualiza a mano
+        # lo que depende del stock (en_stock de las tarjetas, la versión de
+        # la exportación y las grillas de los productos que se agotaron)
+        tarjetas.actualizar_sin_imagen(unidades)
+        transaction.on_commit(exportacion.invalidar)
+        agotadas = list(
+            Producto.objects.filter(pk__in=unidades, stock=0)
+            .values_list('categoria__nombre', flat=True).distinct()
+        )
+        if agotadas:
+            transaction.on_commit(lambda: cache_grillas.invalidar(*agotadas))
+    return unidades
+
+
+def confirmar_pago(pago_id):
+    """
+    Aprueba el pago, descuenta el stock, convierte las reservas y marca
+    el pedido como pagado, todo en una transacción.
+
+    Lanza PagoNoPendiente si el pago no existe o ya no está pendiente (o
+    el pedido ya se pagó con otro pago), y StockInsuficiente si algún
+    producto no alcanza (no queda nada hecho).
+    """
+    with transaction.atomic():
+        # El UPDATE condicional es lo primero que se escribe, así que si
+        # llegan dos notificaciones a la vez solo una lo encuentra pendiente.
+        # La referencia de MP ("MP-<id>", ver notificaciones.py) se conserva
+        tomado = Pago.objects.filter(id=pago_id, estado="pendiente").update(
+            estado="aprobado",
+            referencia_externa=Coalesce(
+                NullIf(F("referencia_externa"), Value("")), Value(f"PAGO-{pago_id}"),
+            ),
+        )
+        if not tomado:
+            raise PagoNoPendiente(pago_id)
+
+        pago = Pago.objects.get(id=pago_id)
+        pedido = Pedido.objects.select_for_update().get(pk=pago.pedido_id)
+        pago.pedido = pedido
+        if pedido.estado != "pendiente":
+            # Dos pagos distintos de MP para el mismo pedido: el stock ya
+            # se descontó con el primero (el segundo queda pendiente)
+            raise PagoNoPendiente(pago_id)
+
+        # UPDATE ... WHERE stock >= n por producto; si alguno no alcanza se
+        # deshace toda la confirmación
+        descontar_stock(pedido)
+
+        # Las unidades reservadas en el checkout ya se descontaron
+        reservas.convertir(pedido)
+
+        pedido.estado = "pagado"
+        pedido.save()
+    return pago
+
+
+def rechazar_pago(pago_id):
+    """El medio de pago lo rechazó: el pedido sigue pendiente para reintentar"""
+    if not Pago.objects.filter(id=pago_id, estado="pendiente").update(estado="rechazado"):
+        raise PagoNoPendiente(pago_id)
@@ -0,0 +1,36 @@
+# pedidos_pagos/signals.py
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Pedido
+from . import ventas
+
+
+# ==================== RESUMEN DE VENTAS ====================
+
+@receiver(pre_save, sender=Pedido)
+def recordar_estado_anterior(sender, instance, raw=False, **kwargs):
+    # Para saber si el pedido entra o sale de los estados vendidos
+    if raw or instance.pk is None:
+        instance._estado_anterior = None
+        return
+    instance._estado_anterior = Pedido.objects.filter(pk=instance.pk).values_list('estado', flat=True).first()
+
+
+@receiver(post_save, sender=Pedido)
+def actualizar_ventas(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    antes = ventas.es_venta(getattr(instance, '_estado_anterior', None))
+    ahora = ventas.es_venta(instance.estado)
+    if antes != ahora:
+        # Los items todavía son los del pedido vendido (crear_pedido los
+        # reemplaza después de guardar)
+        ventas.acumular_pedido(instance, 1 if ahora else -1)
+    instance._estado_anterior = instance.estado
+
+
+@receiver(pre_delete, sender=Pedido)
+def descontar_ventas_pedido_borrado(sender, instance, **kwargs):
+    if ventas.es_venta(instance.estado):
+        ventas.acumular_pedido(instance, -1)
@@ -1,3 +1,645 @@
-from django.test import TestCase
+import io
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from carrito.models import Carrito, ItemCarrito
+from tienda import exportacion
+from tienda.models import Categoria, Producto
+from . import notificaciones, reservas, ventas, views
+from .models import ItemPedido, NotificacionPago, Pago, Pedido, ReservaStock, VentaDiaria
+from .services import mercadopago, pedidos
+
+
+def crear_productos(cantidad, stock=10):
+    categoria, _ = Categoria.objects.get_or_create(nombre='Remeras')
+    return Producto.objects.bulk_create([
+        Producto(categoria=categoria, nombre=f'Remera {n}', precio=Decimal('1000.50'), stock=stock)
+        for n in range(cantidad)
+    ])
+
+
+def crear_pedido_pendiente(*lineas):
+    """Pedido con un Pago pendiente; lineas: (producto, cantidad)"""
+    pedido = Pedido.objects.create(estado='pendiente')
+    ItemPedido.objects.bulk_create([
+        ItemPedido(pedido=pedido, producto=producto, nombre_producto=producto.nombre,
+                   precio_unitario=producto.precio, cantidad=cantidad)
+        for producto, cantidad in lineas
+    ])
+    return Pago.objects.create(pedido=pedido, monto=Decimal('0'))
+
+
+class CrearPedidoTests(TestCase):
+    def test_crea_items_reserva_y_total(self):
+        remera, buzo = crear_productos(2)
+        pedido = pedidos.crear_pedido({remera.pk: 2, buzo.pk: 1}, email='a@b.com')
+
+        self.assertEqual(pedido.total_pago, Decimal('3001.50'))
+        self.assertEqual(
+            sorted(ItemPedido.objects.filter(pedido=pedido).values_list('producto_id', 'cantidad')),
+            [(remera.pk, 2), (buzo.pk, 1)],
+        )
+        self.assertEqual(ReservaStock.objects.filter(pedido=pedido, estado='activa').count(), 2)
+
+    def test_valida_todo_antes_de_escribir(self):
+        remera, buzo = crear_productos(2, stock=1)
+        with self.assertRaises(pedidos.PedidoInvalido) as error:
+            pedidos.crear_pedido({remera.pk: 1, buzo.pk: 5, 999999: 1})
+
+        self.assertEqual(error.exception.no_encontrados, [999999])
+        self.assertEqual(len(error.exception.errores), 2)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(ReservaStock.objects.exists())
+
+    def test_normalizar_lineas_suma_repetidos(self):
+        self.assertEqual(
+            pedidos.normalizar_lineas([{'producto_id': '3', 'cantidad': 1}, {'producto_id': 3, 'cantidad': 2}]),
+            {3: 3},
+        )
+        with self.assertRaises(pedidos.PedidoInvalido):
+            pedidos.normalizar_lineas([{'producto_id': 3, 'cantidad': 0}])
+
+    def test_reutilizar_reemplaza_items_del_pedido_del_carrito(self):
+        remera, buzo = crear_productos(2, stock=2)
+        carrito = Carrito.objects.create(session_key='sesion-prueba')
+        primero = pedidos.crear_pedido({remera.pk: 2}, carrito=carrito, reutilizar=True)
+        # Sus propias reservas no le quitan stock al rehacerlo
+        segundo = pedidos.crear_pedido({remera.pk: 2, buzo.pk: 1}, carrito=carrito, reutilizar=True)
+
+        self.assertEqual(primero.pk, segundo.pk)
+        self.assertEqual(ItemPedido.objects.filter(pedido=segundo).count(), 2)
+        self.assertEqual(ReservaStock.objects.filter(pedido=segundo, estado='activa').count(), 2)
+
+
+class ConsultasConstantesTests(TestCase):
+    """
+    Armar un pedido hace la misma cantidad de consultas con 1 producto
+    que con 12 (antes eran 2-3 por producto). Los números cuentan también
+    los SAVEPOINT de las transacciones.
+    """
+
+    def setUp(self):
+        self.productos = crear_productos(12)
+
+    def cantidades(self, n):
+        return {producto.pk: 1 for producto in self.productos[:n]}
+
+    def test_servicio(self):
+        for n in (1, 12):
+            with self.subTest(productos=n), self.assertNumQueries(10):
+                pedidos.crear_pedido(self.cantidades(n))
+
+    def test_servicio_desde_carrito(self):
+        for n in (1, 12):
+            carrito = Carrito.objects.create(session_key=f'sesion-{n}')
+            ItemCarrito.objects.bulk_create([
+                ItemCarrito(carrito=carrito, producto_id=producto_id, cantidad=1)
+                for producto_id in self.cantidades(n)
+            ])
+            with self.subTest(productos=n), self.assertNumQueries(11):
+                pedidos.crear_pedido_desde_carrito(carrito)
+
+    def test_checkout_cliente_externo(self):
+        factory = RequestFactory()
+        for n in (1, 12):
+            items = [{'producto_id': producto_id, 'cantidad': 1} for producto_id in self.cantidades(n)]
+            request = factory.post('/', json.dumps({'email': 'a@b.com', 'items': items}), content_type='application/json')
+            with self.subTest(productos=n), self.assertNumQueries(10):
+                respuesta = views.checkout_cliente_externo(request)
+            self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(json.loads(respuesta.content)['total'], 12006.0)
+
+    def test_checkout_cliente_externo_no_crea_nada_si_falla(self):
+        request = RequestFactory().post(
+            '/',
+            json.dumps({'items': [{'producto_id': self.productos[0].pk}, {'producto_id': 999999}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(views.checkout_cliente_externo(request).status_code, 404)
+        self.assertFalse(Pedido.objects.exists())
+
+    def checkout(self, url, consultas, datos=None):
+        # Incluye pasar el carrito de la sesión a la base y guardar la sesión
+        for n in (1, 12):
+            self.client.cookies.clear()
+            self.client.post(
+                '/carrito/api/lineas/',
+                {'operaciones': [{'accion': 'fijar', 'producto_id': pk, 'cantidad': 1} for pk in self.cantidades(n)]},
+                content_type='application/json',
+            )
+            with self.subTest(productos=n), self.assertNumQueries(consultas):
+                respuesta = self.client.post(url, datos or {})
+            self.assertEqual(respuesta.status_code, 302)
+            self.assertIn('/pagar/', respuesta.url)
+
+    def test_checkout_view(self):
+        self.checkout('/pedidos/checkout/', 27, {'email': 'a@b.com', 'telefono': '123'})
+
+    def test_crear_pedido_desde_carrito(self):
+        self.checkout('/pedidos/crear-desde-carrito/', 27)
+
+
+class ConfirmarPagoTests(TestCase):
+    def confirmar(self, pago):
+        return self.client.post(f'/pedidos/confirmar-pago/{pago.pk}/')
+
+    def test_descuenta_stock_y_aprueba(self):
+        remera, buzo = crear_productos(2, stock=3)
+        pago = crear_pedido_pendiente((remera, 2), (buzo, 3))
+        version = exportacion.version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.confirmar(pago).status_code, 200)
+        self.assertEqual(
+            list(Producto.objects.order_by('pk').values_list('stock', flat=True)), [1, 0]
+        )
+        # El stock se exporta: el update() no pasa por las señales
+        self.assertNotEqual(exportacion.version(), version)
+        pago.refresh_from_db()
+        self.assertEqual((pago.estado, pago.pedido.estado), ('aprobado', 'pagado'))
+        # Una notificación repetida no vuelve a descontar
+        self.assertEqual(self.confirmar(pago).status_code, 404)
+        self.assertEqual(Producto.objects.get(pk=remera.pk).stock, 1)
+
+    def test_si_una_linea_no_alcanza_no_se_descuenta_nada(self):
+        remera, buzo = crear_productos(2, stock=3)
+        pago = crear_pedido_pendiente((remera, 2), (buzo, 5))
+
+        respuesta = self.confirmar(pago)
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['faltantes'], [{'producto': buzo.nombre, 'disponible': 3}])
+        self.assertEqual(list(Producto.objects.values_list('stock', flat=True)), [3, 3])
+        pago.refresh_from_db()
+        self.assertEqual((pago.estado, pago.pedido.estado), ('pendiente', 'pendiente'))
+
+
+class ConcurrenciaConfirmarPagoTests(TransactionTestCase):
+    """
+    Muchas confirmaciones a la vez (cada hilo con su conexión) sobre un
+    producto con poco stock, y cada notificación llega dos veces.
+    """
+
+    HILOS = 8
+    STOCK = 10
+    PEDIDOS = 30
+
+    def test_el_stock_nunca_queda_negativo(self):
+        producto, = crear_productos(1, stock=self.STOCK)
+        pagos = [crear_pedido_pendiente((producto, 1)) for _ in range(self.PEDIDOS)]
+        pendientes = [pago.pk for pago in pagos] * 2
+        bloqueo = threading.Lock()
+        barrera = threading.Barrier(self.HILOS + 1)
+        terminado = threading.Event()
+        errores, estados, stocks_vistos = [], [], []
+
+        def confirmar():
+            cliente = Client()
+            try:
+                barrera.wait()
+                while True:
+                    with bloqueo:
+                        if not pendientes:
+                            return
+                        pago_id = pendientes.pop()
+                    estados.append(cliente.post(f'/pedidos/confirmar-pago/{pago_id}/').status_code)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        def observar():
+            # Lee el stock mientras los demás confirman
+            try:
+                barrera.wait()
+                while not terminado.is_set():
+                    stocks_vistos.append(Producto.objects.values_list('stock', flat=True).get(pk=producto.pk))
+            finally:
+                connection.close()
+
+        observador = threading.Thread(target=observar)
+        hilos = [threading.Thread(target=confirmar) for _ in range(self.HILOS)]
+        for hilo in [observador, *hilos]:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        terminado.set()
+        observador.join()
+
+        self.assertEqual(errores, [])
+        self.assertTrue(stocks_vistos)
+        self.assertGreaterEqual(min(stocks_vistos), 0)
+        self.assertEqual(Producto.objects.get(pk=producto.pk).stock, 0)
+        # Se aprueban tantos pagos como unidades había; el resto queda pendiente
+        self.assertEqual(estados.count(200), self.STOCK)
+        self.assertEqual(Pago.objects.filter(estado='aprobado').count(), self.STOCK)
+        self.assertEqual(Pedido.objects.filter(estado='pagado').count(), self.STOCK)
+        self.assertEqual(Pago.objects.filter(estado='pendiente').count(), self.PEDIDOS - self.STOCK)
+        self.assertEqual(sorted(set(estados)), [200, 400, 404])
+
+
+@override_settings(MERCADOPAGO_SIMULADO=True)
+class NotificacionesTests(TestCase):
+    URL = '/pedidos/webhooks/mercadopago/'
+
+    def notificar(self, pago_id, numero=1):
+        cuerpo = {'id': numero, 'type': 'payment', 'action': 'payment.updated', 'data': {'id': str(pago_id)}}
+        return self.client.post(self.URL, cuerpo, content_type='application/json')
+
+    def test_el_webhook_solo_guarda_y_no_repite(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.notificar(7).status_code, 200)
+        self.assertEqual(self.notificar(7).status_code, 200)
+        self.notificar(7, numero=2)
+        # Formato IPN viejo
+        self.client.post(f'{self.URL}?topic=payment&id=8', '', content_type='application/json')
+
+        self.assertEqual(
+            sorted(NotificacionPago.objects.values_list('clave', 'recurso_id')),
+            [('payment:1', '7'), ('payment:2', '7'), ('payment:8:', '8')],
+        )
+        self.assertEqual(self.client.post(self.URL, 'no es json', content_type='application/json').status_code, 400)
+
+    def test_procesar_confirma_el_pago_una_sola_vez(self):
+        producto, = crear_productos(1, stock=3)
+        pago = crear_pedido_pendiente((producto, 2))
+        # En modo simulado el pago de MP tiene el id del pedido
+        self.notificar(pago.pedido_id, numero=1)
+        self.notificar(pago.pedido_id, numero=2)
+
+        self.assertEqual(notificaciones.procesar_lote(), {'procesadas': 2, 'reintentos': 0, 'fallidas': 0})
+        pago.refresh_from_db()
+        self.assertEqual((pago.estado, pago.pedido.estado), ('aprobado', 'pagado'))
+        self.assertEqual(pago.referencia_externa, f'MP-{pago.pedido_id}')
+        self.assertEqual(Producto.objects.get(pk=producto.pk).stock, 1)
+        # Ya no queda nada para tomar
+        self.assertEqual(notificaciones.procesar_lote(), {'procesadas': 0, 'reintentos': 0, 'fallidas': 0})
+
+    def test_sin_stock_va_directo_a_fallida(self):
+        producto, = crear_productos(1, stock=1)
+        pago = crear_pedido_pendiente((producto, 2))
+        self.notificar(pago.pedido_id)
+
+        self.assertEqual(notificaciones.procesar_lote()['fallidas'], 1)
+        notificacion = NotificacionPago.objects.get()
+        self.assertEqual(notificacion.estado, 'fallida')
+        self.assertIn('Stock insuficiente', notificacion.ultimo_error)
+
+        self.assertEqual(notificaciones.reintentar(NotificacionPago.objects.all()), 1)
+        self.assertEqual(NotificacionPago.objects.get().estado, 'pendiente')
+
+    def pago_mp(self, pago_mp_id, estado, external_reference):
+        return mock.patch.object(notificaciones.mercadopago, 'consultar_pago', return_value={
+            'id': pago_mp_id, 'status': estado, 'external_reference': external_reference,
+        })
+
+    @override_settings(MERCADOPAGO_NOTIFICATION_URL='https://tienda.test/pedidos/webhooks/mercadopago/')
+    def test_pago_de_una_preferencia_real(self):
+        producto, = crear_productos(1, stock=5)
+        pedido = pedidos.crear_pedido({producto.pk: 2})
+        _, datos, _ = mercadopago.preparar_preferencia(pedido)
+        self.assertEqual(datos['external_reference'], str(pedido.pk))
+        self.assertEqual(datos['notification_url'], 'https://tienda.test/pedidos/webhooks/mercadopago/')
+
+        # Ningún Pago existe todavía: se crea con la referencia de MP
+        self.notificar('999')
+        with self.pago_mp('999', 'approved', datos['external_reference']):
+            self.assertEqual(notificaciones.procesar_lote()['procesadas'], 1)
+
+        pedido.refresh_from_db()
+        pago = Pago.objects.get()
+        self.assertEqual(pedido.estado, 'pagado')
+        self.assertEqual((pago.pedido_id, pago.estado, pago.referencia_externa, pago.monto),
+                         (pedido.pk, 'aprobado', 'MP-999', pedido.total_pago))
+        self.assertEqual(Producto.objects.get(pk=producto.pk).stock, 3)
+        self.assertFalse(ReservaStock.objects.filter(pedido=pedido, estado='activa').exists())
+
+        # Un segundo pago aprobado del mismo pedido no descuenta otra vez
+        self.notificar('1000', numero=2)
+        with self.pago_mp('1000', 'approved', datos['external_reference']):
+            self.assertEqual(notificaciones.procesar_lote()['procesadas'], 1)
+        self.assertEqual(Pago.objects.get(referencia_externa='MP-1000').estado, 'pendiente')
+        self.assertEqual(Producto.objects.get(pk=producto.pk).stock, 3)
+
+    def test_rechazado_y_despues_aprobado(self):
+        producto, = crear_productos(1, stock=5)
+        pago = crear_pedido_pendiente((producto, 1))
+        referencia = str(pago.pedido_id)
+
+        self.notificar('50', numero=1)
+        with self.pago_mp('50', 'rejected', referencia):
+            notificaciones.procesar_lote()
+        pago.refresh_from_db()
+        self.assertEqual((pago.estado, pago.referencia_externa), ('rechazado', 'MP-50'))
+
+        self.notificar('51', numero=2)
+        with self.pago_mp('51', 'approved', referencia):
+            notificaciones.procesar_lote()
+        self.assertEqual(
+            sorted(Pago.objects.values_list('referencia_externa', 'estado')),
+            [('MP-50', 'rechazado'), ('MP-51', 'aprobado')],
+        )
+        self.assertEqual(Pedido.objects.get(pk=pago.pedido_id).estado, 'pagado')
+
+    def test_pedido_inexistente_va_directo_a_fallida(self):
+        self.notificar('70')
+        with self.pago_mp('70', 'approved', '999999'):
+            self.assertEqual(notificaciones.procesar_lote()['fallidas'], 1)
+        self.assertIn('No existe el pedido', NotificacionPago.objects.get().ultimo_error)
+        self.assertFalse(Pago.objects.exists())
+
+    def test_reintenta_con_espera_y_despues_queda_fallida(self):
+        self.notificar(1)
+        with mock.patch.object(notificaciones.mercadopago, 'consultar_pago', side_effect=ConnectionError('MP caído')):
+            for intento in range(1, notificaciones.MAX_INTENTOS + 1):
+                resultado = notificaciones.procesar_lote()
+                notificacion = NotificacionPago.objects.get()
+                self.assertEqual(notificacion.intentos, intento)
+                if intento < notificaciones.MAX_INTENTOS:
+                    self.assertEqual(resultado['reintentos'], 1)
+                    self.assertEqual(notificacion.estado, 'pendiente')
+                    # Hasta que pase la espera no se vuelve a tomar
+                    self.assertGreater(notificacion.proximo_intento, timezone.now())
+                    self.assertEqual(notificaciones.tomar_lote(), [])
+                    NotificacionPago.objects.update(proximo_intento=timezone.now())
+
+        self.assertEqual(notificacion.estado, 'fallida')
+        self.assertEqual(notificacion.ultimo_error, 'MP caído')
+
+
+@override_settings(MERCADOPAGO_REINTENTOS=2, MERCADOPAGO_ESPERA_BASE=0, MERCADOPAGO_CIRCUITO_FALLOS=2,
+                   MERCADOPAGO_CIRCUITO_SEGUNDOS=60)
+class ClienteMercadoPagoTests(TestCase):
+    def setUp(self):
+        mercadopago.reiniciar_cliente()
+        self.addCleanup(mercadopago.reiniciar_cliente)
+        self.cliente = mercadopago.obtener_cliente()
+
+    def respuesta(self, status, datos=None):
+        respuesta = mock.Mock(status_code=status, text=json.dumps(datos or {}))
+        respuesta.json.return_value = datos or {}
+        return respuesta
+
+    def test_consultar_pago_siempre_va_a_mercado_pago(self):
+        # El pago simulado no se puede activar desde el entorno
+        with mock.patch.dict('os.environ', {'MERCADOPAGO_SIMULADO': '1'}), \
+                mock.patch.object(self.cliente.sesion, 'request',
+                                  return_value=self.respuesta(200, {'id': 5, 'status': 'rejected'})) as request:
+            self.assertEqual(mercadopago.consultar_pago(5)['status'], 'rejected')
+        self.assertTrue(request.call_args.args[1].endswith('/v1/payments/5'))
+
+    def test_reintenta_con_la_misma_clave_de_idempotencia(self):
+        with mock.patch.object(self.cliente.sesion, 'request', side_effect=[
+            requests.ConnectionError('sin red'),
+            self.respuesta(503),
+            self.respuesta(201, {'id': 'pref', 'init_point': 'https://mp/pagar'}),
+        ]) as request:
+            self.assertEqual(self.cliente.crear_preferencia({'items': []})['id'], 'pref')
+
+        claves = {llamada.kwargs['headers']['X-Idempotency-Key'] for llamada in request.call_args_list}
+        self.assertEqual(len(claves), 1)
+        self.assertEqual(request.call_args.kwargs['timeout'], (3.05, 10))
+        self.assertEqual(self.cliente.estadisticas()['intentos'], 3)
+
+    def test_el_circuito_se_abre_y_corta_enseguida(self):
+        with mock.patch.object(self.cliente.sesion, 'request', return_value=self.respuesta(500)) as request:
+            for _ in range(2):
+                with self.assertRaises(mercadopago.ErrorMercadoPago):
+                    self.cliente.consultar_pago('1')
+            self.assertEqual(request.call_count, 6)
+
+            with self.assertRaises(mercadopago.CircuitoAbierto):
+                self.cliente.consultar_pago('1')
+            self.assertEqual(request.call_count, 6)
+
+        # Pasado el enfriamiento deja pasar una prueba; si anda, se cierra
+        self.cliente.circuito.abierto_desde -= 60
+        with mock.patch.object(self.cliente.sesion, 'request', return_value=self.respuesta(200, {'status': 'approved'})):
+            self.assertEqual(self.cliente.consultar_pago('1')['status'], 'approved')
+        self.assertEqual(self.cliente.circuito.estado, 'cerrado')
+
+    def test_pagar_pedido_redirige_al_init_point(self):
+        producto, = crear_productos(1)
+        pedido = pedidos.crear_pedido({producto.pk: 1})
+        url = f'/pedidos/pagar/{pedido.pk}/'
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with mock.patch.object(self.cliente.sesion, 'request',
+                               return_value=self.respuesta(201, {'id': 'pref', 'init_point': 'https://mp/pagar'})) as request:
+            respuesta = self.client.post(url)
+        self.assertRedirects(respuesta, 'https://mp/pagar', fetch_redirect_response=False)
+        self.assertEqual(request.call_args.kwargs['json']['items'][0]['quantity'], 1)
+
+        # Sin preferencia guardada y con el circuito abierto
+        Pedido.objects.filter(pk=pedido.pk).update(mp_huella='')
+        with mock.patch.object(self.cliente.circuito, 'permitir', return_value=False):
+            self.assertEqual(self.client.post(url).status_code, 503)
+
+    def test_reusa_la_preferencia_mientras_el_pedido_no_cambie(self):
+        remera, buzo = crear_productos(2)
+        carrito = Carrito.objects.create(session_key='sesion-prueba')
+        pedido = pedidos.crear_pedido({remera.pk: 1}, carrito=carrito, reutilizar=True)
+        url = f'/pedidos/pagar/{pedido.pk}/'
+        nueva = lambda n: self.respuesta(201, {'id': f'pref-{n}', 'init_point': f'https://mp/pagar/{n}'})
+
+        with mock.patch.object(self.cliente.sesion, 'request', side_effect=[nueva(1), nueva(2), nueva(3)]) as request:
+            self.assertEqual(self.client.post(url).url, 'https://mp/pagar/1')
+            # Volver a intentar con el mismo pedido no llama a MP
+            self.assertEqual(self.client.post(url).url, 'https://mp/pagar/1')
+            self.assertEqual(request.call_count, 1)
+
+            # Cambiaron los items: preferencia nueva
+            pedidos.crear_pedido({remera.pk: 1, buzo.pk: 1}, carrito=carrito, reutilizar=True)
+            self.assertEqual(self.client.post(url).url, 'https://mp/pagar/2')
+
+            # Venció: preferencia nueva
+            Pedido.objects.filter(pk=pedido.pk).update(mp_vence=timezone.now())
+            self.assertEqual(self.client.post(url).url, 'https://mp/pagar/3')
+            self.assertEqual(request.call_count, 3)
+
+        self.assertTrue(request.call_args.kwargs['json']['expires'])
+        self.assertEqual(self.cliente.estadisticas()['reutilizadas'], 1)
+        self.assertEqual(Pedido.objects.get(pk=pedido.pk).mp_preferencia_id, 'pref-3')
+
+    def test_la_preferencia_vence_con_la_reserva(self):
+        remera, buzo = crear_productos(2)
+        pedido = pedidos.crear_pedido({remera.pk: 2, buzo.pk: 1})
+        url = f'/pedidos/pagar/{pedido.pk}/'
+        nueva = lambda n: self.respuesta(201, {'id': f'pref-{n}', 'init_point': f'https://mp/pagar/{n}'})
+        reservas = ReservaStock.objects.filter(pedido=pedido)
+
+        # Ya pasó parte de la reserva, y la de la remera vence primero
+        primera = timezone.now() + timezone.timedelta(minutes=5)
+        reservas.filter(producto=buzo).update(vence=primera + timezone.timedelta(minutes=3))
+        reservas.filter(producto=remera).update(vence=primera)
+
+        with mock.patch.object(self.cliente.sesion, 'request', side_effect=[nueva(1), nueva(2)]) as request:
+            self.assertEqual(self.client.post(url).url, 'https://mp/pagar/1')
+            self.assertEqual(Pedido.objects.get(pk=pedido.pk).mp_vence, primera)
+            self.assertEqual(request.call_args.kwargs['json']['expiration_date_to'],
+                             timezone.localtime(primera).isoformat(timespec='milliseconds'))
+            # Mientras la reserva siga vigente se reusa
+            self.assertEqual(self.client.post(url).url, 'https://mp/pagar/1')
+            self.assertEqual(request.call_count, 1)
+
+            # La reserva ahora vence antes que la preferencia guardada: una nueva, que vence con ella
+            casi = timezone.now() + timezone.timedelta(seconds=30)
+            reservas.filter(producto=remera).update(vence=casi)
+            self.assertEqual(self.client.post(url).url, 'https://mp/pagar/2')
+            self.assertEqual(Pedido.objects.get(pk=pedido.pk).mp_vence, casi)
+
+            # Venció una línea: no se puede pagar, ni se llama a MP
+            reservas.filter(producto=remera).update(vence=timezone.now())
+            respuesta = self.client.post(url)
+            self.assertEqual(respuesta.status_code, 409)
+            self.assertEqual(request.call_count, 2)
+
+        # Sin reservas activas tampoco
+        reservas.update(estado='liberada')
+        with self.assertRaises(mercadopago.ReservaVencida):
+            mercadopago.preparar_preferencia(pedido)
+
+
+class VentasDiariasTests(TestCase):
+    def setUp(self):
+        self.remera, self.buzo = crear_productos(2)
+
+    def resumen(self):
+        return sorted(VentaDiaria.objects.values_list('producto_id', 'unidades', 'ingresos', 'pedidos'))
+
+    def pagar(self, *lineas):
+        pago = crear_pedido_pendiente(*lineas)
+        pedidos.confirmar_pago(pago.pk)
+        return Pedido.objects.get(pk=pago.pedido_id)
+
+    def test_se_actualiza_al_entrar_y_salir_de_los_estados_vendidos(self):
+        primero = self.pagar((self.remera, 2), (self.buzo, 1))
+        self.pagar((self.remera, 1))
+        self.assertEqual(self.resumen(), [
+            (self.remera.pk, 3, Decimal('3001.50'), 2),
+            (self.buzo.pk, 1, Decimal('1000.50'), 1),
+        ])
+
+        # pagado -> enviado sigue siendo venta
+        primero.estado = 'enviado'
+        primero.save()
+        self.assertEqual(len(self.resumen()), 2)
+
+        primero.estado = 'cancelado'
+        primero.save()
+        self.assertEqual(self.resumen(), [(self.remera.pk, 1, Decimal('1000.50'), 1)])
+
+        Pedido.objects.get(estado='pagado').delete()
+        self.assertEqual(self.resumen(), [])
+
+    def test_reconstruir_da_lo_mismo_que_el_incremental(self):
+        self.pagar((self.remera, 2), (self.buzo, 1))
+        self.pagar((self.buzo, 3))
+        crear_pedido_pendiente((self.remera, 5))
+        incremental = self.resumen()
+
+        VentaDiaria.objects.all().delete()
+        self.assertEqual(ventas.reconstruir(), 2)
+        self.assertEqual(self.resumen(), incremental)
+
+
+class PedidoConTotalesTests(TestCase):
+    def setUp(self):
+        self.remera, self.buzo = crear_productos(2)
+        self.pedido = crear_pedido_pendiente((self.remera, 2), (self.buzo, 3)).pedido
+        self.vacio = Pedido.objects.create(estado='pendiente')
+
+    def test_totales_en_la_misma_consulta(self):
+        with self.assertNumQueries(1):
+            pedidos_con_totales = {p.pk: p for p in Pedido.objects.con_totales()}
+            pedido = pedidos_con_totales[self.pedido.pk]
+            self.assertEqual(pedido.total_items, Decimal('5002.50'))
+            self.assertEqual(pedido.cantidad_items, 2)
+            self.assertEqual(pedido.unidades, 5)
+            # total y get_total_db usan la anotación en vez de ir a los items
+            self.assertEqual(pedido.total, Decimal('5002.50'))
+            self.assertEqual(pedido.get_total_db(), Decimal('5002.50'))
+
+        vacio = pedidos_con_totales[self.vacio.pk]
+        self.assertEqual((vacio.total_items, vacio.cantidad_items, vacio.unidades), (0, 0, 0))
+
+    def test_se_puede_filtrar_y_contar(self):
+        pedidos_con_totales = Pedido.objects.con_totales()
+        self.assertEqual(pedidos_con_totales.count(), 2)
+        self.assertEqual(list(pedidos_con_totales.filter(unidades__gt=0).values_list('pk', flat=True)), [self.pedido.pk])
+
+    def test_recalcular_totales(self):
+        Pedido.objects.filter(pk=self.pedido.pk).recalcular_totales()
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.total_pago, Decimal('5002.50'))
+
+
+class ReservasTests(TestCase):
+    def setUp(self):
+        self.remera, = crear_productos(1, stock=2)
+
+    def checkout(self, cliente, unidades):
+        for _ in range(unidades):
+            cliente.get(f'/carrito/agregar/{self.remera.pk}/')
+        return cliente.post('/pedidos/checkout/', {'email': 'a@b.com', 'telefono': '123'})
+
+    def disponible(self):
+        return reservas.disponibilidad([self.remera.pk])[self.remera.pk].disponible
+
+    def test_lo_reservado_no_se_vuelve_a_vender(self):
+        primero, segundo = Client(), Client()
+        self.assertIn('/pagar/', self.checkout(primero, 2).url)
+        self.assertEqual(ReservaStock.objects.get().cantidad, 2)
+
+        # El segundo no pasa aunque el stock todavía no se descontó
+        self.assertEqual(self.checkout(segundo, 1).url, '/carrito/ver/')
+        self.assertEqual(Pedido.objects.count(), 1)
+
+        # Volver al checkout reemplaza la reserva en lugar de sumar otra
+        self.checkout(primero, 0)
+        self.assertEqual(ReservaStock.objects.filter(estado='activa').count(), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.disponible(), 0)
+
+    def test_vence_y_se_libera(self):
+        primero, segundo = Client(), Client()
+        self.checkout(primero, 2)
+        ReservaStock.objects.update(vence=timezone.now() - timedelta(minutes=1))
+        # Vencida ya no cuenta, aunque el barrido no haya corrido
+        self.assertEqual(self.disponible(), 2)
+        self.assertIsNone(reservas.vencimiento(Pedido.objects.get()))
+
+        salida = io.StringIO()
+        call_command('liberar_reservas', stdout=salida)
+        self.assertIn('1 reservas vencidas liberadas', salida.getvalue())
+        self.assertFalse(ReservaStock.objects.filter(estado='activa').exists())
+        self.assertIn('/pagar/', self.checkout(segundo, 1).url)
+
+    def test_al_aprobar_el_pago_se_convierte(self):
+        self.checkout(Client(), 1)
+        pedido = Pedido.objects.get()
+        pago = Pago.objects.create(pedido=pedido, monto=pedido.total_pago)
+        self.assertEqual(self.client.post(f'/pedidos/confirmar-pago/{pago.pk}/').status_code, 200)
+
+        self.assertEqual(ReservaStock.objects.get(pedido=pedido).estado, 'convertida')
+        self.remera.refresh_from_db()
+        # El stock ya se descontó: la reserva convertida no resta otra vez
+        self.assertEqual((self.remera.stock, self.disponible()), (1, 1))
+
+    def test_reservar_no_deja_nada_si_no_alcanza(self):
+        otro, = crear_productos(1, stock=5)
+        pedido = Pedido.objects.create(estado='pendiente')
+        with self.assertRaises(reservas.StockInsuficiente) as error:
+            reservas.reservar(pedido, {self.remera.pk: 3, otro.pk: 1})
+        self.assertEqual(error.exception.faltantes, [(self.remera.nombre, 2)])
+        self.assertFalse(ReservaStock.objects.exists())
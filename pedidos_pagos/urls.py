@@ -12,6 +12,7 @@ urlpatterns = [
     # 3. Webhooks / Confirmación
     path('confirmar-pago/<int:pago_id>/', views.confirmar_pago, name='confirmar_pago'),
     path('exito/', views.pedido_exito, name='pedido_exito'),
+    path('webhooks/mercadopago/', views.webhook_mercadopago, name='webhook_mercadopago'),
 
     # 4. Esta ruta la mantenemos solo si la usas para otra cosa, 
     # pero el botón del carrito ahora irá directo al checkout
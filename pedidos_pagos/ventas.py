@@ -0,0 +1,125 @@
+# pedidos_pagos/ventas.py
+"""
+Mantenimiento de VentaDiaria (ventas por día y producto).
+
+Antes las estadísticas sumaban ItemPedido join Pedido desde el primer
+pedido en cada carga. Ahora cada pedido suma sus items al resumen cuando
+entra en un estado vendido y los resta cuando sale (o se borra), con un
+INSERT ... ON CONFLICT DO UPDATE que acumula: una sentencia por pedido,
+dentro de la misma transacción que el cambio de estado (ver signals.py).
+
+reconstruir() recalcula todo (o desde una fecha) a partir de los
+pedidos; es lo que corre el comando `reconstruir_ventas`.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Round, TruncDate
+from django.utils import timezone
+
+from .models import ItemPedido, VentaDiaria
+
+ESTADOS_VENDIDOS = ('pagado', 'enviado', 'entregado')
+MONTO = DecimalField(max_digits=12, decimal_places=2)
+
+
+def es_venta(estado):
+    return estado in ESTADOS_VENDIDOS
+
+
+def _sql_acumular(filas):
+    tabla = connection.ops.quote_name(VentaDiaria._meta.db_table)
+    valores = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * filas)
+    return f"""
+        INSERT INTO {tabla} (fecha, producto_id, categoria_id, unidades, ingresos, pedidos)
+        VALUES {valores}
+        ON CONFLICT (fecha, producto_id) DO UPDATE SET
+            unidades = {tabla}.unidades + excluded.unidades,
+            ingresos = ROUND({tabla}.ingresos + excluded.ingresos, 2),
+            pedidos = {tabla}.pedidos + excluded.pedidos
+    """
+
+
+def acumular_pedido(pedido, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) los items del pedido en el resumen
+    de su día. Las filas que quedan en cero se borran.
+    """
+    lineas = list(
+        ItemPedido.objects.filter(pedido=pedido).order_by()
+        .values('producto_id', 'producto__categoria_id')
+        .annotate(
+            unidades=Sum('cantidad'),
+            ingresos=Round(Sum(F('precio_unitario') * F('cantidad'), output_field=MONTO), 2),
+        )
+    )
+    if not lineas:
+        return
+
+    fecha = timezone.localdate(pedido.fecha_creacion)
+    parametros = []
+    for linea in lineas:
+        parametros += [
+            fecha,
+            linea['producto_id'],
+            linea['producto__categoria_id'],
+            signo * linea['unidades'],
+            str(signo * linea['ingresos']),
+            signo,
+        ]
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(_sql_acumular(len(lineas)), parametros)
+        if signo < 0:
+            VentaDiaria.objects.filter(
+                fecha=fecha,
+                producto_id__in=[linea['producto_id'] for linea in lineas],
+                pedidos__lte=0,
+            ).delete()
+
+
+def reconstruir(desde=None, tamanio_lote=500):
+    """
+    Recalcula el resumen desde los pedidos (todo, o desde la fecha
+    `desde`). Devuelve la cantidad de filas generadas.
+    """
+    items = ItemPedido.objects.filter(pedido__estado__in=ESTADOS_VENDIDOS)
+    if desde is not None:
+        items = items.filter(pedido__fecha_creacion__date__gte=desde)
+
+    filas = (
+        items.annotate(fecha=TruncDate('pedido__fecha_creacion'))
+        .order_by()
+        .values('fecha', 'producto_id', 'producto__categoria_id')
+        .annotate(
+            unidades_total=Sum('cantidad'),
+            ingresos_total=Round(Sum(F('precio_unitario') * F('cantidad'), output_field=MONTO), 2),
+            pedidos_total=Count('pedido', distinct=True),
+        )
+    )
+
+    total = 0
+    with transaction.atomic():
+        viejas = VentaDiaria.objects.all()
+        if desde is not None:
+            viejas = viejas.filter(fecha__gte=desde)
+        viejas.delete()
+
+        lote = []
+        for fila in filas.iterator(chunk_size=tamanio_lote):
+            lote.append(VentaDiaria(
+                fecha=fila['fecha'],
+                producto_id=fila['producto_id'],
+                categoria_id=fila['producto__categoria_id'],
+                unidades=fila['unidades_total'],
+                ingresos=fila['ingresos_total'],
+                pedidos=fila['pedidos_total'],
+            ))
+            if len(lote) >= tamanio_lote:
+                VentaDiaria.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            VentaDiaria.objects.bulk_create(lote)
+            total += len(lote)
+    return total
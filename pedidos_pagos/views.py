@@ -1,13 +1,17 @@
 import json
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.shortcuts import get_object_or_404
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from asgiref.sync import sync_to_async
 from django.db import transaction
 from tienda.models import Producto
 from .models import Pedido, ItemPedido, Pago
-from .services.mercadopago import crear_preferencia_pago
+from .services.mercadopago import CircuitoAbierto, ReservaVencida, crear_preferencia_pago_async
+from .services import pedidos
+from . import notificaciones, reservas
 from decimal import Decimal
 from carrito.models import Carrito, ItemCarrito
+from carrito.backends import obtener_backend
 from django.shortcuts import redirect
 from django.shortcuts import render
 from django.views.decorators.http import require_POST
@@ -32,65 +36,55 @@ def checkout_cliente_externo(request):
     if not items:
         return JsonResponse({"error": "No hay items"}, status=400)
 
-    pedido = Pedido.objects.create(
-        email=email,
-        telefono=telefono,
-        estado="pendiente"
-    )
-
-    total = 0
-
-    for item in items:
-        producto = get_object_or_404(Producto, id=item.get("producto_id"))
-        cantidad = int(item.get("cantidad", 1))
-
-        # ✅ VALIDACIONES CLAVE
-        if cantidad <= 0:
-            return JsonResponse(
-                {"error": "Cantidad inválida"},
-                status=400
-            )
-
-        if producto.stock < cantidad:
-            return JsonResponse(
-                {"error": f"Stock insuficiente para {producto.nombre}"},
-                status=400
-            )
-
-        ItemPedido.objects.create(
-            pedido=pedido,
-            producto=producto,
-            nombre_producto=producto.nombre,
-            precio_unitario=producto.precio,
-            cantidad=cantidad
+    # ✅ VALIDACIONES CLAVE (todas antes de crear nada)
+    try:
+        pedido = pedidos.crear_pedido(
+            pedidos.normalizar_lineas(items),
+            email=email,
+            telefono=telefono,
         )
-
-        total += producto.precio * cantidad
+    except pedidos.PedidoInvalido as e:
+        if e.no_encontrados:
+            return JsonResponse({"error": "Producto no encontrado", "productos": e.no_encontrados}, status=404)
+        return JsonResponse({"error": e.errores[0], "errores": e.errores}, status=400)
 
     return JsonResponse({
         "mensaje": "Pedido creado",
         "pedido_id": pedido.id,
-        "total": float(total)
+        "total": float(pedido.total_pago)
     })
 
 
 
 
-def pagar_pedido(request, pedido_id):
-    pedido = get_object_or_404(Pedido, id=pedido_id)
+async def pagar_pedido(request, pedido_id):
+    """
+    Vista async: bajo ASGI, mientras se espera a Mercado Pago el worker
+    sigue atendiendo otros requests (ver services/mercadopago.py).
+    """
+    pedido = await aget_object_or_404(Pedido, id=pedido_id)
 
     if pedido.estado != "pendiente":
         return redirect("pedido_exito")
 
     # 1️⃣ GET → mostrar página de pago
     if request.method == "GET":
-        return render(
+        # El template lee los items del pedido: se renderiza en un hilo
+        return await sync_to_async(render)(
             request,
             "pedidos_pagos/pagar_pedido.html",
             {"pedido": pedido}
         )
-    if request.method == "POST":
-     preferencia = crear_preferencia_pago(pedido)
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+
+    try:
+        preferencia = await crear_preferencia_pago_async(pedido)
+    except CircuitoAbierto as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except ReservaVencida:
+        # El stock ya no está apartado: hay que volver a hacer el checkout
+        return JsonResponse({"error": "La reserva del pedido venció, volvé a confirmar la compra"}, status=409)
 
     if preferencia is None:
         return JsonResponse(
@@ -122,63 +116,68 @@ def confirmar_pago(request, pago_id):
         return JsonResponse(
             {"error": "Método no permitido"},
             status=405)
-            
-            
-    pago = get_object_or_404(Pago, id=pago_id, estado="pendiente")
-    pedido = pago.pedido
-
-    # 1️⃣ Validar stock ANTES de tocar nada
-    for item in pedido.items.all():
-        if item.producto.stock < item.cantidad:
-            return JsonResponse(
-                {"error": f"Stock insuficiente para {item.producto.nombre}"},
-                status=400
-            )
-
-    # 2️⃣ Descontar stock
-    for item in pedido.items.all():
-        producto = item.producto
-        producto.stock -= item.cantidad
-        producto.save()
 
-    # 3️⃣ Marcar pago como aprobado
-    pago.estado = "aprobado"
-    pago.referencia_externa = f"PAGO-{pago.id}"
-    pago.save()
-
-    # 4️⃣ Marcar pedido como pagado
-    pedido.estado = "pagado"
-    pedido.save()
+    # Aprueba el pago y descuenta el stock con UPDATE ... WHERE stock >= n;
+    # si algún producto no alcanza no queda nada hecho
+    try:
+        pago = pedidos.confirmar_pago(pago_id)
+    except pedidos.PagoNoPendiente:
+        raise Http404("El pago no existe o ya fue procesado")
+    except reservas.StockInsuficiente as e:
+        nombre, disponible = e.faltantes[0]
+        return JsonResponse(
+            {
+                "error": f"Stock insuficiente para {nombre}",
+                "faltantes": [{"producto": n, "disponible": d} for n, d in e.faltantes],
+            },
+            status=400
+        )
 
     return JsonResponse({
         "mensaje": "Pago confirmado correctamente",
-        "pedido_id": pedido.id,
+        "pedido_id": pago.pedido_id,
         "pago_id": pago.id,
         "estado_pago": pago.estado
     })
 
 
 
+@csrf_exempt
+@require_POST
+def webhook_mercadopago(request):
+    """
+    Notificaciones de Mercado Pago. Solo se guardan (una repetida no se
+    guarda dos veces) y se responde enseguida; las procesa el comando
+    `procesar_notificaciones` (ver pedidos_pagos/notificaciones.py).
+    """
+    try:
+        cuerpo = json.loads(request.body.decode("utf-8") or "{}")
+    except (UnicodeDecodeError, ValueError):
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+
+    if not isinstance(cuerpo, dict):
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+
+    notificaciones.registrar(cuerpo, request.GET)
+    return JsonResponse({"recibida": True})
+
+
 @require_POST
 @transaction.atomic
 def crear_pedido_desde_carrito(request):
     """
     Crea un pedido a partir del carrito actual.
     """
-    # 1️⃣ Verificar sesión
-    if not request.session.session_key:
-        messages.error(request, "No hay sesión activa")
-        return redirect('catalogo')
+    # 1️⃣ Verificar que haya algo en el carrito
+    carrito = obtener_backend(request)
 
-    # 2️⃣ Obtener carrito
-    carrito = Carrito.objects.filter(
-        session_key=request.session.session_key
-    ).first()
-
-    if not carrito or not carrito.items.exists():
+    if not carrito.items.exists():
         messages.error(request, "Tu carrito está vacío")
         return redirect('carrito_ver')
 
+    # 2️⃣ Obtener carrito (si estaba en la sesión, recién acá se guarda en la base)
+    carrito = carrito.persistir()
+
     # 3️⃣ Verificar si ya tiene un pedido pendiente
     if hasattr(carrito, 'pedido'):
         pedido_existente = carrito.pedido
@@ -188,47 +187,23 @@ def crear_pedido_desde_carrito(request):
         # Si el pedido anterior no está pendiente, podemos crear uno nuevo
         # (continuamos con el flujo normal)
 
-    # 4️⃣ Validar stock ANTES de crear nada
-    items_con_problemas = []
-    for item in carrito.items.select_related('producto'):
-        if item.producto.stock < item.cantidad:
-            items_con_problemas.append(f"{item.producto.nombre} (stock: {item.producto.stock})")
-
-    if items_con_problemas:
-        messages.error(
-            request, 
-            f"Stock insuficiente: {', '.join(items_con_problemas)}"
-        )
-        return redirect('carrito_ver')
-
+    # 4️⃣ Crear pedido e items y reservar el stock hasta que se pague
+    # (valida todo antes; si algo no alcanza, no se crea nada)
     try:
-        # 5️⃣ Crear pedido
-        pedido = Pedido.objects.create(
-            carrito=carrito,
-            estado='pendiente'
-        )
-
-        # 6️⃣ Crear items del pedido
-        for item in carrito.items.select_related('producto'):
-            producto = item.producto
-            
-            ItemPedido.objects.create(
-                pedido=pedido,
-                producto=producto,
-                nombre_producto=producto.nombre,
-                precio_unitario=producto.precio,
-                cantidad=item.cantidad
-            )
-
-        messages.success(request, f"Pedido #{pedido.id} creado correctamente")
-        
-        # 7️⃣ Redirigir al pago
-        return redirect('pagar_pedido', pedido_id=pedido.id)
+        pedido = pedidos.crear_pedido_desde_carrito(carrito)
+    except pedidos.PedidoInvalido as e:
+        messages.error(request, str(e))
+        return redirect('carrito_ver')
 
     except Exception as e:
         messages.error(request, f"Error al crear el pedido: {str(e)}")
         return redirect('carrito_ver')
 
+    messages.success(request, f"Pedido #{pedido.id} creado correctamente")
+
+    # 5️⃣ Redirigir al pago
+    return redirect('pagar_pedido', pedido_id=pedido.id)
+
 def pedido_exito(request):
     return render(request, 'pedidos_pagos/pedido_exito.html')
 # pedidos_pagos/views.py
@@ -236,45 +211,37 @@ from django.db import transaction
 
 @transaction.atomic
 def checkout_view(request):
-    session_key = request.session.session_key
-    carrito = Carrito.objects.filter(session_key=session_key).first()
+    carrito = obtener_backend(request)
 
-    if not carrito or not carrito.items.exists():
+    if not carrito.items.exists():
         return redirect('catalogo')
 
     if request.method == 'POST':
         email = request.POST.get('email')
         telefono = request.POST.get('telefono')
-        total = sum(item.producto.precio * item.cantidad for item in carrito.items.all())
-
-        # SOLUCIÓN AL ERROR UNIQUE: update_or_create
-        # Buscamos si el carrito ya tiene un pedido, si existe lo actualizamos, sino lo creamos.
-        pedido, created = Pedido.objects.update_or_create(
-            carrito=carrito,
-            defaults={
-                'email': email,
-                'telefono': telefono,
-                'estado': 'pendiente',
-                'total_pago': total # O 'total' según tu modelo
-            }
-        )
 
-        # Limpiamos los items viejos del pedido para no duplicar si el usuario volvió atrás
-        ItemPedido.objects.filter(pedido=pedido).delete()
-
-        # Creamos los items actuales
-        for item in carrito.items.all():
-            ItemPedido.objects.create(
-                pedido=pedido,
-                producto=item.producto,
-                nombre_producto=item.producto.nombre,
-                precio_unitario=item.producto.precio,
-                cantidad=item.cantidad
+        # Si el carrito estaba en la sesión, recién acá se guarda en la base
+        carrito = carrito.persistir()
+
+        try:
+            # Si el carrito ya tiene un pedido (el usuario volvió atrás) se
+            # actualiza ese con los items actuales, sino se crea.
+            # El stock queda reservado hasta el pago; si no alcanza, no
+            # queda nada creado
+            pedido = pedidos.crear_pedido(
+                pedidos.lineas_del_carrito(carrito),
+                carrito=carrito,
+                email=email,
+                telefono=telefono,
+                reutilizar=True,
             )
+        except pedidos.PedidoInvalido as e:
+            messages.error(request, str(e))
+            return redirect('carrito_ver')
 
         return redirect('pagar_pedido', pedido_id=pedido.id)
 
-    subtotal = sum(item.producto.precio * item.cantidad for item in carrito.items.all())
+    subtotal = carrito.total()
     return render(request, 'pedidos_pagos/checkout.html', {
         'carrito': carrito,
         'subtotal': subtotal,
@@ -0,0 +1,259 @@
+# tienda/busqueda.py
+"""
+Búsqueda de productos con un índice FTS5 de SQLite.
+
+La tabla virtual `tienda_producto_fts` guarda nombre, descripción y
+categoría de cada producto (rowid = id del producto). Se mantiene al día
+con las señales de tienda/signals.py y se puede reconstruir con
+`python manage.py reconstruir_busqueda`.
+
+- El tokenizador `unicode61 remove_diacritics 2` pliega los acentos,
+  así "pantalon" encuentra "pantalón".
+- Cada palabra se busca como prefijo ("rem" encuentra "remera").
+- Los resultados se ordenan por BM25 (el nombre pesa más que la descripción)
+  y se pagina por cursor sobre (rango, id), sin tope de resultados.
+
+Si la base no es SQLite (ej: la config de MySQL comentada en settings)
+se vuelve al filtro con icontains de siempre.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .paginacion import (
+    ORDEN_POR_DEFECTO, PaginaCursor, armar_pagina, decodificar_cursor, paginar_por_cursor, tamanio_pagina,
+)
+
+TABLA_FTS = 'tienda_producto_fts'
+
+# Pesos BM25 por columna: nombre, descripcion, categoria
+PESOS_BM25 = (10.0, 1.0, 4.0)
+
+# Clave del cursor de los resultados: (rango BM25, id), de más a menos relevante
+COLUMNAS_BUSQUEDA = (('rango', False), ('pk', False))
+
+# Marcas internas para el resaltado: se reemplazan por <mark> después de escapar
+_INICIO_MARCA = '\x02'
+_FIN_MARCA = '\x03'
+
+SQL_CREAR_TABLA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+    "nombre, descripcion, categoria, "
+    "tokenize = 'unicode61 remove_diacritics 2', "
+    "prefix = '2 3')"
+)
+
+_SQL_INSERTAR = (
+    f"INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion, categoria) "
+    "SELECT p.id, p.nombre, COALESCE(p.descripcion, ''), c.nombre "
+    "FROM tienda_producto p INNER JOIN tienda_categoria c ON c.id = p.categoria_id"
+)
+
+
+def fts_disponible():
+    """El índice solo existe en SQLite"""
+    return connection.vendor == 'sqlite'
+
+
+def construir_consulta(texto):
+    """
+    Convierte lo que escribió el usuario en una consulta FTS5 segura.
+    Solo se usan palabras (nada de operadores), cada una como prefijo:
+        'remera neg' -> '"remera"* "neg"*'
+    """
+    palabras = re.findall(r'\w+', texto or '')
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+# ==================== MANTENIMIENTO DEL ÍNDICE ====================
+
+def indexar_productos(ids):
+    """(Re)indexa los productos indicados"""
+    ids = [int(i) for i in ids]
+    if not ids or not fts_disponible():
+        return
+    marcadores = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_FTS} WHERE rowid IN ({marcadores})", ids)
+        cursor.execute(f"{_SQL_INSERTAR} WHERE p.id IN ({marcadores})", ids)
+
+
+def indexar_categoria(categoria_id):
+    """Reindexa todos los productos de una categoría (ej: cambió el nombre)"""
+    if not fts_disponible():
+        return
+    subconsulta = "SELECT id FROM tienda_producto WHERE categoria_id = %s"
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_FTS} WHERE rowid IN ({subconsulta})", [categoria_id])
+        cursor.execute(f"{_SQL_INSERTAR} WHERE p.categoria_id = %s", [categoria_id])
+
+
+def eliminar_del_indice(ids):
+    ids = [int(i) for i in ids]
+    if not ids or not fts_disponible():
+        return
+    marcadores = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_FTS} WHERE rowid IN ({marcadores})", ids)
+
+
+def reconstruir_indice():
+    """Vacía y vuelve a llenar el índice completo. Devuelve la cantidad indexada"""
+    if not fts_disponible():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_CREAR_TABLA)
+        cursor.execute(f"DELETE FROM {TABLA_FTS}")
+        cursor.execute(_SQL_INSERTAR)
+        cursor.execute(f"INSERT INTO {TABLA_FTS} ({TABLA_FTS}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLA_FTS}")
+        return cursor.fetchone()[0]
+
+
+# ==================== CONSULTAS ====================
+
+def _resaltar(texto):
+    """Escapa el fragmento y convierte las marcas internas en <mark>"""
+    if not texto:
+        return ''
+    texto = escape(texto)
+    texto = texto.replace(_INICIO_MARCA, '<mark>').replace(_FIN_MARCA, '</mark>')
+    return mark_safe(texto)
+
+
+def filtrar_por_texto(queryset, texto):
+    """
+    Filtra un queryset de Producto por texto libre, respetando el orden
+    que ya tenga (lo usa la lista del panel admin).
+
+    Con el índice cada palabra se busca como inicio de palabra: "rem"
+    encuentra "Remera" pero "mera" no (antes, con icontains, se buscaba
+    el texto en cualquier parte). Sin SQLite se sigue usando icontains.
+    """
+    consulta = construir_consulta(texto)
+    if not consulta:
+        return queryset
+    if not fts_disponible():
+        return queryset.filter(
+            Q(nombre__icontains=texto) |
+            Q(descripcion__icontains=texto)
+        )
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s", [consulta])
+    )
+
+
+class _Resultado:
+    """Fila del índice: lo que necesita el cursor (rango BM25 e id)"""
+
+    def __init__(self, pk, rango):
+        self.pk = pk
+        self.rango = rango
+
+
+def _buscar_ids(consulta, solo_activos, cursor, tamanio):
+    """
+    Los ids de una página de resultados por relevancia (y su rango BM25),
+    con paginación por cursor sobre (rango, id) como en tienda/paginacion.py.
+    """
+    hacia_atras = False
+    parametros = [consulta]
+    filtro_cursor = ""
+    if cursor:
+        valores, direccion = decodificar_cursor(cursor, _orden_cursor(consulta), COLUMNAS_BUSQUEDA)
+        hacia_atras = direccion == 'ant'
+        operador = '<' if hacia_atras else '>'
+        filtro_cursor = f"AND (r.rango {operador} %s OR (r.rango = %s AND r.id {operador} %s))"
+        parametros += [valores[0], valores[0], valores[1]]
+
+    # Menor bm25 = más relevante
+    sentido = 'DESC' if hacia_atras else 'ASC'
+    pesos = ', '.join(str(p) for p in PESOS_BM25)
+    filtro_activo = "AND p.activo = 1" if solo_activos else ""
+    sql = (
+        f"SELECT r.id, r.rango FROM ("
+        f"SELECT rowid AS id, bm25({TABLA_FTS}, {pesos}) AS rango "
+        f"FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s"
+        f") r INNER JOIN tienda_producto p ON p.id = r.id "
+        f"WHERE 1 = 1 {filtro_activo} {filtro_cursor} "
+        f"ORDER BY r.rango {sentido}, r.id {sentido} "
+        f"LIMIT %s"
+    )
+    with connection.cursor() as cursor_db:
+        cursor_db.execute(sql, parametros + [tamanio + 1])
+        filas = [_Resultado(producto_id, rango) for producto_id, rango in cursor_db.fetchall()]
+    return armar_pagina(filas, tamanio, _orden_cursor(consulta), COLUMNAS_BUSQUEDA, cursor, hacia_atras)
+
+
+def _resaltados(consulta, ids):
+    """{id: (nombre resaltado, fragmento de la descripción)} de esos productos"""
+    if not ids:
+        return {}
+    marcadores = ', '.join(['%s'] * len(ids))
+    sql = (
+        f"SELECT rowid, "
+        f"highlight({TABLA_FTS}, 0, %s, %s), "
+        f"snippet({TABLA_FTS}, 1, %s, %s, '…', 12) "
+        f"FROM {TABLA_FTS} "
+        f"WHERE {TABLA_FTS} MATCH %s AND rowid IN ({marcadores})"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_INICIO_MARCA, _FIN_MARCA, _INICIO_MARCA, _FIN_MARCA, consulta, *ids])
+        return {producto_id: (nombre, fragmento) for producto_id, nombre, fragmento in cursor.fetchall()}
+
+
+def _orden_cursor(consulta):
+    # Un cursor solo sirve para la misma búsqueda
+    return f'busqueda:{consulta}'
+
+
+def buscar_productos(texto, solo_activos=True, cursor=None, por_pagina=None):
+    """
+    Busca productos ordenados por relevancia (BM25), de a una página.
+    Devuelve una PaginaCursor (ver tienda/paginacion.py) de TarjetaProducto
+    con dos atributos extra:
+        - nombre_resaltado: el nombre con las coincidencias en <mark>
+        - fragmento: un pedacito de la descripción con las coincidencias
+    Lanza CursorInvalido si el cursor es de otra búsqueda o está manipulado.
+    """
+    from .models import TarjetaProducto
+
+    consulta = construir_consulta(texto)
+    if not consulta:
+        return PaginaCursor([])
+
+    base = TarjetaProducto.objects.all()
+    if solo_activos:
+        base = base.filter(activo=True)
+
+    if not fts_disponible():
+        pagina = paginar_por_cursor(
+            base.filter(Q(nombre__icontains=texto) | Q(categoria_nombre__icontains=texto)),
+            orden=_orden_cursor(consulta), cursor=cursor, por_pagina=por_pagina,
+            columnas=ORDEN_POR_DEFECTO,
+        )
+        for producto in pagina:
+            producto.nombre_resaltado = producto.nombre
+            producto.fragmento = ''
+        return pagina
+
+    pagina = _buscar_ids(consulta, solo_activos, cursor, tamanio_pagina(por_pagina))
+    ids = [fila.pk for fila in pagina]
+    productos_por_id = base.in_bulk(ids)
+    resaltados = _resaltados(consulta, ids)
+
+    productos = []
+    for producto_id in ids:
+        producto = productos_por_id.get(producto_id)
+        if producto is None:
+            continue
+        nombre, fragmento = resaltados.get(producto_id, (producto.nombre, ''))
+        producto.nombre_resaltado = _resaltar(nombre)
+        producto.fragmento = _resaltar(fragmento)
+        productos.append(producto)
+    pagina.items = productos
+    return pagina
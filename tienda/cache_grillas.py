@@ -0,0 +1,122 @@
+# tienda/cache_grillas.py
+"""
+Cache de fragmentos HTML de las grillas de productos (catálogo e inicio).
+
+Cada fragmento se guarda con una clave que incluye un "sello de versión"
+de su ámbito: el nombre de la categoría, o TODAS para el catálogo
+completo y los destacados del inicio. Las señales de tienda/signals.py
+cambian el sello cuando se guarda o borra un Producto o una
+ImagenProducto; un cambio en una Categoria (ej: se renombra) cambia el
+sello GLOBAL, que forma parte de todas las claves. Las claves viejas
+simplemente dejan de usarse (expiran solas).
+
+Los sellos también vencen (DURACION_SELLO): si uno se pierde, el nuevo
+sale del reloj y solo se regeneran los fragmentos de ese ámbito. Con
+varios workers la cache tiene que ser la compartida (REDIS_URL, ver
+settings.CACHES) para que la invalidación de uno se vea en los demás.
+
+Lleva contadores de aciertos/fallos por proceso, en memoria: escribirlos
+en la cache compartida sería una escritura por cada página servida. Cada
+REGISTRAR_CADA consultas se deja una línea en el log (tienda.cache_grillas)
+para verificar en producción que la cache está sirviendo;
+`python manage.py estado_cache` muestra los del proceso del comando.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DURACION_FRAGMENTO = 60 * 60 * 6  # 6 horas
+DURACION_SELLO = 60 * 60 * 24     # más que un fragmento
+
+TODAS = '__todas__'
+GLOBAL = '__global__'
+
+REGISTRAR_CADA = 1000  # consultas a la cache entre cada línea de log
+
+_PREFIJO = 'grillas'
+
+_contadores = {'aciertos': 0, 'fallos': 0}
+_contadores_lock = threading.Lock()
+
+
+def _nuevo_sello():
+    # Basado en el reloj: si la cache pierde el sello, el nuevo nunca
+    # coincide con uno viejo y no revive fragmentos desactualizados
+    return int(time.time() * 1000)
+
+
+def _clave_sello(ambito):
+    digest = hashlib.md5(str(ambito).encode('utf-8')).hexdigest()
+    return f'{_PREFIJO}:sello:{digest}'
+
+
+def sello(ambito):
+    return cache.get_or_set(_clave_sello(ambito), _nuevo_sello, DURACION_SELLO)
+
+
+def invalidar(*ambitos):
+    """Cambia el sello de esos ámbitos y el del catálogo completo"""
+    claves = {_clave_sello(TODAS)}
+    claves.update(_clave_sello(a) for a in ambitos if a)
+    nuevo = _nuevo_sello()
+    cache.set_many({clave: nuevo for clave in claves}, DURACION_SELLO)
+
+
+def invalidar_todo():
+    """Descarta todos los fragmentos (cambió una categoría)"""
+    cache.set(_clave_sello(GLOBAL), _nuevo_sello(), DURACION_SELLO)
+
+
+def _contar(tipo):
+    with _contadores_lock:
+        _contadores[tipo] += 1
+        registrar = (_contadores['aciertos'] + _contadores['fallos']) % REGISTRAR_CADA == 0
+    if registrar:
+        datos = estadisticas()
+        logger.info(
+            'Cache de grillas: %d aciertos, %d fallos (%.1f%% de aciertos)',
+            datos['aciertos'], datos['fallos'], datos['tasa_aciertos'] * 100,
+        )
+
+
+def obtener_fragmento(ambito, partes, generar):
+    """
+    Devuelve el fragmento cacheado para (ámbito, partes) o lo genera.
+    `partes` identifica la variante (orden, cursor, filtros...).
+    `generar` es una función sin argumentos que arma el valor a guardar.
+    """
+    variante = hashlib.md5(repr(partes).encode('utf-8')).hexdigest()
+    ambito_hash = hashlib.md5(str(ambito).encode('utf-8')).hexdigest()
+    clave = f'{_PREFIJO}:{ambito_hash}:{sello(GLOBAL)}.{sello(ambito)}:{variante}'
+
+    valor = cache.get(clave)
+    if valor is not None:
+        _contar('aciertos')
+        return valor
+
+    _contar('fallos')
+    valor = generar()
+    cache.set(clave, valor, DURACION_FRAGMENTO)
+    return valor
+
+
+def estadisticas():
+    """Aciertos y fallos de este proceso desde que arrancó (o se reiniciaron)"""
+    with _contadores_lock:
+        aciertos, fallos = _contadores['aciertos'], _contadores['fallos']
+    total = aciertos + fallos
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'tasa_aciertos': (aciertos / total) if total else 0.0,
+    }
+
+
+def reiniciar_estadisticas():
+    with _contadores_lock:
+        _contadores.update(aciertos=0, fallos=0)
@@ -0,0 +1,120 @@
+# tienda/exportacion.py
+"""
+Exportación del catálogo en streaming para integraciones.
+
+Los productos se leen con `.iterator()` en tandas y se van escribiendo
+a la respuesta a medida que salen de la base, así la memoria del worker
+no depende del tamaño del catálogo.
+
+Formatos:
+    - json:   un array JSON (mismo contenido que antes)
+    - ndjson: un objeto JSON por línea
+
+El GET condicional (tienda/validadores.py) usa version(), un sello en
+cache que cambian las señales de tienda/signals.py y las escrituras que
+no las disparan (descuento de stock, importación): validar no consulta
+la tabla de productos.
+"""
+import json
+from datetime import datetime, time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+TAMANIO_TANDA = 2000
+DURACION_VERSION = 60 * 60 * 24
+
+_CLAVE_VERSION = 'exportacion:version'
+
+# Campos que se pueden pedir con ?campos=
+CAMPOS_EXPORTABLES = (
+    'id', 'nombre', 'descripcion', 'precio', 'stock', 'activo',
+    'categoria_id', 'categoria__nombre', 'creado', 'actualizado',
+)
+CAMPOS_POR_DEFECTO = ('id', 'nombre', 'descripcion', 'precio', 'stock', 'categoria__nombre')
+
+FORMATOS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+# ==================== VERSIÓN DE LOS DATOS ====================
+
+def _nueva_version():
+    # Del reloj (milisegundos), como los sellos de cache_grillas.py: si la
+    # versión se pierde, la nueva es posterior y nunca da un 304 viejo
+    return int(timezone.now().timestamp() * 1000)
+
+
+def version():
+    return cache.get_or_set(_CLAVE_VERSION, _nueva_version, DURACION_VERSION)
+
+
+def invalidar():
+    """Cambió algo exportable (alta, baja, stock, precio, categoría...)"""
+    cache.set(_CLAVE_VERSION, _nueva_version(), DURACION_VERSION)
+
+
+def leer_campos(valor):
+    """'id,nombre' -> ('id', 'nombre'); valida contra CAMPOS_EXPORTABLES"""
+    if not valor:
+        return CAMPOS_POR_DEFECTO
+    campos = tuple(c.strip() for c in valor.split(',') if c.strip())
+    invalidos = [c for c in campos if c not in CAMPOS_EXPORTABLES]
+    if invalidos or not campos:
+        raise ParametroInvalido(
+            f"Campos inválidos: {', '.join(invalidos)}. Permitidos: {', '.join(CAMPOS_EXPORTABLES)}"
+        )
+    return campos
+
+
+def leer_fecha(valor):
+    """Acepta fecha (2026-01-31) o fecha y hora ISO 8601"""
+    if not valor:
+        return None
+    try:
+        fecha = parse_datetime(valor)
+        dia = None if fecha else parse_date(valor)
+    except ValueError:
+        # Bien escrita pero no existe (2026-02-30)
+        raise ParametroInvalido(f'updated_since no es una fecha válida: {valor}')
+    if fecha is None:
+        if dia is None:
+            raise ParametroInvalido('updated_since debe ser una fecha ISO 8601')
+        fecha = datetime.combine(dia, time.min)
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
+
+def _a_json(fila):
+    return json.dumps(fila, cls=DjangoJSONEncoder)
+
+
+def generar_ndjson(filas):
+    for fila in filas:
+        yield _a_json(fila) + '\n'
+
+
+def generar_json(filas):
+    yield '['
+    primera = True
+    for fila in filas:
+        if primera:
+            primera = False
+            yield _a_json(fila)
+        else:
+            yield ', ' + _a_json(fila)
+    yield ']'
+
+
+def filas_productos(queryset, campos):
+    """Itera los productos en tandas, sin cargar todo en memoria"""
+    return queryset.order_by('id').values(*campos).iterator(chunk_size=TAMANIO_TANDA)
@@ -0,0 +1,310 @@
+# tienda/facetas.py
+"""
+Filtros con contadores (facetas) para el catálogo: talle, color,
+categoría y rango de precio, con la cantidad de productos por opción
+("M (34)").
+
+Para no recorrer las tablas M2M de talles/colores en cada visita, se
+arma un "índice de facetas" por categoría (3 consultas) y se guarda en
+cache. Con ese índice se calculan TODOS los contadores en una sola
+pasada en Python. Las señales de tienda/signals.py lo invalidan cuando
+cambian productos, talles o colores.
+
+Los contadores son "disyuntivos": las opciones de una faceta se cuentan
+aplicando los filtros de las OTRAS facetas, así elegir "M" no deja a
+"L" en cero.
+"""
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Producto, Categoria
+
+DURACION_CACHE = 60 * 60  # 1 hora (igual se invalida con las señales)
+DURACION_VERSION = 60 * 60 * 24
+
+_CLAVE_VERSION = 'facetas:version'
+
+# Rangos de precio fijos: (clave, etiqueta, desde, hasta)
+RANGOS_PRECIO = [
+    ('0-10000', 'Hasta $10.000', None, Decimal('10000')),
+    ('10000-25000', '$10.000 a $25.000', Decimal('10000'), Decimal('25000')),
+    ('25000-50000', '$25.000 a $50.000', Decimal('25000'), Decimal('50000')),
+    ('50000-', 'Más de $50.000', Decimal('50000'), None),
+]
+
+FACETAS = ('talle', 'color', 'categoria', 'precio')
+
+
+# ==================== CACHE E INVALIDACIÓN ====================
+
+def _nueva_version():
+    # Del reloj, como los sellos de cache_grillas.py: si la versión vence o
+    # se pierde, la nueva no coincide con una vieja y no revive índices
+    return int(time.time() * 1000)
+
+
+def _version():
+    return cache.get_or_set(_CLAVE_VERSION, _nueva_version, DURACION_VERSION)
+
+
+def _clave(categoria_id):
+    return f'facetas:v{_version()}:{categoria_id or "todas"}'
+
+
+def invalidar_categorias(categoria_ids):
+    """Descarta el índice de esas categorías y el del catálogo completo"""
+    claves = [_clave(None)]
+    claves += [_clave(categoria_id) for categoria_id in categoria_ids if categoria_id]
+    cache.delete_many(claves)
+
+
+def invalidar_todo():
+    """Cambio global (ej: se renombró un talle): se descartan todos los índices"""
+    cache.set(_CLAVE_VERSION, _nueva_version(), DURACION_VERSION)
+
+
+# ==================== ÍNDICE DE FACETAS ====================
+
+def _construir_indice(categoria_id):
+    productos = Producto.objects.all()
+    TalleProducto = Producto.talles.through
+    ColorProducto = Producto.colores.through
+    talles_qs = TalleProducto.objects.all()
+    colores_qs = ColorProducto.objects.all()
+    if categoria_id:
+        productos = productos.filter(categoria_id=categoria_id)
+        talles_qs = talles_qs.filter(producto__categoria_id=categoria_id)
+        colores_qs = colores_qs.filter(producto__categoria_id=categoria_id)
+
+    talles_por_producto = {}
+    nombres_talles = {}
+    for producto_id, talle_id, nombre in talles_qs.values_list('producto_id', 'talle_id', 'talle__nombre'):
+        talles_por_producto.setdefault(producto_id, set()).add(talle_id)
+        nombres_talles[talle_id] = nombre
+
+    colores_por_producto = {}
+    nombres_colores = {}
+    for producto_id, color_id, nombre, hex_ in colores_qs.values_list(
+        'producto_id', 'color_id', 'color__nombre', 'color__codigo_hex'
+    ):
+        colores_por_producto.setdefault(producto_id, set()).add(color_id)
+        nombres_colores[color_id] = (nombre, hex_)
+
+    filas = []
+    nombres_categorias = {}
+    for producto_id, precio, cat_id, cat_nombre in productos.order_by().values_list(
+        'id', 'precio', 'categoria_id', 'categoria__nombre'
+    ):
+        nombres_categorias[cat_id] = cat_nombre
+        filas.append((
+            producto_id,
+            _rango_de(precio),
+            cat_id,
+            frozenset(talles_por_producto.get(producto_id, ())),
+            frozenset(colores_por_producto.get(producto_id, ())),
+        ))
+
+    return {
+        'filas': filas,
+        'talles': nombres_talles,
+        'colores': nombres_colores,
+        'categorias': nombres_categorias,
+    }
+
+
+def indice_facetas(categoria_id=None):
+    """Devuelve el índice de la categoría (de la cache si está)"""
+    clave = _clave(categoria_id)
+    indice = cache.get(clave)
+    if indice is None:
+        indice = _construir_indice(categoria_id)
+        cache.set(clave, indice, DURACION_CACHE)
+    return indice
+
+
+def _rango_de(precio):
+    for clave, _, desde, hasta in RANGOS_PRECIO:
+        if (desde is None or precio >= desde) and (hasta is None or precio < hasta):
+            return clave
+    return None
+
+
+# ==================== FILTROS ====================
+
+def _ids(valores):
+    ids = set()
+    for valor in valores:
+        try:
+            ids.add(int(valor))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def leer_filtros(params):
+    """Lee los filtros de request.GET (?talle=1&talle=2&color=3&precio=0-10000)"""
+    claves_rango = {clave for clave, *_ in RANGOS_PRECIO}
+    return {
+        'talle': _ids(params.getlist('talle')),
+        'color': _ids(params.getlist('color')),
+        'categoria': _ids(params.getlist('categoria')),
+        'precio': {r for r in params.getlist('precio') if r in claves_rango},
+    }
+
+
+def aplicar_filtros(queryset, filtros):
+    """Aplica los filtros en SQL (EXISTS sobre las tablas M2M, sin DISTINCT)"""
+    if filtros['talle']:
+        queryset = queryset.filter(Exists(Producto.talles.through.objects.filter(
+            producto_id=OuterRef('pk'), talle_id__in=filtros['talle']
+        )))
+    if filtros['color']:
+        queryset = queryset.filter(Exists(Producto.colores.through.objects.filter(
+            producto_id=OuterRef('pk'), color_id__in=filtros['color']
+        )))
+    if filtros['categoria']:
+        queryset = queryset.filter(categoria_id__in=filtros['categoria'])
+    if filtros['precio']:
+        rangos = [r for r in RANGOS_PRECIO if r[0] in filtros['precio']]
+        condicion = Q()
+        for _, _, desde, hasta in rangos:
+            condicion |= _q_rango(desde, hasta)
+        queryset = queryset.filter(condicion)
+    return queryset
+
+
+def _q_rango(desde, hasta):
+    q = Q()
+    if desde is not None:
+        q &= Q(precio__gte=desde)
+    if hasta is not None:
+        q &= Q(precio__lt=hasta)
+    return q
+
+
+# ==================== CONTADORES ====================
+
+def _no_cumple(fila, filtros):
+    """Devuelve las facetas cuyo filtro NO cumple la fila"""
+    _, rango, cat_id, talles, colores = fila
+    fallas = []
+    if filtros['talle'] and not (talles & filtros['talle']):
+        fallas.append('talle')
+    if filtros['color'] and not (colores & filtros['color']):
+        fallas.append('color')
+    if filtros['categoria'] and cat_id not in filtros['categoria']:
+        fallas.append('categoria')
+    if filtros['precio'] and rango not in filtros['precio']:
+        fallas.append('precio')
+    return fallas
+
+
+def contar_facetas(indice, filtros):
+    """
+    Una sola pasada sobre el índice:
+    - si la fila cumple todos los filtros, suma en todas las facetas;
+    - si falla en exactamente una faceta, suma solo en esa
+      (es lo que se vería al cambiar la selección de esa faceta).
+    """
+    conteos = {faceta: {} for faceta in FACETAS}
+    total = 0
+
+    for fila in indice['filas']:
+        fallas = _no_cumple(fila, filtros)
+        if len(fallas) > 1:
+            continue
+        if not fallas:
+            total += 1
+            facetas = FACETAS
+        else:
+            facetas = fallas
+
+        _, rango, cat_id, talles, colores = fila
+        for faceta in facetas:
+            if faceta == 'talle':
+                valores = talles
+            elif faceta == 'color':
+                valores = colores
+            elif faceta == 'categoria':
+                valores = (cat_id,)
+            else:
+                valores = (rango,) if rango else ()
+            contador = conteos[faceta]
+            for valor in valores:
+                contador[valor] = contador.get(valor, 0) + 1
+
+    return total, conteos
+
+
+def _opciones(nombres, conteos, seleccion):
+    opciones = []
+    for valor_id, nombre in sorted(nombres.items(), key=lambda item: str(item[1])):
+        opcion = {
+            'id': valor_id,
+            'nombre': nombre,
+            'cantidad': conteos.get(valor_id, 0),
+            'seleccionado': valor_id in seleccion,
+        }
+        if isinstance(nombre, tuple):
+            opcion['nombre'], opcion['codigo_hex'] = nombre
+        opciones.append(opcion)
+    return opciones
+
+
+class ResultadoFacetas:
+    """Productos filtrados (queryset sin evaluar) + contadores por faceta"""
+
+    def __init__(self, productos, total, facetas, filtros):
+        self.productos = productos
+        self.total = total
+        self.facetas = facetas
+        self.filtros = filtros
+
+    @property
+    def hay_filtros(self):
+        return any(self.filtros.values())
+
+
+def filtrar_catalogo(queryset, params, nombre_categoria=None):
+    """
+    Punto de entrada del catálogo: aplica los filtros de `params` al
+    queryset y devuelve un ResultadoFacetas con los contadores.
+    """
+    categoria_id = None
+    if nombre_categoria:
+        categoria_id = Categoria.objects.filter(nombre=nombre_categoria).values_list('id', flat=True).first()
+
+    filtros = leer_filtros(params)
+    if nombre_categoria:
+        # Dentro de una categoría la faceta de categoría no tiene sentido
+        filtros['categoria'] = set()
+
+    if nombre_categoria and categoria_id is None:
+        indice = {'filas': [], 'talles': {}, 'colores': {}, 'categorias': {}}
+    else:
+        indice = indice_facetas(categoria_id)
+
+    total, conteos = contar_facetas(indice, filtros)
+
+    etiquetas_precio = {clave: etiqueta for clave, etiqueta, *_ in RANGOS_PRECIO}
+    facetas = {
+        'talles': _opciones(indice['talles'], conteos['talle'], filtros['talle']),
+        'colores': _opciones(indice['colores'], conteos['color'], filtros['color']),
+        'categorias': [] if nombre_categoria else _opciones(
+            indice['categorias'], conteos['categoria'], filtros['categoria']
+        ),
+        'precios': [
+            {
+                'id': clave,
+                'nombre': etiquetas_precio[clave],
+                'cantidad': conteos['precio'].get(clave, 0),
+                'seleccionado': clave in filtros['precio'],
+            }
+            for clave, *_ in RANGOS_PRECIO
+        ],
+    }
+
+    return ResultadoFacetas(aplicar_filtros(queryset, filtros), total, facetas, filtros)
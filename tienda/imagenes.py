@@ -0,0 +1,204 @@
+# tienda/imagenes.py
+"""
+Variantes redimensionadas de las fotos (WebP + JPEG) para no servir el
+original de varios MB en cada grilla.
+
+- ImagenProducto: thumb / card / detail / zoom (sin agrandar el original).
+- Categoria.imagen_fondo: card (600x400, recortada) y detail (1200x800).
+
+Las variantes se generan con Pillow en un pool de procesos, fuera del
+hilo del request: las señales de tienda/signals.py encolan el trabajo
+cuando se sube una imagen y, al terminar, se guardan las rutas en el
+campo `variantes` del modelo (en una ImagenProducto eso vuelve a
+disparar las señales que actualizan la tarjeta y la cache de grillas).
+
+El comando `generar_variantes` procesa las imágenes que ya existían.
+
+Formato guardado en el JSONField:
+    {
+        'original': 'productos/foto.jpg',
+        'card': {'jpg': 'variantes/productos/foto_card.jpg',
+                 'webp': 'variantes/productos/foto_card.webp', 'ancho': 480},
+        ...
+    }
+
+OJO: las funciones de procesamiento no usan Django (corren en otro
+proceso); los modelos se importan adentro de las funciones.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# nombre: (ancho, alto, recortar)
+VARIANTES_PRODUCTO = {
+    'thumb': (160, 160, True),
+    'card': (480, 600, False),
+    'detail': (960, 1200, False),
+    'zoom': (1800, 2250, False),
+}
+
+VARIANTES_CATEGORIA = {
+    'card': (600, 400, True),
+    'detail': (1200, 800, True),
+}
+
+CARPETA_VARIANTES = 'variantes'
+CALIDAD_JPEG = 82
+CALIDAD_WEBP = 80
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# ==================== PROCESAMIENTO (sin Django) ====================
+
+def _nombre_variante(nombre_original, variante, extension):
+    base, _ = os.path.splitext(nombre_original)
+    return f'{CARPETA_VARIANTES}/{base}_{variante}.{extension}'
+
+
+def procesar_imagen(raiz_media, nombre_original, especificacion):
+    """
+    Genera todas las variantes de una imagen. Corre en un proceso del pool.
+    Devuelve el dict para el campo `variantes` (rutas relativas a MEDIA_ROOT).
+    """
+    from PIL import Image, ImageOps
+
+    resultado = {'original': nombre_original}
+    with Image.open(os.path.join(raiz_media, nombre_original)) as original:
+        # Las fotos de celular vienen rotadas por EXIF
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'L'):
+            fondo = Image.new('RGB', original.size, (255, 255, 255))
+            fondo.paste(original, mask=original.convert('RGBA').getchannel('A'))
+            original = fondo
+        elif original.mode == 'L':
+            original = original.convert('RGB')
+
+        for variante, (ancho, alto, recortar) in especificacion.items():
+            if recortar:
+                imagen = ImageOps.fit(original, (ancho, alto), Image.Resampling.LANCZOS)
+            else:
+                imagen = original.copy()
+                imagen.thumbnail((ancho, alto), Image.Resampling.LANCZOS)
+
+            rutas = {}
+            for extension, opciones in (
+                ('jpg', {'format': 'JPEG', 'quality': CALIDAD_JPEG, 'optimize': True, 'progressive': True}),
+                ('webp', {'format': 'WEBP', 'quality': CALIDAD_WEBP, 'method': 4}),
+            ):
+                nombre = _nombre_variante(nombre_original, variante, extension)
+                destino = os.path.join(raiz_media, nombre)
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                imagen.save(destino, **opciones)
+                rutas[extension] = nombre
+
+            resultado[variante] = {**rutas, 'ancho': imagen.width}
+
+    return resultado
+
+
+def borrar_variantes(raiz_media, variantes):
+    for datos in (variantes or {}).values():
+        if not isinstance(datos, dict):
+            continue
+        for clave in ('jpg', 'webp'):
+            if datos.get(clave):
+                try:
+                    os.remove(os.path.join(raiz_media, datos[clave]))
+                except FileNotFoundError:
+                    pass
+
+
+# ==================== POOL Y GUARDADO ====================
+
+def _procesos():
+    from django.conf import settings
+    # IMAGENES_PROCESOS = 0 procesa en el mismo hilo (útil en tests / desarrollo)
+    return getattr(settings, 'IMAGENES_PROCESOS', 2)
+
+
+def obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_procesos() or None)
+        return _pool
+
+
+def campos_imagen(modelo):
+    """(campo de imagen, campo de variantes, especificación) de cada modelo"""
+    from .models import Categoria
+    if modelo is Categoria:
+        return 'imagen_fondo', 'imagen_fondo_variantes', VARIANTES_CATEGORIA
+    return 'imagen', 'variantes', VARIANTES_PRODUCTO
+
+
+def necesita_variantes(instancia):
+    campo_imagen, campo_variantes, _ = campos_imagen(type(instancia))
+    archivo = getattr(instancia, campo_imagen)
+    return bool(archivo) and getattr(instancia, campo_variantes).get('original') != archivo.name
+
+
+def guardar_variantes(modelo, pk, variantes):
+    """
+    Guarda el resultado si la imagen sigue siendo la misma (pudo
+    cambiar mientras se procesaba). En una ImagenProducto save() dispara
+    las señales que actualizan la tarjeta del producto y la cache de
+    grillas; en una Categoria las señales ignoran un guardado de solo las
+    variantes (no reindexan ni invalidan nada).
+
+    Si se reemplazó la imagen, las variantes de la anterior se borran
+    recién después de guardar las nuevas: hasta ese momento son las que
+    muestran la tarjeta y la página.
+    """
+    from django.conf import settings
+
+    campo_imagen, campo_variantes, _ = campos_imagen(modelo)
+    instancia = modelo.objects.filter(pk=pk).first()
+    if instancia is None or getattr(instancia, campo_imagen).name != variantes['original']:
+        borrar_variantes(settings.MEDIA_ROOT, variantes)
+        return False
+    anteriores = getattr(instancia, campo_variantes)
+    setattr(instancia, campo_variantes, variantes)
+    instancia.save(update_fields=[campo_variantes])
+    # Con el mismo nombre de archivo las rutas son las mismas: ya se pisaron
+    if anteriores and anteriores.get('original') != variantes['original']:
+        borrar_variantes(settings.MEDIA_ROOT, anteriores)
+    return True
+
+
+def _al_terminar(modelo, pk):
+    def callback(futuro):
+        from django.db import connection
+        try:
+            guardar_variantes(modelo, pk, futuro.result())
+        except Exception:
+            logger.exception('No se pudieron generar las variantes de %s #%s', modelo.__name__, pk)
+        finally:
+            # Corre en un hilo del pool: no dejamos la conexión abierta
+            connection.close()
+    return callback
+
+
+def encolar(instancia):
+    """Genera las variantes de la imagen en segundo plano"""
+    from django.conf import settings
+
+    modelo = type(instancia)
+    campo_imagen, _, especificacion = campos_imagen(modelo)
+    nombre = getattr(instancia, campo_imagen).name
+    argumentos = (str(settings.MEDIA_ROOT), nombre, especificacion)
+
+    if not _procesos():
+        try:
+            guardar_variantes(modelo, instancia.pk, procesar_imagen(*argumentos))
+        except Exception:
+            logger.exception('No se pudieron generar las variantes de %s #%s', modelo.__name__, instancia.pk)
+        return
+
+    futuro = obtener_pool().submit(procesar_imagen, *argumentos)
+    futuro.add_done_callback(_al_terminar(modelo, instancia.pk))
@@ -0,0 +1,326 @@
+# tienda/importacion.py
+"""
+Importación masiva de productos desde planillas de proveedores.
+
+Lee un CSV o un NDJSON fila por fila (sin cargarlo entero en memoria) y
+procesa tandas de TAMANIO_LOTE filas:
+
+1. Valida cada fila; las que tienen errores se informan y se saltean
+   (el resto sigue).
+2. Crea las categorías, talles y colores que falten (una consulta para
+   buscarlas y un bulk_create por tipo).
+3. Busca los productos existentes de la tanda (por `id` o por
+   nombre + categoría) con una sola consulta y hace bulk_create de los
+   nuevos y un upsert en bulk de los existentes.
+4. Reemplaza las filas de las tablas intermedias de talles/colores en bulk.
+5. Como bulk_* no dispara señales, actualiza a mano lo derivado:
+   índice de búsqueda y tarjetas de la tanda; al final se invalidan las
+   facetas y la cache de grillas.
+
+Columnas (CSV con encabezado, o claves del objeto en NDJSON):
+    id (opcional), nombre, categoria, precio, stock, descripcion,
+    activo, talles, colores
+`talles` y `colores` son listas separadas por "|" (ej: "S|M|L"); en
+NDJSON también pueden venir como lista. Si la columna no está, los
+talles/colores del producto no se tocan.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Producto, Categoria, Talle, Color
+from . import busqueda, tarjetas, facetas, cache_grillas, exportacion
+
+TAMANIO_LOTE = 1000
+MAXIMO_ERRORES_GUARDADOS = 500
+
+SEPARADOR_LISTAS = '|'
+
+CAMPOS_ACTUALIZABLES = ['categoria', 'nombre', 'precio', 'stock', 'descripcion', 'activo', 'actualizado']
+
+VALORES_VERDADEROS = {'1', 'true', 'si', 'sí', 'yes', 'x', 'activo'}
+VALORES_FALSOS = {'0', 'false', 'no', 'inactivo'}
+
+
+class ErrorFila(ValueError):
+    pass
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.filas = 0
+        self.creados = 0
+        self.actualizados = 0
+        self.cantidad_errores = 0
+        self.errores = []  # (línea, mensaje), a lo sumo MAXIMO_ERRORES_GUARDADOS
+
+    def agregar_error(self, linea, mensaje):
+        self.cantidad_errores += 1
+        if len(self.errores) < MAXIMO_ERRORES_GUARDADOS:
+            self.errores.append((linea, mensaje))
+
+
+# ==================== LECTURA ====================
+
+def leer_csv(texto):
+    """Itera (línea, dict) de un archivo de texto CSV con encabezado"""
+    lector = csv.DictReader(texto)
+    for fila in lector:
+        yield lector.line_num, fila
+
+
+def leer_ndjson(texto):
+    """Itera (línea, dict) de un archivo con un objeto JSON por línea"""
+    for numero, linea in enumerate(texto, start=1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            yield numero, ErrorFila('JSON inválido')
+            continue
+        yield numero, fila if isinstance(fila, dict) else ErrorFila('Se esperaba un objeto JSON')
+
+
+LECTORES = {
+    'csv': leer_csv,
+    'ndjson': leer_ndjson,
+}
+
+
+def formato_de(nombre_archivo):
+    return 'ndjson' if nombre_archivo.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+# ==================== VALIDACIÓN ====================
+
+def _texto(fila, campo, maximo, requerido=False):
+    valor = fila.get(campo)
+    valor = '' if valor is None else str(valor).strip()
+    if requerido and not valor:
+        raise ErrorFila(f'Falta "{campo}"')
+    if len(valor) > maximo:
+        raise ErrorFila(f'"{campo}" supera los {maximo} caracteres')
+    return valor
+
+
+def _lista(fila, campo, maximo):
+    """None si la columna no vino; si no, la lista de nombres sin repetir"""
+    if campo not in fila or fila[campo] is None:
+        return None
+    valor = fila[campo]
+    if isinstance(valor, str):
+        valor = valor.split(SEPARADOR_LISTAS)
+    nombres = []
+    for nombre in valor:
+        nombre = str(nombre).strip()
+        if not nombre:
+            continue
+        if len(nombre) > maximo:
+            raise ErrorFila(f'"{nombre}" en {campo} supera los {maximo} caracteres')
+        if nombre not in nombres:
+            nombres.append(nombre)
+    return nombres
+
+
+def _booleano(valor):
+    if valor is None or valor == '':
+        return True
+    if isinstance(valor, bool):
+        return valor
+    valor = str(valor).strip().lower()
+    if valor in VALORES_VERDADEROS:
+        return True
+    if valor in VALORES_FALSOS:
+        return False
+    raise ErrorFila(f'"activo" inválido: {valor}')
+
+
+def validar_fila(fila):
+    """Convierte la fila cruda en datos limpios o lanza ErrorFila"""
+    datos = {
+        'nombre': _texto(fila, 'nombre', 150, requerido=True),
+        'categoria': _texto(fila, 'categoria', 100, requerido=True),
+        'descripcion': _texto(fila, 'descripcion', 10_000),
+        'activo': _booleano(fila.get('activo')),
+        'talles': _lista(fila, 'talles', 10),
+        'colores': _lista(fila, 'colores', 30),
+    }
+
+    try:
+        precio = Decimal(str(fila.get('precio', '')).strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ErrorFila('"precio" no es un número')
+    if not precio.is_finite() or precio <= 0 or precio >= Decimal('1e8'):
+        raise ErrorFila('"precio" debe ser mayor a 0')
+    datos['precio'] = precio.quantize(Decimal('0.01'))
+
+    try:
+        datos['stock'] = int(str(fila.get('stock') or 0).strip())
+    except ValueError:
+        raise ErrorFila('"stock" no es un número entero')
+    if datos['stock'] < 0:
+        raise ErrorFila('"stock" no puede ser negativo')
+
+    identificador = fila.get('id')
+    if identificador not in (None, ''):
+        try:
+            datos['id'] = int(identificador)
+        except (TypeError, ValueError):
+            raise ErrorFila('"id" inválido')
+
+    return datos
+
+
+# ==================== CATÁLOGOS AUXILIARES ====================
+
+def _obtener_o_crear(modelo, nombres):
+    """{nombre: id} creando en bulk los que falten"""
+    if not nombres:
+        return {}
+    existentes = {}
+    for pk, nombre in modelo.objects.filter(nombre__in=nombres).order_by('-pk').values_list('pk', 'nombre'):
+        existentes[nombre] = pk  # si hay repetidos (talles/colores no son únicos) gana el más viejo
+    faltantes = [modelo(nombre=nombre) for nombre in nombres if nombre not in existentes]
+    for nuevo in modelo.objects.bulk_create(faltantes):
+        existentes[nuevo.nombre] = nuevo.pk
+    return existentes
+
+
+# ==================== PROCESAMIENTO DE UNA TANDA ====================
+
+def _guardar_lote(lote, resultado):
+    """`lote` es una lista de (línea, datos validados)"""
+    categorias = _obtener_o_crear(Categoria, {d['categoria'] for _, d in lote})
+    talles = _obtener_o_crear(Talle, {t for _, d in lote for t in d['talles'] or ()})
+    colores = _obtener_o_crear(Color, {c for _, d in lote for c in d['colores'] or ()})
+
+    # Productos existentes: por id o por (nombre, categoría), en una sola consulta
+    ids = {d['id'] for _, d in lote if 'id' in d}
+    nombres = {d['nombre'] for _, d in lote if 'id' not in d}
+    existentes_por_id = {}
+    existentes_por_clave = {}
+    for producto in Producto.objects.filter(id__in=ids) | Producto.objects.filter(nombre__in=nombres):
+        existentes_por_id[producto.id] = producto
+        existentes_por_clave.setdefault((producto.nombre, producto.categoria_id), producto)
+
+    ahora = timezone.now()
+    nuevos = {}
+    actualizados = {}
+    relaciones = []  # (producto, talles, colores)
+    for linea, datos in lote:
+        categoria_id = categorias[datos['categoria']]
+        clave = (datos['nombre'], categoria_id)
+        if 'id' in datos:
+            producto = existentes_por_id.get(datos['id'])
+            if producto is None:
+                resultado.agregar_error(linea, f"No existe el producto con id {datos['id']}")
+                continue
+        else:
+            producto = existentes_por_clave.get(clave) or nuevos.get(clave)
+
+        if producto is None:
+            producto = Producto()
+            nuevos[clave] = producto
+        elif producto.pk:
+            actualizados[producto.pk] = producto
+
+        producto.categoria_id = categoria_id
+        producto.nombre = datos['nombre']
+        producto.precio = datos['precio']
+        producto.stock = datos['stock']
+        producto.descripcion = datos['descripcion']
+        producto.activo = datos['activo']
+        producto.actualizado = ahora
+        relaciones.append((producto, datos['talles'], datos['colores']))
+
+    with transaction.atomic():
+        Producto.objects.bulk_create(nuevos.values())
+        # Equivale a bulk_update, pero en un solo INSERT ... ON CONFLICT(id) DO UPDATE
+        # (bulk_update arma un CASE WHEN por campo y fila: en SQLite es varias veces más lento)
+        Producto.objects.bulk_create(
+            actualizados.values(), update_conflicts=True,
+            unique_fields=['id'], update_fields=CAMPOS_ACTUALIZABLES,
+        )
+        _guardar_relaciones(Producto.talles.through, 'talle_id', relaciones, 1, talles)
+        _guardar_relaciones(Producto.colores.through, 'color_id', relaciones, 2, colores)
+
+        ids_lote = [p.pk for p in nuevos.values()] + list(actualizados)
+        busqueda.indexar_productos(ids_lote)
+        tarjetas.actualizar_sin_imagen(ids_lote)
+
+    resultado.creados += len(nuevos)
+    resultado.actualizados += len(actualizados)
+
+
+def _guardar_relaciones(intermedia, campo, relaciones, posicion, ids_por_nombre):
+    """Reemplaza talles o colores de los productos que traían la columna"""
+    por_producto = {}
+    for relacion in relaciones:
+        nombres = relacion[posicion]
+        if nombres is not None:
+            por_producto[relacion[0].pk] = nombres  # la última fila del producto gana
+    if not por_producto:
+        return
+    intermedia.objects.filter(producto_id__in=list(por_producto)).delete()
+
+    # Son miles de filas de dos enteros: executemany directo, sin armar
+    # una instancia del modelo intermedio por fila
+    tabla = connection.ops.quote_name(intermedia._meta.db_table)
+    filas = [
+        (producto_id, ids_por_nombre[nombre])
+        for producto_id, nombres in por_producto.items()
+        for nombre in nombres
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {tabla} (producto_id, {campo}) VALUES (%s, %s)", filas
+        )
+
+
+# ==================== ENTRADA ====================
+
+def importar_productos(filas, tamanio_lote=TAMANIO_LOTE, al_avanzar=None):
+    """
+    Importa las filas de un lector (ver LECTORES). Devuelve un
+    ResultadoImportacion; los errores de una fila no frenan el resto.
+    `al_avanzar(resultado)` se llama después de cada tanda.
+    """
+    resultado = ResultadoImportacion()
+    lote = []
+
+    def procesar():
+        try:
+            _guardar_lote(lote, resultado)
+        except Exception as e:
+            # Error de base en la tanda (ej: dato que pasó la validación): se
+            # informa en todas sus filas y se sigue con la siguiente
+            for linea, _ in lote:
+                resultado.agregar_error(linea, f'No se pudo guardar la tanda: {e}')
+        lote.clear()
+        if al_avanzar:
+            al_avanzar(resultado)
+
+    for linea, fila in filas:
+        resultado.filas += 1
+        try:
+            if isinstance(fila, ErrorFila):
+                raise fila
+            lote.append((linea, validar_fila(fila)))
+        except ErrorFila as e:
+            resultado.agregar_error(linea, str(e))
+            continue
+        if len(lote) >= tamanio_lote:
+            procesar()
+    if lote:
+        procesar()
+
+    if resultado.creados or resultado.actualizados:
+        facetas.invalidar_todo()
+        cache_grillas.invalidar_todo()
+        exportacion.invalidar()
+    return resultado
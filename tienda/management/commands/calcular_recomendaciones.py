@@ -0,0 +1,23 @@
+# tienda/management/commands/calcular_recomendaciones.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from tienda.recomendaciones import calcular_recomendaciones, TOP_K
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los productos relacionados a partir del historial de pedidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_K, help='Cantidad de relacionados por producto')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Calculando recomendaciones...")
+        inicio = time.monotonic()
+        totales = calcular_recomendaciones(k=options['top'])
+        segundos = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {totales['compras']} por compras conjuntas, "
+            f"{totales['categoria']} por categoría ({segundos:.1f}s)"
+        ))
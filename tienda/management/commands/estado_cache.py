@@ -0,0 +1,25 @@
+# tienda/management/commands/estado_cache.py
+from django.core.management.base import BaseCommand
+
+from tienda import cache_grillas
+
+
+class Command(BaseCommand):
+    help = 'Muestra los aciertos/fallos de la cache de grillas de productos (los de este proceso)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reiniciar', action='store_true', help='Pone los contadores en cero')
+        parser.add_argument('--invalidar', action='store_true', help='Descarta todos los fragmentos cacheados')
+
+    def handle(self, *args, **options):
+        datos = cache_grillas.estadisticas()
+        self.stdout.write(f"Aciertos: {datos['aciertos']}")
+        self.stdout.write(f"Fallos:   {datos['fallos']}")
+        self.stdout.write(f"Tasa de aciertos: {datos['tasa_aciertos']:.1%}")
+
+        if options['invalidar']:
+            cache_grillas.invalidar_todo()
+            self.stdout.write(self.style.SUCCESS('✓ Fragmentos invalidados'))
+        if options['reiniciar']:
+            cache_grillas.reiniciar_estadisticas()
+            self.stdout.write(self.style.SUCCESS('✓ Contadores reiniciados'))
@@ -0,0 +1,47 @@
+# tienda/management/commands/generar_variantes.py
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tienda import imagenes
+from tienda.models import Categoria, ImagenProducto
+
+
+class Command(BaseCommand):
+    help = 'Genera las variantes WebP/JPEG de las imágenes de productos y categorías ya subidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Regenera también las que ya tienen variantes')
+
+    def _pendientes(self, todas):
+        for modelo, campo in ((ImagenProducto, 'imagen'), (Categoria, 'imagen_fondo')):
+            for instancia in modelo.objects.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True}).iterator():
+                if todas or imagenes.necesita_variantes(instancia):
+                    yield instancia
+
+    def handle(self, *args, **options):
+        pool = imagenes.obtener_pool()
+        trabajos = {}
+        for instancia in self._pendientes(options['todas']):
+            campo_imagen, _, especificacion = imagenes.campos_imagen(type(instancia))
+            futuro = pool.submit(
+                imagenes.procesar_imagen,
+                str(settings.MEDIA_ROOT), getattr(instancia, campo_imagen).name, especificacion,
+            )
+            trabajos[futuro] = instancia
+
+        self.stdout.write(f"Procesando {len(trabajos)} imágenes...")
+        generadas = errores = 0
+        for futuro in as_completed(trabajos):
+            instancia = trabajos[futuro]
+            try:
+                imagenes.guardar_variantes(type(instancia), instancia.pk, futuro.result())
+                generadas += 1
+            except Exception as e:
+                errores += 1
+                self.stdout.write(self.style.WARNING(f'  {type(instancia).__name__} #{instancia.pk}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {generadas} imágenes procesadas'))
+        if errores:
+            self.stdout.write(self.style.ERROR(f'✗ {errores} con error'))
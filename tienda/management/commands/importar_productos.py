@@ -0,0 +1,45 @@
+# tienda/management/commands/importar_productos.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda.importacion import importar_productos, LECTORES, TAMANIO_LOTE, formato_de
+
+
+class Command(BaseCommand):
+    help = 'Importa (crea o actualiza) productos desde un CSV o NDJSON de proveedor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta al .csv o .ndjson')
+        parser.add_argument('--formato', choices=sorted(LECTORES), help='Por defecto se deduce de la extensión')
+        parser.add_argument('--lote', type=int, default=TAMANIO_LOTE, help='Filas por tanda')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or formato_de(options['archivo'])
+        inicio = time.monotonic()
+
+        def al_avanzar(resultado):
+            self.stdout.write(f"  {resultado.filas} filas leídas...")
+
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as texto:
+                resultado = importar_productos(
+                    LECTORES[formato](texto), tamanio_lote=options['lote'], al_avanzar=al_avanzar
+                )
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+
+        for linea, mensaje in resultado.errores:
+            self.stdout.write(self.style.WARNING(f'  Línea {linea}: {mensaje}'))
+        if resultado.cantidad_errores > len(resultado.errores):
+            self.stdout.write(self.style.WARNING(
+                f'  ... y {resultado.cantidad_errores - len(resultado.errores)} errores más'
+            ))
+
+        segundos = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {resultado.creados} creados, {resultado.actualizados} actualizados '
+            f'({resultado.filas} filas en {segundos:.1f}s)'
+        ))
+        if resultado.cantidad_errores:
+            self.stdout.write(self.style.ERROR(f'✗ {resultado.cantidad_errores} filas con error'))
@@ -0,0 +1,19 @@
+# tienda/management/commands/reconstruir_busqueda.py
+from django.core.management.base import BaseCommand
+
+from tienda import busqueda
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda (FTS5) de productos'
+
+    def handle(self, *args, **kwargs):
+        if not busqueda.fts_disponible():
+            self.stdout.write(self.style.WARNING(
+                '• La base de datos no es SQLite: la búsqueda usa icontains, no hay índice que reconstruir'
+            ))
+            return
+
+        self.stdout.write("Reconstruyendo índice de búsqueda...")
+        total = busqueda.reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} productos indexados'))
@@ -0,0 +1,13 @@
+# tienda/management/commands/reconstruir_tarjetas.py
+from django.core.management.base import BaseCommand
+
+from tienda.tarjetas import reconstruir_tarjetas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las tarjetas desnormalizadas de productos usadas en los listados'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write("Reconstruyendo tarjetas de productos...")
+        total = reconstruir_tarjetas()
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} tarjetas generadas'))
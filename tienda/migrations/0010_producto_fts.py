@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Índice de búsqueda de productos (ver tienda/busqueda.py). Solo SQLite.
+CREAR_TABLA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tienda_producto_fts USING fts5("
+    "nombre, descripcion, categoria, "
+    "tokenize = 'unicode61 remove_diacritics 2', "
+    "prefix = '2 3')"
+)
+
+LLENAR_TABLA = (
+    "INSERT INTO tienda_producto_fts (rowid, nombre, descripcion, categoria) "
+    "SELECT p.id, p.nombre, COALESCE(p.descripcion, ''), c.nombre "
+    "FROM tienda_producto p INNER JOIN tienda_categoria c ON c.id = p.categoria_id"
+)
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREAR_TABLA)
+    schema_editor.execute(LLENAR_TABLA)
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS tienda_producto_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0009_producto_indices_catalogo'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
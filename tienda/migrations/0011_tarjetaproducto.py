@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:48
+
+import django.db.models.deletion
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+
+
+def llenar_tarjetas(apps, schema_editor):
+    # Misma lógica que tienda/tarjetas.py, con los modelos históricos
+    Producto = apps.get_model('tienda', 'Producto')
+    TarjetaProducto = apps.get_model('tienda', 'TarjetaProducto')
+
+    tarjetas = []
+    for producto in Producto.objects.select_related('categoria').prefetch_related('imagenes'):
+        imagenes = sorted(producto.imagenes.all(), key=lambda i: (not i.es_principal, i.orden, i.id))
+        imagen = imagenes[0] if imagenes else None
+        tarjetas.append(TarjetaProducto(
+            producto=producto,
+            categoria_id=producto.categoria_id,
+            categoria_nombre=producto.categoria.nombre,
+            nombre=producto.nombre,
+            precio=producto.precio,
+            cuota=(producto.precio / 3).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+            imagen_url=imagen.imagen.url if imagen and imagen.imagen else '',
+            en_stock=producto.stock > 0,
+            activo=producto.activo,
+        ))
+    TarjetaProducto.objects.bulk_create(tarjetas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0010_producto_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarjetaProducto',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tarjeta', serialize=False, to='tienda.producto')),
+                ('categoria_nombre', models.CharField(max_length=100)),
+                ('nombre', models.CharField(max_length=150)),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cuota', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('imagen_url', models.CharField(blank=True, max_length=300)),
+                ('en_stock', models.BooleanField(default=False)),
+                ('activo', models.BooleanField(default=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tienda.categoria')),
+            ],
+            options={
+                'verbose_name': 'Tarjeta de producto',
+                'verbose_name_plural': 'Tarjetas de productos',
+                'ordering': ['nombre'],
+                'indexes': [models.Index(fields=['precio', 'producto'], name='tarjeta_precio_idx'), models.Index(fields=['nombre', 'producto'], name='tarjeta_nombre_idx'), models.Index(fields=['categoria_nombre', 'precio', 'producto'], name='tarjeta_cat_precio_idx'), models.Index(fields=['categoria_nombre', 'nombre', 'producto'], name='tarjeta_cat_nombre_idx'), models.Index(fields=['activo', 'nombre'], name='tarjeta_activo_nombre_idx')],
+            },
+        ),
+        migrations.RunPython(llenar_tarjetas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0011_tarjetaproducto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['actualizado'], name='producto_actualizado_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0015_producto_creado_id_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='producto',
+            name='producto_precio_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='producto',
+            name='producto_cat_precio_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='producto',
+            name='producto_nombre_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='tarjetaproducto',
+            index=models.Index(fields=['categoria_nombre', 'producto'], name='tarjeta_cat_producto_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+# Cantidad de cuotas sin interés que se muestran en la tienda
+CUOTAS_SIN_INTERES = 3
+
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
     descripcion = models.TextField(blank=True, null=True)
@@ -12,6 +15,8 @@ class Categoria(models.Model):
         null=True,
         help_text="Imagen de fondo para la categoría en la página principal (tamaño recomendado: 600x400px)"
     )
+    # Versiones recortadas a 600x400 / 1200x800 (ver tienda/imagenes.py)
+    imagen_fondo_variantes = models.JSONField(default=dict, blank=True, editable=False)
     creado = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     actualizado = models.DateTimeField(auto_now=True, null=True, blank=True)
 
@@ -61,6 +66,23 @@ class Producto(models.Model):
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
         ordering = ['nombre']
+        # La paginación por cursor del catálogo va sobre TarjetaProducto (ver
+        # sus índices): acá solo los listados que leen Producto directo
+        indexes = [
+            # Exportación incremental (?updated_since=)
+            models.Index(fields=['actualizado'], name='producto_actualizado_idx'),
+            # Paginación por cursor del listado del panel (panel_admin/paginacion.py)
+            models.Index(fields=['creado', 'id'], name='producto_creado_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # La categoría con la que se leyó: si al guardar cambió, las señales
+        # invalidan también la anterior (sin volver a consultarla)
+        if 'categoria_id' in instancia.__dict__:
+            instancia._categoria_id_cargada = instancia.categoria_id
+        return instancia
 
     def __str__(self):
         return self.nombre
@@ -70,6 +92,8 @@ class ImagenProducto(models.Model):
     imagen = models.ImageField(upload_to='productos/')
     orden = models.PositiveIntegerField(default=0)
     es_principal = models.BooleanField(default=False)
+    # Rutas de las versiones redimensionadas (ver tienda/imagenes.py)
+    variantes = models.JSONField(default=dict, blank=True, editable=False)
     
     class Meta:
         verbose_name = 'Imagen del producto'
@@ -88,4 +112,76 @@ class Favorito(models.Model):
         unique_together = ('usuario', 'producto')
 
     def __str__(self):
-        return f"{self.usuario.username} - {self.producto.nombre}"
\ No newline at end of file
+        return f"{self.usuario.username} - {self.producto.nombre}"
+
+class TarjetaProducto(models.Model):
+    """
+    Fila desnormalizada con todo lo que muestra una tarjeta de producto
+    en los listados (catálogo, inicio, búsqueda). Se mantiene con las
+    señales de tienda/signals.py (ver tienda/tarjetas.py), así cada
+    grilla sale de una sola consulta sin tocar imágenes ni categorías.
+    """
+    producto = models.OneToOneField(
+        Producto,
+        primary_key=True,
+        related_name='tarjeta',
+        on_delete=models.CASCADE
+    )
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='+')
+    categoria_nombre = models.CharField(max_length=100)
+    nombre = models.CharField(max_length=150)
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+    cuota = models.DecimalField(max_digits=10, decimal_places=2)
+    imagen_url = models.CharField(max_length=300, blank=True)
+    imagen_variantes = models.JSONField(default=dict, blank=True)
+    en_stock = models.BooleanField(default=False)
+    activo = models.BooleanField(default=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Tarjeta de producto'
+        verbose_name_plural = 'Tarjetas de productos'
+        ordering = ['nombre']
+        # Claves de la paginación por cursor del catálogo (tienda/paginacion.py),
+        # con y sin categoría: precio + id, nombre + id y -id ('relevantes')
+        indexes = [
+            models.Index(fields=['precio', 'producto'], name='tarjeta_precio_idx'),
+            models.Index(fields=['nombre', 'producto'], name='tarjeta_nombre_idx'),
+            models.Index(fields=['categoria_nombre', 'precio', 'producto'], name='tarjeta_cat_precio_idx'),
+            models.Index(fields=['categoria_nombre', 'nombre', 'producto'], name='tarjeta_cat_nombre_idx'),
+            models.Index(fields=['categoria_nombre', 'producto'], name='tarjeta_cat_producto_idx'),
+            models.Index(fields=['activo', 'nombre'], name='tarjeta_activo_nombre_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tarjeta de {self.nombre}"
+
+
+class Recomendacion(models.Model):
+    """
+    Productos relacionados precalculados (los "comprados juntos").
+    Los arma el comando `calcular_recomendaciones` a partir del historial
+    de ItemPedido (ver tienda/recomendaciones.py); el detalle del producto
+    los lee con una sola consulta por el índice (producto, posicion).
+    """
+    ORIGENES = [
+        ('compras', 'Comprados juntos'),
+        ('categoria', 'Más vendidos de la categoría'),
+    ]
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='recomendaciones')
+    recomendado = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='recomendado_en')
+    posicion = models.PositiveSmallIntegerField()
+    puntaje = models.FloatField(default=0)
+    origen = models.CharField(max_length=20, choices=ORIGENES, default='compras')
+
+    class Meta:
+        verbose_name = 'Recomendación'
+        verbose_name_plural = 'Recomendaciones'
+        ordering = ['producto', 'posicion']
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'posicion'], name='recomendacion_producto_posicion_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} -> {self.recomendado_id} (#{self.posicion})"
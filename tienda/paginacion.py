@@ -0,0 +1,196 @@
+# tienda/paginacion.py
+"""
+Paginación por cursor (keyset) para el catálogo.
+
+En lugar de OFFSET/COUNT, cada página se pide a partir de los valores de
+orden del último producto mostrado (ej: precio + id). Así la página 50
+cuesta lo mismo que la página 1: la base de datos salta directo al
+punto de partida usando el índice.
+
+Los listados del panel usan lo mismo con sus propias columnas (ver
+panel_admin/paginacion.py): se pasan en `columnas` y `orden` identifica
+el listado, así un cursor de un listado no sirve en otro.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q
+
+TAMANIO_PAGINA = 24
+TAMANIO_PAGINA_MAXIMO = 60
+
+SALT_CURSOR = 'tienda.catalogo.cursor'
+
+# Columnas de la clave para cada orden del catálogo: (campo, descendente).
+# Siempre terminan en 'pk' para que el orden sea total (sin empates).
+ORDENES_CATALOGO = {
+    'menor': (('precio', False), ('pk', False)),
+    'mayor': (('precio', True), ('pk', True)),
+    'relevantes': (('pk', True),),
+}
+ORDEN_POR_DEFECTO = (('nombre', False), ('pk', False))
+
+
+class CursorInvalido(Exception):
+    """El token de cursor no es válido (manipulado o de otro orden)"""
+
+
+class PaginaCursor:
+    """Resultado de una página: items + tokens para ir adelante/atrás"""
+
+    def __init__(self, items, cursor_siguiente=None, cursor_anterior=None):
+        self.items = items
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def tiene_siguiente(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def tiene_anterior(self):
+        return self.cursor_anterior is not None
+
+
+def columnas_orden(orden):
+    """Devuelve las columnas de la clave para el orden pedido"""
+    return ORDENES_CATALOGO.get(orden, ORDEN_POR_DEFECTO)
+
+
+def tamanio_pagina(valor):
+    """Convierte el parámetro ?por_pagina= en un tamaño acotado"""
+    try:
+        tamanio = int(valor)
+    except (TypeError, ValueError):
+        return TAMANIO_PAGINA
+    return max(1, min(tamanio, TAMANIO_PAGINA_MAXIMO))
+
+
+def _serializar(valor):
+    # Decimal y las fechas no son serializables a JSON; los guardamos como
+    # texto (el campo los vuelve a convertir al filtrar)
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+
+def codificar_cursor(orden, valores, direccion):
+    """Arma un token opaco y firmado con los valores de la clave"""
+    return signing.dumps(
+        {'o': orden or '', 'v': [_serializar(v) for v in valores], 'd': direccion},
+        salt=SALT_CURSOR,
+        compress=True,
+    )
+
+
+def decodificar_cursor(token, orden, columnas=None):
+    """Devuelve (valores, direccion) o lanza CursorInvalido"""
+    try:
+        datos = signing.loads(token, salt=SALT_CURSOR)
+    except signing.BadSignature:
+        raise CursorInvalido('Cursor inválido')
+
+    if datos.get('o') != (orden or '') or datos.get('d') not in ('sig', 'ant'):
+        raise CursorInvalido('El cursor no corresponde al orden actual')
+
+    valores = datos.get('v')
+    if columnas is None:
+        columnas = columnas_orden(orden)
+    if not isinstance(valores, list) or len(valores) != len(columnas):
+        raise CursorInvalido('Cursor incompleto')
+
+    return valores, datos['d']
+
+
+def _filtro_keyset(columnas, valores, hacia_atras):
+    """
+    Construye el WHERE "después de" (o "antes de") la fila del cursor.
+    Para (precio, id) ascendente queda:
+        precio >= p AND (precio > p OR (precio = p AND id > i))
+    La primera condición es redundante, pero sin ella SQLite no usa el
+    índice para saltar al cursor con el OR y recorre desde el principio.
+    """
+    filtro = Q()
+    iguales = {}
+    for (campo, descendente), valor in zip(columnas, valores):
+        # Avanzar en un orden descendente es ir hacia valores menores
+        menor = descendente != hacia_atras
+        lookup = f'{campo}__lt' if menor else f'{campo}__gt'
+        filtro |= Q(**iguales, **{lookup: valor})
+        iguales[campo] = valor
+
+    if len(columnas) > 1:
+        (campo, descendente), valor = columnas[0], valores[0]
+        menor = descendente != hacia_atras
+        filtro &= Q(**{f'{campo}__lte' if menor else f'{campo}__gte': valor})
+    return filtro
+
+
+def _orden_sql(columnas, hacia_atras):
+    campos = []
+    for campo, descendente in columnas:
+        if descendente != hacia_atras:
+            campos.append(f'-{campo}')
+        else:
+            campos.append(campo)
+    return campos
+
+
+def paginar_por_cursor(queryset, orden=None, cursor=None, por_pagina=None, columnas=None):
+    """
+    Devuelve una PaginaCursor con a lo sumo `por_pagina` items.
+    Se trae un registro de más para saber si existe otra página,
+    sin hacer COUNT(*).
+
+    `columnas` reemplaza a las del catálogo (mismo formato que
+    ORDENES_CATALOGO: ((campo, descendente), ..., ('pk', ...))).
+    """
+    if columnas is None:
+        columnas = columnas_orden(orden)
+    tamanio = tamanio_pagina(por_pagina)
+
+    hacia_atras = False
+    if cursor:
+        valores, direccion = decodificar_cursor(cursor, orden, columnas)
+        hacia_atras = direccion == 'ant'
+        queryset = queryset.filter(_filtro_keyset(columnas, valores, hacia_atras))
+
+    filas = list(queryset.order_by(*_orden_sql(columnas, hacia_atras))[:tamanio + 1])
+    return armar_pagina(filas, tamanio, orden, columnas, cursor, hacia_atras)
+
+
+def armar_pagina(filas, tamanio, orden, columnas, cursor=None, hacia_atras=False):
+    """
+    PaginaCursor a partir de las filas leídas (hasta `tamanio` + 1, en el
+    sentido de la lectura) y sus cursores. La usa también la búsqueda,
+    que lee las filas con su propio SQL (ver tienda/busqueda.py).
+    """
+    hay_mas = len(filas) > tamanio
+    filas = filas[:tamanio]
+
+    if hacia_atras:
+        # Se leyó en sentido inverso: lo damos vuelta para mostrarlo
+        filas.reverse()
+
+    def clave(fila):
+        return [getattr(fila, campo) for campo, _ in columnas]
+
+    cursor_siguiente = cursor_anterior = None
+    if filas:
+        # Hacia adelante: hay siguiente si sobró una fila; hay anterior si vinimos con cursor.
+        # Hacia atrás: al revés.
+        if (hay_mas and not hacia_atras) or hacia_atras:
+            cursor_siguiente = codificar_cursor(orden, clave(filas[-1]), 'sig')
+        if (hay_mas and hacia_atras) or (cursor and not hacia_atras):
+            cursor_anterior = codificar_cursor(orden, clave(filas[0]), 'ant')
+
+    return PaginaCursor(filas, cursor_siguiente, cursor_anterior)
@@ -0,0 +1,178 @@
+# tienda/recomendaciones.py
+"""
+Recomendaciones "los que compraron esto también compraron...".
+
+El comando `calcular_recomendaciones` lee todo el historial de
+ItemPedido, arma la matriz de co-ocurrencia producto x producto (cuántos
+pedidos contienen a los dos) y guarda los K mejores de cada producto en
+la tabla Recomendacion. Todo el cálculo se hace con NumPy sobre arreglos
+de ids, sin loops de Python por pedido, así que cientos de miles de
+líneas se procesan en segundos.
+
+La matriz se guarda "rala" (solo los pares que existen): cada par
+(a, b) se codifica como un entero a * n + b y np.unique los cuenta.
+
+Si un producto no tiene historial suficiente, se completa con los más
+vendidos de su misma categoría.
+"""
+import numpy as np
+from django.db import transaction
+
+from .models import Producto, Recomendacion
+
+TOP_K = 12
+
+# Un pedido con muchísimos productos (ej: compra mayorista) genera
+# n² pares y no dice mucho de afinidad: se ignora para el cálculo
+MAXIMO_PRODUCTOS_POR_PEDIDO = 50
+
+ESTADOS_EXCLUIDOS = ('cancelado',)
+
+TAMANIO_LOTE = 5000
+
+
+def _lineas_pedidos():
+    """Devuelve dos arreglos (pedido_id, producto_id) sin repetidos"""
+    from pedidos_pagos.models import ItemPedido
+
+    filas = (
+        ItemPedido.objects
+        .exclude(pedido__estado__in=ESTADOS_EXCLUIDOS)
+        .order_by()
+        .values_list('pedido_id', 'producto_id')
+        .iterator(chunk_size=TAMANIO_LOTE)
+    )
+    datos = np.fromiter(
+        (valor for fila in filas for valor in fila), dtype=np.int64
+    ).reshape(-1, 2)
+    if not len(datos):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    datos = np.unique(datos, axis=0)  # un producto repetido en el pedido cuenta una vez
+    return datos[:, 0], datos[:, 1]
+
+
+def co_ocurrencias(pedidos, productos):
+    """
+    Cuenta en cuántos pedidos aparece cada par de productos.
+    Recibe los arreglos paralelos (pedido_id, producto_id) ordenados por
+    pedido y devuelve (ids, ventas, a, b, conteo):
+        - ids: el id real de cada índice de producto
+        - ventas: en cuántos pedidos aparece cada producto
+        - a, b, conteo: los pares (a != b) y en cuántos pedidos están juntos
+    """
+    ids, prod_idx = np.unique(productos, return_inverse=True)
+    n = len(ids)
+    ventas = np.bincount(prod_idx, minlength=n)
+
+    _, inicio, tamanio = np.unique(pedidos, return_index=True, return_counts=True)
+    validos = (tamanio > 1) & (tamanio <= MAXIMO_PRODUCTOS_POR_PEDIDO)
+    inicio, tamanio = inicio[validos], tamanio[validos]
+    if not len(inicio):
+        vacio = np.empty(0, np.int64)
+        return ids, ventas, vacio, vacio, vacio
+
+    # Cada línea se empareja con todas las de su pedido (incluida ella
+    # misma, que después se descarta): la línea de un pedido de t
+    # productos genera t pares
+    filas = _expandir(inicio, tamanio)
+    repeticiones = np.repeat(tamanio, tamanio)
+    izquierda = np.repeat(filas, repeticiones)
+    derecha = _expandir(np.repeat(inicio, tamanio), repeticiones)
+
+    distintos = izquierda != derecha
+    a = prod_idx[izquierda[distintos]]
+    b = prod_idx[derecha[distintos]]
+
+    pares, conteo = np.unique(a * n + b, return_counts=True)
+    return ids, ventas, pares // n, pares % n, conteo
+
+
+def _expandir(inicio, tamanio):
+    """[inicio, inicio+1, ..., inicio+tamanio-1] de cada grupo, concatenados"""
+    total = tamanio.sum()
+    desplazamiento = np.arange(total) - np.repeat(np.cumsum(tamanio) - tamanio, tamanio)
+    return np.repeat(inicio, tamanio) + desplazamiento
+
+
+def top_k(a, b, puntaje, desempate, k=TOP_K):
+    """
+    Para cada producto `a` se queda con los k `b` de mayor puntaje
+    (a igual puntaje gana el más vendido). Devuelve (a, b, puntaje, posicion).
+    """
+    orden = np.lexsort((-desempate, -puntaje, a))
+    a, b, puntaje = a[orden], b[orden], puntaje[orden]
+    if not len(a):
+        return a, b, puntaje, a
+
+    nuevo_grupo = np.r_[True, a[1:] != a[:-1]]
+    inicio_grupo = np.maximum.accumulate(np.where(nuevo_grupo, np.arange(len(a)), 0))
+    posicion = np.arange(len(a)) - inicio_grupo
+    quedan = posicion < k
+    return a[quedan], b[quedan], puntaje[quedan], posicion[quedan]
+
+
+def _mas_vendidos_por_categoria(ventas_por_id):
+    """{categoria_id: [producto_id, ...]} ordenado por ventas (y más nuevos)"""
+    por_categoria = {}
+    for producto_id, categoria_id in (
+        Producto.objects.filter(activo=True).order_by('-id').values_list('id', 'categoria_id')
+    ):
+        por_categoria.setdefault(categoria_id, []).append(producto_id)
+    for lista in por_categoria.values():
+        lista.sort(key=lambda pid: -ventas_por_id.get(pid, 0))  # sort estable: conserva -id
+    return por_categoria
+
+
+def calcular_recomendaciones(k=TOP_K):
+    """
+    Recalcula toda la tabla Recomendacion. Devuelve un dict con
+    cuántas salieron del historial y cuántas del relleno por categoría.
+    """
+    pedidos, productos = _lineas_pedidos()
+    ids, ventas, a, b, conteo = co_ocurrencias(pedidos, productos)
+
+    # Puntaje tipo coseno: los pares muy populares no tapan a los afines
+    puntaje = conteo / np.sqrt(ventas[a] * ventas[b]) if len(conteo) else conteo.astype(float)
+    a, b, puntaje, posicion = top_k(a, b, puntaje, ventas[b], k)
+
+    recomendados = {}
+    for pa, pb, valor in zip(ids[a].tolist(), ids[b].tolist(), puntaje.tolist()):
+        recomendados.setdefault(pa, []).append((pb, valor))
+
+    ventas_por_id = dict(zip(ids.tolist(), ventas.tolist()))
+    mas_vendidos = _mas_vendidos_por_categoria(ventas_por_id)
+
+    filas = []
+    totales = {'compras': 0, 'categoria': 0}
+    for producto_id, categoria_id in Producto.objects.order_by('id').values_list('id', 'categoria_id'):
+        lista = recomendados.get(producto_id, [])
+        elegidos = {producto_id}
+        posicion = 0
+        for recomendado_id, valor in lista:
+            filas.append(Recomendacion(
+                producto_id=producto_id, recomendado_id=recomendado_id,
+                posicion=posicion, puntaje=valor, origen='compras',
+            ))
+            elegidos.add(recomendado_id)
+            posicion += 1
+        totales['compras'] += posicion
+
+        # Relleno: los más vendidos de la categoría
+        for recomendado_id in mas_vendidos.get(categoria_id, []):
+            if posicion >= k:
+                break
+            if recomendado_id in elegidos:
+                continue
+            filas.append(Recomendacion(
+                producto_id=producto_id, recomendado_id=recomendado_id,
+                posicion=posicion, puntaje=0, origen='categoria',
+            ))
+            elegidos.add(recomendado_id)
+            posicion += 1
+            totales['categoria'] += 1
+
+    with transaction.atomic():
+        Recomendacion.objects.all().delete()
+        Recomendacion.objects.bulk_create(filas, batch_size=TAMANIO_LOTE)
+
+    return totales
@@ -0,0 +1,246 @@
+# tienda/signals.py
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Producto, Categoria, Talle, Color, ImagenProducto
+from . import busqueda, facetas, tarjetas, cache_grillas, imagenes, exportacion
+
+
+def _solo_variantes(update_fields):
+    # tienda/imagenes.py guarda las variantes de la imagen de fondo con
+    # save(update_fields=['imagen_fondo_variantes']): eso no cambia nada del
+    # índice, las facetas, las tarjetas ni las grillas
+    return update_fields is not None and set(update_fields) <= {'imagen_fondo_variantes'}
+
+
+# ==================== ÍNDICE DE BÚSQUEDA ====================
+
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    busqueda.indexar_productos([instance.pk])
+
+
+@receiver(post_delete, sender=Producto)
+def desindexar_producto(sender, instance, **kwargs):
+    busqueda.eliminar_del_indice([instance.pk])
+
+
+@receiver(post_save, sender=Categoria)
+def indexar_productos_categoria(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Una categoría nueva todavía no tiene productos
+    if raw or created or _solo_variantes(update_fields):
+        return
+    busqueda.indexar_categoria(instance.pk)
+
+
+# ==================== FACETAS DEL CATÁLOGO ====================
+
+@receiver(pre_save, sender=Producto)
+def recordar_categoria_anterior(sender, instance, raw=False, **kwargs):
+    # Si el producto se mueve de categoría hay que invalidar las dos. La
+    # anterior es la que tenía al leerlo (Producto.from_db); solo se consulta
+    # si la instancia no salió de la base o se leyó sin la categoría
+    if raw or instance.pk is None:
+        anterior = None
+    elif hasattr(instance, '_categoria_id_cargada'):
+        anterior = instance._categoria_id_cargada
+    else:
+        anterior = Producto.objects.filter(
+            pk=instance.pk
+        ).values_list('categoria_id', flat=True).first()
+    instance._categoria_id_anterior = anterior
+    # Para el próximo save() de la misma instancia
+    instance._categoria_id_cargada = instance.categoria_id
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_facetas_producto(sender, instance, **kwargs):
+    facetas.invalidar_categorias([
+        instance.categoria_id,
+        getattr(instance, '_categoria_id_anterior', None),
+    ])
+
+
+@receiver(m2m_changed, sender=Producto.talles.through)
+@receiver(m2m_changed, sender=Producto.colores.through)
+def invalidar_facetas_m2m(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # talle.producto_set.add(...): pueden ser productos de cualquier categoría
+        facetas.invalidar_todo()
+    else:
+        facetas.invalidar_categorias([instance.categoria_id])
+
+
+@receiver(post_save, sender=Talle)
+@receiver(post_delete, sender=Talle)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Categoria)
+def invalidar_facetas_global(sender, update_fields=None, **kwargs):
+    if _solo_variantes(update_fields):
+        return
+    facetas.invalidar_todo()
+
+
+# ==================== TARJETAS DE LOS LISTADOS ====================
+
+@receiver(post_save, sender=Producto)
+def actualizar_tarjeta_producto(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    tarjetas.actualizar_tarjetas([instance.pk])
+
+
+@receiver(post_save, sender=ImagenProducto)
+@receiver(post_delete, sender=ImagenProducto)
+def actualizar_tarjeta_imagen(sender, instance, raw=False, origin=None, **kwargs):
+    if raw:
+        return
+    # Si se está borrando el producto entero, la tarjeta se va en cascada
+    if isinstance(origin, Producto) or getattr(origin, 'model', None) is Producto:
+        return
+    tarjetas.actualizar_tarjetas([instance.producto_id])
+
+
+@receiver(post_save, sender=Categoria)
+def actualizar_tarjetas_categoria(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or created or _solo_variantes(update_fields):
+        return
+    tarjetas.actualizar_categoria(instance)
+
+
+# ==================== CACHE DE GRILLAS ====================
+
+def _invalidar_grillas(categoria_ids):
+    # Los ámbitos de la cache son los nombres de categoría (así vienen en la URL)
+    nombres = Categoria.objects.filter(
+        id__in=[i for i in categoria_ids if i]
+    ).values_list('nombre', flat=True)
+    cache_grillas.invalidar(*nombres)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_grillas_producto(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _invalidar_grillas([
+        instance.categoria_id,
+        getattr(instance, '_categoria_id_anterior', None),
+    ])
+
+
+@receiver(post_save, sender=ImagenProducto)
+@receiver(post_delete, sender=ImagenProducto)
+def invalidar_grillas_imagen(sender, instance, raw=False, origin=None, **kwargs):
+    if raw:
+        return
+    # Si se está borrando el producto entero, ya invalida su post_delete
+    if isinstance(origin, Producto) or getattr(origin, 'model', None) is Producto:
+        return
+    categoria_id = Producto.objects.filter(pk=instance.producto_id).values_list('categoria_id', flat=True).first()
+    _invalidar_grillas([categoria_id])
+
+
+@receiver(m2m_changed, sender=Producto.talles.through)
+@receiver(m2m_changed, sender=Producto.colores.through)
+def invalidar_grillas_m2m(sender, instance, action, reverse, **kwargs):
+    # Las grillas filtradas por talle/color dependen de estas relaciones
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        cache_grillas.invalidar_todo()
+    else:
+        _invalidar_grillas([instance.categoria_id])
+
+
+@receiver(post_save, sender=Talle)
+@receiver(post_delete, sender=Talle)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_grillas_global(sender, raw=False, update_fields=None, **kwargs):
+    if raw or _solo_variantes(update_fields):
+        return
+    cache_grillas.invalidar_todo()
+
+
+# ==================== EXPORTACIÓN ====================
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Categoria)
+def invalidar_exportacion(sender, raw=False, update_fields=None, **kwargs):
+    # Se exporta el nombre de la categoría: renombrarla también cuenta
+    if raw or _solo_variantes(update_fields):
+        return
+    exportacion.invalidar()
+
+
+# ==================== FECHA DE ACTUALIZACIÓN ====================
+
+def _tocar_productos(producto_ids):
+    # Producto.actualizado es el validador del GET condicional (tienda/validadores.py):
+    # tiene que cambiar aunque lo modificado sean las imágenes o los talles/colores.
+    # update() no dispara señales, así que no se recalcula nada más.
+    Producto.objects.filter(pk__in=[i for i in producto_ids if i]).update(actualizado=timezone.now())
+    # 'actualizado' también se exporta
+    exportacion.invalidar()
+
+
+@receiver(post_save, sender=ImagenProducto)
+@receiver(post_delete, sender=ImagenProducto)
+def tocar_producto_imagen(sender, instance, raw=False, origin=None, **kwargs):
+    if raw:
+        return
+    if isinstance(origin, Producto) or getattr(origin, 'model', None) is Producto:
+        return
+    _tocar_productos([instance.producto_id])
+
+
+@receiver(m2m_changed, sender=Producto.talles.through)
+@receiver(m2m_changed, sender=Producto.colores.through)
+def tocar_producto_m2m(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # talle.producto_set.add(...): pk_set son productos (en clear() viene vacío)
+        if action == 'post_clear':
+            return
+        _tocar_productos(pk_set or [])
+    else:
+        _tocar_productos([instance.pk])
+
+
+# ==================== VARIANTES DE IMÁGENES ====================
+
+@receiver(post_save, sender=ImagenProducto)
+@receiver(post_save, sender=Categoria)
+def encolar_variantes(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or _solo_variantes(update_fields):
+        return
+    if imagenes.necesita_variantes(instance):
+        # Después del commit: el archivo ya está guardado y la fila es visible
+        transaction.on_commit(lambda: imagenes.encolar(instance))
+    elif sender is Categoria and not instance.imagen_fondo and instance.imagen_fondo_variantes:
+        # Se quitó la imagen de fondo
+        variantes = instance.imagen_fondo_variantes
+        Categoria.objects.filter(pk=instance.pk).update(imagen_fondo_variantes={})
+        transaction.on_commit(lambda: imagenes.borrar_variantes(settings.MEDIA_ROOT, variantes))
+
+
+@receiver(post_delete, sender=ImagenProducto)
+@receiver(post_delete, sender=Categoria)
+def borrar_variantes(sender, instance, **kwargs):
+    variantes = instance.variantes if sender is ImagenProducto else instance.imagen_fondo_variantes
+    if variantes:
+        transaction.on_commit(lambda: imagenes.borrar_variantes(settings.MEDIA_ROOT, variantes))
@@ -0,0 +1,136 @@
+# tienda/tarjetas.py
+"""
+Mantenimiento de TarjetaProducto (la fila desnormalizada de los listados).
+
+Las señales llaman a `actualizar_tarjetas` con los ids afectados; el
+comando `reconstruir_tarjetas` recalcula todas.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+
+from .models import Producto, TarjetaProducto, CUOTAS_SIN_INTERES
+
+CAMPOS_ACTUALIZABLES = [
+    'categoria', 'categoria_nombre', 'nombre', 'precio', 'cuota',
+    'imagen_url', 'imagen_variantes', 'en_stock', 'activo', 'actualizado',
+]
+
+
+def calcular_cuota(precio):
+    return (Decimal(precio) / CUOTAS_SIN_INTERES).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def imagen_principal(imagenes):
+    """La marcada como principal; si no hay, la primera por orden"""
+    imagenes = sorted(imagenes, key=lambda i: (not i.es_principal, i.orden, i.id))
+    return imagenes[0] if imagenes else None
+
+
+def url_imagen(imagen):
+    """La variante 'card' si ya se generó; si no, el original"""
+    if imagen is None or not imagen.imagen:
+        return ''
+    card = imagen.variantes.get('card')
+    if card:
+        return default_storage.url(card['jpg'])
+    return imagen.imagen.url
+
+
+def armar_tarjeta(producto):
+    imagen = imagen_principal(producto.imagenes.all())
+    return TarjetaProducto(
+        producto=producto,
+        categoria_id=producto.categoria_id,
+        categoria_nombre=producto.categoria.nombre,
+        nombre=producto.nombre,
+        precio=producto.precio,
+        cuota=calcular_cuota(producto.precio),
+        imagen_url=url_imagen(imagen),
+        imagen_variantes=imagen.variantes if imagen else {},
+        en_stock=producto.stock > 0,
+        activo=producto.activo,
+    )
+
+
+def _guardar(tarjetas):
+    # Upsert: INSERT ... ON CONFLICT(producto_id) DO UPDATE
+    TarjetaProducto.objects.bulk_create(
+        tarjetas,
+        update_conflicts=True,
+        unique_fields=['producto'],
+        update_fields=CAMPOS_ACTUALIZABLES,
+    )
+
+
+def _productos():
+    return Producto.objects.select_related('categoria').prefetch_related('imagenes')
+
+
+def actualizar_tarjetas(producto_ids):
+    """
+    Recalcula las tarjetas de esos productos (3 consultas + 1 upsert).
+    Si alguno ya no existe, se borra su tarjeta.
+    """
+    producto_ids = {int(i) for i in producto_ids if i}
+    if not producto_ids:
+        return
+    productos = list(_productos().filter(id__in=producto_ids))
+    _guardar([armar_tarjeta(p) for p in productos])
+
+    faltantes = producto_ids - {p.id for p in productos}
+    if faltantes:
+        TarjetaProducto.objects.filter(producto_id__in=faltantes).delete()
+
+
+def actualizar_sin_imagen(producto_ids):
+    """
+    Importación masiva: recalcula las tarjetas de esos productos con un
+    solo INSERT ... SELECT ... ON CONFLICT en la base, sin instanciar
+    modelos, y deja la imagen como está (las nuevas quedan sin imagen).
+    La cuota es el mismo cálculo que calcular_cuota().
+    """
+    producto_ids = [int(i) for i in producto_ids]
+    if not producto_ids:
+        return
+    tarjeta = TarjetaProducto._meta.db_table
+    producto = Producto._meta.db_table
+    categoria = Producto._meta.get_field('categoria').related_model._meta.db_table
+    marcadores = ', '.join(['%s'] * len(producto_ids))
+    ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {tarjeta} (producto_id, categoria_id, categoria_nombre, nombre, precio, "
+            f"cuota, imagen_url, imagen_variantes, en_stock, activo, actualizado) "
+            f"SELECT p.id, p.categoria_id, c.nombre, p.nombre, p.precio, "
+            f"ROUND(p.precio / {CUOTAS_SIN_INTERES}.0, 2), '', '{{}}', p.stock > 0, p.activo, %s "
+            f"FROM {producto} p INNER JOIN {categoria} c ON c.id = p.categoria_id "
+            f"WHERE p.id IN ({marcadores}) "
+            f"ON CONFLICT (producto_id) DO UPDATE SET "
+            f"categoria_id = excluded.categoria_id, categoria_nombre = excluded.categoria_nombre, "
+            f"nombre = excluded.nombre, precio = excluded.precio, cuota = excluded.cuota, "
+            f"en_stock = excluded.en_stock, activo = excluded.activo, actualizado = excluded.actualizado",
+            [ahora, *producto_ids],
+        )
+
+
+def actualizar_categoria(categoria):
+    """Cambió el nombre de la categoría: un solo UPDATE sobre sus tarjetas"""
+    TarjetaProducto.objects.filter(categoria_id=categoria.pk).update(
+        categoria_nombre=categoria.nombre
+    )
+
+
+def reconstruir_tarjetas(tamanio_lote=500):
+    """Recalcula todas las tarjetas. Devuelve cuántas se generaron"""
+    total = 0
+    ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+    for inicio in range(0, len(ids), tamanio_lote):
+        lote = ids[inicio:inicio + tamanio_lote]
+        productos = list(_productos().filter(id__in=lote))
+        _guardar([armar_tarjeta(p) for p in productos])
+        total += len(productos)
+    TarjetaProducto.objects.exclude(producto_id__in=Producto.objects.values('id')).delete()
+    return total
@@ -0,0 +1,70 @@
+# tienda/templatetags/imagenes.py
+"""
+Tags para servir las variantes de tienda/imagenes.py.
+
+    {% load imagenes %}
+    {% imagen_responsive producto.imagen_variantes producto.imagen_url producto.nombre "custom-img" %}
+    <img src="..." srcset="{{ imagen.variantes|srcset }}">
+    style="background-image: url('{{ categoria.imagen_fondo_variantes|url_variante:'card' }}')"
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+register = template.Library()
+
+# El thumb está recortado cuadrado: no sirve como alternativa de la foto completa
+SIN_SRCSET = {'thumb'}
+
+# Ancho en pantalla de una tarjeta de la grilla (col-6 col-md-4 col-lg-3)
+SIZES_GRILLA = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 50vw'
+
+
+def _variantes(variantes):
+    return {
+        nombre: datos for nombre, datos in (variantes or {}).items()
+        if isinstance(datos, dict)
+    }
+
+
+@register.filter
+def srcset(variantes, formato='jpg'):
+    """'url 480w, url 960w, ...' con las variantes de ese formato (jpg o webp)"""
+    candidatos = {}
+    for nombre, datos in _variantes(variantes).items():
+        if nombre in SIN_SRCSET or not datos.get(formato):
+            continue
+        # Si el original era chico, varias variantes quedan del mismo ancho
+        candidatos.setdefault(datos['ancho'], datos[formato])
+    return ', '.join(
+        f'{default_storage.url(ruta)} {ancho}w' for ancho, ruta in sorted(candidatos.items())
+    )
+
+
+@register.filter
+def url_variante(variantes, nombre):
+    """URL del JPEG de una variante ('' si todavía no se generó)"""
+    datos = _variantes(variantes).get(nombre)
+    return default_storage.url(datos['jpg']) if datos else ''
+
+
+@register.simple_tag
+def imagen_responsive(variantes, url_original, alt='', clase='', sizes=SIZES_GRILLA):
+    """
+    <picture> con WebP + JPEG. Mientras no haya variantes (recién
+    subida), cae al <img> con la URL original.
+    """
+    jpg = srcset(variantes, 'jpg')
+    if not jpg:
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" loading="lazy" decoding="async">',
+            url_original, clase, alt,
+        )
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        srcset(variantes, 'webp'), sizes,
+        url_original, jpg, sizes, clase, alt,
+    )
@@ -1,3 +1,732 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import numpy as np
+from PIL import Image
+
+from pedidos_pagos.models import ItemPedido, Pedido
+from . import busqueda, cache_grillas, exportacion, facetas, imagenes, recomendaciones, tarjetas, views
+from .models import Categoria, Color, ImagenProducto, Producto, Recomendacion, TarjetaProducto, Talle
+from .importacion import importar_productos, leer_csv, leer_ndjson
+from .paginacion import TAMANIO_PAGINA_MAXIMO, CursorInvalido, codificar_cursor, paginar_por_cursor, tamanio_pagina
+
+def crear_productos(*nombres, categoria='Remeras', **campos):
+    """Un Producto por nombre (con las señales: índice, tarjeta, etc.)"""
+    categoria, _ = Categoria.objects.get_or_create(nombre=categoria)
+    return [
+        Producto.objects.create(categoria=categoria, nombre=nombre, precio=campos.get('precio', Decimal('1000')),
+                                stock=campos.get('stock', 5), descripcion=campos.get('descripcion', ''))
+        for nombre in nombres
+    ]
+
+
+def imagen_subida(nombre='foto.png', tamanio=(1200, 900)):
+    contenido = io.BytesIO()
+    Image.new('RGBA', tamanio, (200, 30, 30, 255)).save(contenido, format='PNG')
+    return SimpleUploadedFile(nombre, contenido.getvalue(), content_type='image/png')
+
+
+class BusquedaTests(TestCase):
+    def nombres(self, pagina):
+        return [producto.nombre for producto in pagina]
+
+    def test_acentos_y_prefijos(self):
+        crear_productos('Pantalón cargo', 'Remera lisa', 'Buzo canguro', categoria='Ropa')
+        self.assertEqual(self.nombres(busqueda.buscar_productos('pantalon')), ['Pantalón cargo'])
+        self.assertEqual(self.nombres(busqueda.buscar_productos('PANTALÓN')), ['Pantalón cargo'])
+        self.assertEqual(self.nombres(busqueda.buscar_productos('rem li')), ['Remera lisa'])
+        # Por prefijo de palabra, no en cualquier parte
+        self.assertEqual(self.nombres(busqueda.buscar_productos('mera')), [])
+        # La categoría también se indexa
+        self.assertEqual(len(busqueda.buscar_productos('ropa')), 3)
+        # Comillas y paréntesis no rompen la consulta de FTS5
+        self.assertEqual(self.nombres(busqueda.buscar_productos('"buzo (')), ['Buzo canguro'])
+
+    def test_resalta_nombre_y_descripcion(self):
+        crear_productos('Remera estampada', descripcion='Algodón peinado <b>suave</b>')
+        producto, = busqueda.buscar_productos('algodon')
+        self.assertEqual(producto.nombre_resaltado, 'Remera estampada')
+        self.assertIn('<mark>Algodón</mark>', producto.fragmento)
+        self.assertIn('&lt;b&gt;', producto.fragmento)
+
+    def test_el_nombre_pesa_mas_que_la_descripcion(self):
+        crear_productos('Campera de jean', descripcion='Abrigada')
+        crear_productos('Jean recto', descripcion='Buen jean')
+        self.assertEqual(self.nombres(busqueda.buscar_productos('jean'))[0], 'Jean recto')
+
+    def test_pagina_todos_los_resultados_sin_tope(self):
+        crear_productos(*[f'Remera {n}' for n in range(70)])
+        crear_productos('Remera oversize', descripcion='Remera remera')
+
+        vistos, cursor, paginas = [], None, 0
+        while True:
+            pagina = busqueda.buscar_productos('remera', cursor=cursor, por_pagina=20)
+            vistos += [producto.pk for producto in pagina]
+            paginas += 1
+            if not pagina.tiene_siguiente:
+                break
+            cursor = pagina.cursor_siguiente
+        self.assertEqual(paginas, 4)
+        self.assertEqual(sorted(vistos), sorted(Producto.objects.values_list('pk', flat=True)))
+        self.assertEqual(len(set(vistos)), 71)
+
+        # Volver atrás desde la última página
+        anterior = busqueda.buscar_productos('remera', cursor=pagina.cursor_anterior, por_pagina=20)
+        self.assertEqual([producto.pk for producto in anterior], vistos[40:60])
+
+    def test_cursor_de_otra_busqueda(self):
+        crear_productos('Remera 1', 'Remera 2')
+        cursor = busqueda.buscar_productos('remera', por_pagina=1).cursor_siguiente
+        with self.assertRaises(CursorInvalido):
+            busqueda.buscar_productos('buzo', cursor=cursor)
+        with self.assertRaises(CursorInvalido):
+            busqueda.buscar_productos('remera', cursor=cursor + 'x')
+
+        # La vista vuelve a la primera página
+        respuesta = self.client.get('/tienda/buscar/', {'q': 'remera', 'cursor': 'cualquiera'})
+        self.assertEqual(len(respuesta.context['productos']), 2)
+
+    def test_solo_activos(self):
+        activo, inactivo = crear_productos('Remera activa', 'Remera inactiva')
+        Producto.objects.filter(pk=inactivo.pk).update(activo=False)
+        self.assertEqual(self.nombres(busqueda.buscar_productos('remera')), ['Remera activa'])
+        self.assertEqual(len(busqueda.buscar_productos('remera', solo_activos=False)), 2)
+
+    def test_filtro_del_panel(self):
+        remera, buzo = crear_productos('Remera lisa', 'Buzo liso')
+        self.assertEqual(list(busqueda.filtrar_por_texto(Producto.objects.order_by('pk'), 'lis')), [remera, buzo])
+        self.assertEqual(list(busqueda.filtrar_por_texto(Producto.objects.all(), 'emera')), [])
+        self.assertEqual(busqueda.filtrar_por_texto(Producto.objects.all(), '  ').count(), 2)
+
+
+class VariantesImagenesTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        configuracion = override_settings(MEDIA_ROOT=self.media, IMAGENES_PROCESOS=0)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def test_foto_de_producto_actualiza_la_tarjeta(self):
+        producto, = crear_productos('Remera lisa')
+        with self.captureOnCommitCallbacks(execute=True):
+            imagen = ImagenProducto.objects.create(producto=producto, imagen=imagen_subida(), es_principal=True)
+
+        imagen.refresh_from_db()
+        self.assertEqual(set(imagen.variantes), {'original', *imagenes.VARIANTES_PRODUCTO})
+        # Sin agrandar el original (1200 de ancho)
+        self.assertEqual(imagen.variantes['zoom']['ancho'], 1200)
+        self.assertTrue(os.path.exists(os.path.join(self.media, imagen.variantes['card']['webp'])))
+        self.assertEqual(TarjetaProducto.objects.get(pk=producto.pk).imagen_variantes, imagen.variantes)
+
+    def test_variantes_de_categoria_no_reindexan_ni_invalidan(self):
+        with self.captureOnCommitCallbacks() as pendientes:
+            categoria = Categoria.objects.create(nombre='Buzos', imagen_fondo=imagen_subida('fondo.png'))
+        crear_productos('Buzo canguro', categoria='Buzos')
+
+        with mock.patch.object(busqueda, 'indexar_categoria') as indexar, \
+                mock.patch.object(facetas, 'invalidar_todo') as facetas_todo, \
+                mock.patch.object(cache_grillas, 'invalidar_todo') as grillas_todo, \
+                mock.patch.object(tarjetas, 'actualizar_categoria') as actualizar_tarjetas:
+            for pendiente in pendientes:
+                pendiente()
+
+        categoria.refresh_from_db()
+        self.assertEqual(set(categoria.imagen_fondo_variantes), {'original', 'card', 'detail'})
+        for receptor in (indexar, facetas_todo, grillas_todo, actualizar_tarjetas):
+            self.assertFalse(receptor.called)
+
+    def test_si_la_imagen_cambio_se_descarta(self):
+        producto, = crear_productos('Remera lisa')
+        imagen = ImagenProducto.objects.create(producto=producto, imagen=imagen_subida())
+        variantes = imagenes.procesar_imagen(self.media, imagen.imagen.name, {'thumb': (160, 160, True)})
+
+        ImagenProducto.objects.filter(pk=imagen.pk).update(imagen='productos/otra.png', variantes={})
+        self.assertFalse(imagenes.guardar_variantes(ImagenProducto, imagen.pk, variantes))
+        self.assertFalse(os.path.exists(os.path.join(self.media, variantes['thumb']['jpg'])))
+        self.assertEqual(ImagenProducto.objects.get(pk=imagen.pk).variantes, {})
+
+    def test_reemplazar_o_borrar_la_imagen_borra_sus_variantes(self):
+        def archivos(variantes):
+            return [os.path.join(self.media, datos[ext])
+                    for nombre, datos in variantes.items() if nombre != 'original' for ext in ('jpg', 'webp')]
+
+        producto, = crear_productos('Remera lisa')
+        with self.captureOnCommitCallbacks(execute=True):
+            imagen = ImagenProducto.objects.create(producto=producto, imagen=imagen_subida('vieja.png'))
+        imagen.refresh_from_db()
+        viejas = archivos(imagen.variantes)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            imagen.imagen = imagen_subida('nueva.png')
+            imagen.save()
+        imagen.refresh_from_db()
+        nuevas = archivos(imagen.variantes)
+        self.assertEqual(imagen.variantes['original'], imagen.imagen.name)
+        self.assertFalse(any(os.path.exists(ruta) for ruta in viejas))
+        self.assertTrue(all(os.path.exists(ruta) for ruta in nuevas))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            imagen.delete()
+        self.assertFalse(any(os.path.exists(ruta) for ruta in nuevas))
+
+    def test_reemplazar_el_fondo_de_categoria_borra_sus_variantes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            categoria = Categoria.objects.create(nombre='Buzos', imagen_fondo=imagen_subida('fondo.png'))
+        categoria.refresh_from_db()
+        vieja = os.path.join(self.media, categoria.imagen_fondo_variantes['card']['webp'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            categoria.imagen_fondo = imagen_subida('otro_fondo.png')
+            categoria.save()
+        categoria.refresh_from_db()
+        self.assertFalse(os.path.exists(vieja))
+        self.assertTrue(os.path.exists(os.path.join(self.media, categoria.imagen_fondo_variantes['card']['webp'])))
+
+
+
+class CambioDeCategoriaTests(TestCase):
+    def setUp(self):
+        self.producto, = crear_productos('Buzo canguro', categoria='Remeras')
+        self.buzos = Categoria.objects.create(nombre='Buzos')
+
+    def mover(self, producto):
+        producto.categoria = self.buzos
+        with mock.patch.object(facetas, 'invalidar_categorias') as invalidar_facetas, \
+                mock.patch.object(cache_grillas, 'invalidar') as invalidar_grillas, \
+                CaptureQueriesContext(connection) as consultas:
+            producto.save()
+        self.assertEqual(set(invalidar_facetas.call_args.args[0]), {self.producto.categoria_id, self.buzos.pk})
+        self.assertEqual(set(invalidar_grillas.call_args.args), {'Remeras', 'Buzos'})
+        return [c['sql'] for c in consultas if c['sql'].startswith('SELECT "tienda_producto"."categoria_id"')]
+
+    def test_leido_de_la_base_no_consulta_la_categoria(self):
+        self.assertEqual(self.mover(Producto.objects.get(pk=self.producto.pk)), [])
+
+    def test_leido_sin_la_categoria_la_consulta(self):
+        self.assertEqual(len(self.mover(Producto.objects.only('nombre').get(pk=self.producto.pk))), 1)
+
+    def test_dos_saves_de_la_misma_instancia(self):
+        producto = Producto.objects.get(pk=self.producto.pk)
+        self.mover(producto)
+        with mock.patch.object(facetas, 'invalidar_categorias') as invalidar_facetas:
+            producto.save()
+        self.assertEqual(set(invalidar_facetas.call_args.args[0]), {self.buzos.pk})
+
+
+class PaginacionCursorTests(TestCase):
+    def setUp(self):
+        # Precios repetidos: el id desempata
+        crear_productos(*[f'Remera {n:02d}' for n in range(23)])
+        for producto in Producto.objects.all():
+            Producto.objects.filter(pk=producto.pk).update(precio=Decimal(1000 + producto.pk % 4))
+
+    def recorrer(self, orden):
+        """Los ids página por página hasta el final y después de vuelta hasta el principio"""
+        productos = Producto.objects.all()
+        pagina = paginar_por_cursor(productos, orden=orden, por_pagina=5)
+        adelante = [p.pk for p in pagina]
+        while pagina.tiene_siguiente:
+            pagina = paginar_por_cursor(productos, orden=orden, cursor=pagina.cursor_siguiente, por_pagina=5)
+            adelante += [p.pk for p in pagina]
+
+        atras = [p.pk for p in pagina]
+        while pagina.tiene_anterior:
+            pagina = paginar_por_cursor(productos, orden=orden, cursor=pagina.cursor_anterior, por_pagina=5)
+            atras = [p.pk for p in pagina] + atras
+        return adelante, atras
+
+    def test_recorre_todos_en_cada_orden(self):
+        productos = list(Producto.objects.all())
+        ordenes = {
+            'menor': lambda p: (p.precio, p.pk),
+            'mayor': lambda p: (-p.precio, -p.pk),
+            'relevantes': lambda p: -p.pk,
+            None: lambda p: (p.nombre, p.pk),
+        }
+        for orden, clave in ordenes.items():
+            with self.subTest(orden=orden):
+                esperado = [p.pk for p in sorted(productos, key=clave)]
+                self.assertEqual(self.recorrer(orden), (esperado, esperado))
+
+    def test_una_consulta_por_pagina(self):
+        pagina = paginar_por_cursor(Producto.objects.all(), orden='menor', por_pagina=5)
+        for _ in range(3):
+            with self.assertNumQueries(1):
+                pagina = paginar_por_cursor(Producto.objects.all(), orden='menor', cursor=pagina.cursor_siguiente,
+                                            por_pagina=5)
+
+    def test_cursores_invalidos(self):
+        cursor = paginar_por_cursor(Producto.objects.all(), orden='menor', por_pagina=5).cursor_siguiente
+        invalidos = {
+            'manipulado': ('menor', cursor[:-2] + 'xx'),
+            'de otro orden': ('mayor', cursor),
+            'incompleto': ('menor', codificar_cursor('menor', [1], 'sig')),
+            'sin dirección': ('menor', codificar_cursor('menor', ['1000', 1], 'otra')),
+        }
+        for caso, (orden, token) in invalidos.items():
+            with self.subTest(caso), self.assertRaises(CursorInvalido):
+                paginar_por_cursor(Producto.objects.all(), orden=orden, cursor=token)
+
+    def test_tamanio_acotado(self):
+        self.assertEqual(tamanio_pagina('1000'), TAMANIO_PAGINA_MAXIMO)
+        self.assertEqual(tamanio_pagina('0'), 1)
+        self.assertEqual(tamanio_pagina('x'), tamanio_pagina(None))
+
+    def test_vistas(self):
+        respuesta = self.client.get(reverse('catalogo'), {'orden': 'menor', 'por_pagina': 5})
+        self.assertEqual(respuesta.content.decode().count('product-card-cool"'), 5)
+        cursor = respuesta.context['pagina']['cursor_siguiente']
+
+        respuesta = self.client.get(reverse('catalogo_items'), {'orden': 'menor', 'por_pagina': 5, 'cursor': cursor})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta['X-Cursor-Siguiente'])
+        # El scroll infinito rechaza un cursor de otro orden; la página vuelve al principio
+        self.assertEqual(self.client.get(reverse('catalogo_items'), {'orden': 'mayor', 'cursor': cursor}).status_code, 400)
+        respuesta = self.client.get(reverse('catalogo'), {'orden': 'mayor', 'cursor': cursor})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.context['pagina']['cursor_anterior'])
+
+
+class FacetasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.m, self.l = Talle.objects.create(nombre='M'), Talle.objects.create(nombre='L')
+        self.rojo = Color.objects.create(nombre='Rojo', codigo_hex='#ff0000')
+        self.remeras = crear_productos(*[f'Remera {n}' for n in range(7)], precio=Decimal('5000'))
+        self.jeans = crear_productos(*[f'Jean {n}' for n in range(3)], categoria='Jeans', precio=Decimal('30000'))
+        for n, producto in enumerate(self.remeras + self.jeans):
+            producto.talles.set([self.m] if n % 2 else [self.m, self.l])
+            if n < 3:
+                producto.colores.add(self.rojo)
+
+    def contadores(self, opciones):
+        return {opcion['nombre']: opcion['cantidad'] for opcion in opciones}
+
+    def test_contadores_de_cada_faceta(self):
+        respuesta = self.client.get(reverse('catalogo'), {'talle': self.l.pk})
+        opciones = respuesta.context['facetas']
+        self.assertEqual(respuesta.context['total_productos'], 5)
+        # Cada faceta se cuenta con los filtros de las otras: elegir L no deja a M en cero
+        self.assertEqual(self.contadores(opciones['talles']), {'M': 10, 'L': 5})
+        self.assertEqual(self.contadores(opciones['categorias']), {'Remeras': 4, 'Jeans': 1})
+        self.assertEqual(self.contadores(opciones['colores']), {'Rojo': 2})
+        self.assertEqual(self.contadores(opciones['precios'])['Hasta $10.000'], 4)
+        self.assertContains(respuesta, 'L (5)')
+        self.assertEqual(respuesta.content.decode().count('product-card-cool"'), 5)
+
+    def test_filtros_combinados_y_dentro_de_una_categoria(self):
+        respuesta = self.client.get(reverse('catalogo_categoria', args=['Jeans']), {'precio': '0-10000'})
+        self.assertEqual(respuesta.context['total_productos'], 0)
+        self.assertEqual(respuesta.context['facetas']['categorias'], [])
+
+        respuesta = self.client.get(reverse('catalogo'), {'talle': self.m.pk, 'color': self.rojo.pk})
+        self.assertEqual(respuesta.context['total_productos'], 3)
+
+    def test_el_indice_sale_de_la_cache_y_se_invalida(self):
+        remeras_id = self.remeras[0].categoria_id
+        facetas.indice_facetas(remeras_id)
+        with self.assertNumQueries(0):
+            facetas.indice_facetas(remeras_id)
+
+        # Un talle nuevo en un producto (m2m)
+        self.remeras[1].talles.add(self.l)
+        self.assertEqual(len([f for f in facetas.indice_facetas(remeras_id)['filas'] if self.l.pk in f[3]]), 5)
+
+        # Un producto que cambia de categoría
+        self.jeans[0].categoria_id = remeras_id
+        self.jeans[0].save()
+        self.assertEqual(len(facetas.indice_facetas(remeras_id)['filas']), 8)
+
+        # Renombrar un talle invalida todas las categorías
+        self.l.nombre = 'XL'
+        self.l.save()
+        self.assertEqual(facetas.indice_facetas(remeras_id)['talles'][self.l.pk], 'XL')
+
+
+class TarjetasTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        configuracion = override_settings(MEDIA_ROOT=self.media, IMAGENES_PROCESOS=0)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        cache.clear()
+
+        self.productos = crear_productos(*[f'Remera {n:02d}' for n in range(6)], precio=Decimal('300'), stock=0)
+        for producto in self.productos:
+            ImagenProducto.objects.create(producto=producto, imagen=imagen_subida(f'otra-{producto.pk}.png'), orden=1)
+            ImagenProducto.objects.create(producto=producto, imagen=imagen_subida(f'principal-{producto.pk}.png'),
+                                          orden=2, es_principal=True)
+
+    def tarjeta(self, producto):
+        return TarjetaProducto.objects.get(pk=producto.pk)
+
+    def test_se_mantiene_con_las_senales(self):
+        producto = self.productos[0]
+        tarjeta = self.tarjeta(producto)
+        self.assertIn('principal-', tarjeta.imagen_url)
+        self.assertEqual((tarjeta.cuota, tarjeta.en_stock, tarjeta.categoria_nombre), (Decimal('100.00'), False, 'Remeras'))
+
+        producto.stock, producto.precio = 3, Decimal('1000')
+        producto.save()
+        self.assertEqual((self.tarjeta(producto).cuota, self.tarjeta(producto).en_stock), (Decimal('333.33'), True))
+
+        # Sin la principal queda la primera por orden
+        producto.imagenes.get(es_principal=True).delete()
+        self.assertIn('otra-', self.tarjeta(producto).imagen_url)
+
+        categoria = producto.categoria
+        categoria.nombre = 'Tops'
+        categoria.save()
+        self.assertEqual(TarjetaProducto.objects.filter(categoria_nombre='Tops').count(), 6)
+
+        producto.delete()
+        self.assertFalse(TarjetaProducto.objects.filter(pk=producto.pk).exists())
+
+    def test_reconstruir_y_actualizar_sin_imagen(self):
+        esperadas = list(TarjetaProducto.objects.order_by('pk').values_list('pk', 'imagen_url', 'cuota'))
+        TarjetaProducto.objects.all().delete()
+        self.assertEqual(tarjetas.reconstruir_tarjetas(tamanio_lote=4), 6)
+        self.assertEqual(list(TarjetaProducto.objects.order_by('pk').values_list('pk', 'imagen_url', 'cuota')), esperadas)
+
+        producto = self.productos[1]
+        Producto.objects.filter(pk=producto.pk).update(precio=Decimal('1000'), nombre='Remera nueva')
+        tarjetas.actualizar_sin_imagen([producto.pk])
+        tarjeta = self.tarjeta(producto)
+        self.assertEqual((tarjeta.nombre, tarjeta.cuota), ('Remera nueva', tarjetas.calcular_cuota(Decimal('1000'))))
+        # La imagen no se toca
+        self.assertIn('principal-', tarjeta.imagen_url)
+
+    def test_los_listados_no_consultan_imagenes(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('catalogo'))
+        self.assertContains(respuesta, '<img src="/media/productos/principal-', count=6)
+        self.assertFalse([c for c in consultas if 'tienda_imagenproducto' in c['sql']])
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('index'))
+        self.assertContains(respuesta, 'principal-')
+        self.assertFalse([c for c in consultas if 'tienda_imagenproducto' in c['sql']])
+
+
+class ExportacionTests(TestCase):
+    def setUp(self):
+        self.productos = crear_productos(*[f'Remera {n}' for n in range(5)], precio=Decimal('10.50'))
+        Producto.objects.filter(pk__in=[p.pk for p in self.productos[:2]]).update(
+            actualizado=datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        )
+        self.client.force_login(User.objects.create_user('integracion', 'i@tienda.com', 'clave'))
+
+    def exportar(self, **parametros):
+        respuesta = self.client.get(reverse('listar_productos'), parametros)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, b''.join(respuesta.streaming_content).decode()
+
+    def test_json(self):
+        _, contenido = self.exportar()
+        filas = json.loads(contenido)
+        self.assertEqual([fila['id'] for fila in filas], [p.pk for p in self.productos])
+        self.assertEqual(set(filas[0]), set(exportacion.CAMPOS_POR_DEFECTO))
+        self.assertEqual(filas[0]['precio'], '10.50')
+        self.assertEqual(json.loads(self.exportar(updated_since='2999-01-01')[1]), [])
+
+    def test_ndjson_con_campos_y_updated_since(self):
+        respuesta, contenido = self.exportar(formato='ndjson', campos='id,actualizado', updated_since='2026-01-01')
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson')
+        filas = [json.loads(linea) for linea in contenido.splitlines()]
+        self.assertEqual([fila['id'] for fila in filas], [p.pk for p in self.productos[2:]])
+        self.assertEqual(set(filas[0]), {'id', 'actualizado'})
+
+        _, contenido = self.exportar(formato='ndjson', updated_since='2024-12-31T20:00:00-03:00')
+        self.assertEqual(len(contenido.splitlines()), 5)
+
+    def test_parametros_invalidos(self):
+        for parametros in ({'campos': 'password'}, {'formato': 'xml'}, {'updated_since': 'ayer'},
+                           {'updated_since': '2026-02-30'}, {'updated_since': '2026-01-31T25:00:00'}):
+            with self.subTest(**parametros):
+                respuesta = self.client.get(reverse('listar_productos'), parametros)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertIn('error', respuesta.json())
+
+
+class CacheGrillasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache_grillas.reiniciar_estadisticas()
+        self.remeras = crear_productos(*[f'Remera {n}' for n in range(3)])
+        self.jean, = crear_productos('Jean recto', categoria='Jeans')
+        self.url = reverse('catalogo_categoria', args=['Remeras'])
+
+    def aciertos(self):
+        return cache_grillas.estadisticas()['aciertos']
+
+    def test_aciertos_e_invalidacion_por_categoria(self):
+        self.client.get(self.url)
+        cache_grillas.reiniciar_estadisticas()
+        self.client.get(self.url)
+        self.assertEqual(cache_grillas.estadisticas(), {'aciertos': 1, 'fallos': 0, 'tasa_aciertos': 1.0})
+
+        # Un cambio en otra categoría no toca la grilla de Remeras...
+        self.jean.nombre = 'Jean chupín'
+        self.jean.save()
+        self.client.get(self.url)
+        self.assertEqual(self.aciertos(), 2)
+        # ...pero sí la del catálogo completo
+        self.assertContains(self.client.get(reverse('catalogo')), 'Jean chupín')
+
+        remera = self.remeras[0]
+        remera.nombre = 'Remera nueva'
+        remera.save()
+        self.assertContains(self.client.get(self.url), 'Remera nueva')
+        self.assertEqual(self.aciertos(), 2)
+
+    def test_destacados_y_categorias(self):
+        self.client.get(reverse('index'))
+        remera = self.remeras[0]
+        remera.nombre = 'Remera nueva'
+        remera.save()
+        self.assertContains(self.client.get(reverse('index')), 'Remera nueva')
+
+        # Renombrar una categoría descarta todos los fragmentos
+        categoria = remera.categoria
+        categoria.nombre = 'Tops'
+        categoria.save()
+        self.assertContains(self.client.get(reverse('catalogo_categoria', args=['Tops'])), 'Remera nueva')
+
+    def test_paginas_calientes_con_la_cache_de_settings(self):
+        # Sin override: la cache de settings.CACHES no agrega consultas ni escrituras
+        for url, consultas in ((self.url, 1), (reverse('catalogo'), 0), (reverse('index'), 1)):
+            with self.subTest(url=url):
+                self.client.get(url)
+                with self.assertNumQueries(consultas):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_los_contadores_no_escriben_en_la_cache(self):
+        self.client.get(self.url)
+        with mock.patch.object(cache, 'incr') as incr, mock.patch.object(cache, 'add') as add, \
+                self.assertLogs('tienda.cache_grillas', 'INFO') as log, \
+                mock.patch.object(cache_grillas, 'REGISTRAR_CADA', 2):
+            self.client.get(self.url)
+        self.assertFalse(incr.called or add.called)
+        self.assertIn('1 aciertos, 1 fallos', log.output[0])
+
+    def test_un_sello_perdido_no_revive_fragmentos_viejos(self):
+        generar = mock.Mock(side_effect=['viejo', 'nuevo'])
+        with mock.patch('time.time', return_value=1000):
+            cache_grillas.obtener_fragmento('Remeras', ('p',), generar)
+        cache.delete(cache_grillas._clave_sello('Remeras'))
+
+        with mock.patch('time.time', return_value=2000):
+            self.assertEqual(cache_grillas.obtener_fragmento('Remeras', ('p',), generar), 'nuevo')
+        self.assertEqual(generar.call_count, 2)
+
+    def test_estado_cache(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        salida = io.StringIO()
+        call_command('estado_cache', '--reiniciar', '--invalidar', stdout=salida)
+        self.assertIn('Tasa de aciertos: 50.0%', salida.getvalue())
+        self.assertEqual(cache_grillas.estadisticas()['fallos'], 0)
+        self.client.get(self.url)
+        self.assertEqual(cache_grillas.estadisticas()['fallos'], 1)
+
+
+class RecomendacionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.remeras = crear_productos(*[f'Remera {n}' for n in range(4)])
+        self.jeans = crear_productos(*[f'Jean {n}' for n in range(4)], categoria='Jeans')
+
+    def pedido(self, *productos, estado='pagado'):
+        pedido = Pedido.objects.create(estado=estado)
+        ItemPedido.objects.bulk_create([
+            ItemPedido(pedido=pedido, producto=producto, nombre_producto=producto.nombre,
+                       precio_unitario=producto.precio, cantidad=1)
+            for producto in productos
+        ])
+
+    def test_co_ocurrencias(self):
+        pedidos = np.array([1, 1, 1, 2, 2, 3])
+        productos = np.array([10, 11, 12, 10, 11, 10])
+        ids, ventas, a, b, conteo = recomendaciones.co_ocurrencias(pedidos, productos)
+        pares = {(int(ids[x]), int(ids[y])): int(c) for x, y, c in zip(a, b, conteo)}
+        self.assertEqual(pares, {
+            (10, 11): 2, (11, 10): 2, (10, 12): 1, (12, 10): 1, (11, 12): 1, (12, 11): 1,
+        })
+        self.assertEqual(dict(zip(ids.tolist(), ventas.tolist())), {10: 3, 11: 2, 12: 1})
+
+    def test_compras_conjuntas_y_mas_vendidos_de_la_categoria(self):
+        remera, otra = self.remeras[0], self.remeras[1]
+        jean_a, jean_b, jean_c = self.jeans[:3]
+        self.pedido(remera, jean_a)
+        self.pedido(remera, jean_a)
+        self.pedido(remera, jean_b)
+        self.pedido(remera, jean_c, estado='cancelado')
+        self.pedido(otra, self.remeras[2])
+        self.pedido(otra)
+
+        call_command('calcular_recomendaciones', '--top', '3', stdout=io.StringIO())
+
+        relacionados = list(Recomendacion.objects.filter(producto=remera).order_by('posicion')
+                            .values_list('recomendado_id', 'origen'))
+        self.assertEqual(relacionados[:2], [(jean_a.pk, 'compras'), (jean_b.pk, 'compras')])
+        # Lo cancelado no cuenta; se completa con la misma categoría
+        self.assertEqual(relacionados[2], (otra.pk, 'categoria'))
+        # Sin historial: solo los más vendidos de su categoría
+        self.assertEqual(
+            set(Recomendacion.objects.filter(producto=self.remeras[3]).values_list('origen', flat=True)),
+            {'categoria'},
+        )
+
+    def test_el_detalle_usa_las_precalculadas(self):
+        remera, jean = self.remeras[0], self.jeans[0]
+        respuesta = self.client.get(reverse('producto_detalle', args=[remera.pk]))
+        # Antes del primer cálculo: cualquiera de la misma categoría
+        self.assertEqual({t.categoria_id for t in respuesta.context['relacionados']}, {remera.categoria_id})
+
+        self.pedido(remera, jean)
+        recomendaciones.calcular_recomendaciones()
+        respuesta = self.client.get(reverse('producto_detalle', args=[remera.pk]))
+        self.assertEqual(respuesta.context['relacionados'][0].pk, jean.pk)
+        self.assertLessEqual(len(respuesta.context['relacionados']), 4)
+
+
+class GetCondicionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.producto, = crear_productos('Remera lisa')
+        self.talle = Talle.objects.create(nombre='M')
+
+    def condicional(self, url, consultas, **parametros):
+        """Pide la página y la vuelve a pedir con sus validadores: 304 sin renderizar"""
+        respuesta = self.client.get(url, parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta['ETag']
+        with self.assertNumQueries(consultas):
+            self.assertEqual(self.client.get(url, parametros, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        respuesta = self.client.get(url, parametros, HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+        self.assertEqual(respuesta.status_code, 304)
+        return etag
+
+    def test_detalle(self):
+        url = reverse('producto_detalle', args=[self.producto.pk])
+        etag = self.condicional(url, 1)
+        # Un talle nuevo toca Producto.actualizado
+        self.producto.talles.add(self.talle)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('producto_detalle', args=[999999])).status_code, 404)
+
+    def test_catalogo_sin_consultas(self):
+        url = reverse('catalogo_categoria', args=['Remeras'])
+        etag = self.condicional(url, 0)
+        self.producto.precio = Decimal('5')
+        self.producto.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Otro orden es otra página
+        etag_menor = self.condicional(reverse('catalogo'), 0, orden='menor')
+        self.assertNotEqual(self.client.get(reverse('catalogo'), HTTP_IF_NONE_MATCH=etag_menor).status_code, 304)
+
+    def test_exportacion_y_api(self):
+        usuario = User.objects.create_user('integracion', 'i@tienda.com', 'clave')
+        self.client.force_login(usuario)
+        url = reverse('listar_productos')
+        # Solo la sesión y el usuario: la versión sale de la cache
+        etag = self.condicional(url, 2)
+        # Un borrado no cambia el último 'actualizado' pero sí la versión
+        crear_productos('Remera nueva')
+        etag = self.client.get(url)['ETag']
+        self.producto.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Se exporta el nombre de la categoría
+        etag = self.client.get(url)['ETag']
+        Categoria.objects.get(nombre='Remeras').save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        request = RequestFactory().get('/')
+        request.user = usuario
+        producto, = crear_productos('Buzo canguro')
+        etag = views.obtener_producto(request, producto.pk)['ETag']
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=etag)
+        request.user = usuario
+        self.assertEqual(views.obtener_producto(request, producto.pk).status_code, 304)
+
+
+class ImportacionTests(TestCase):
+    def setUp(self):
+        Talle.objects.create(nombre='M')
+        self.lisa, = crear_productos('Lisa', precio=Decimal('10'), stock=1)
+
+    def test_csv_crea_actualiza_e_informa_errores(self):
+        archivo = io.StringIO(
+            'nombre,categoria,precio,stock,talles,colores\n'
+            'Lisa,Remeras,"1500,5",3,S|M,Rojo\n'
+            'Nueva,Jeans,2000,0,M,\n'
+            'Nueva,Jeans,2100,2,L,Azul\n'
+            ',Jeans,1,1,,\n'
+            'Mala,Jeans,-1,1,,\n'
+        )
+        resultado = importar_productos(leer_csv(archivo), tamanio_lote=2)
+
+        # "Nueva" se crea en la primera tanda y se actualiza en la segunda
+        self.assertEqual((resultado.creados, resultado.actualizados, resultado.cantidad_errores), (1, 2, 2))
+        self.assertEqual([linea for linea, _ in resultado.errores], [5, 6])
+
+        self.lisa.refresh_from_db()
+        self.assertEqual(self.lisa.precio, Decimal('1500.50'))
+        self.assertEqual(sorted(self.lisa.talles.values_list('nombre', flat=True)), ['M', 'S'])
+        self.assertEqual(Talle.objects.filter(nombre='M').count(), 1)
+
+        nueva = Producto.objects.get(nombre='Nueva')
+        self.assertEqual(nueva.precio, Decimal('2100'))
+        self.assertEqual(list(nueva.talles.values_list('nombre', flat=True)), ['L'])
+        self.assertEqual(list(nueva.colores.values_list('nombre', flat=True)), ['Azul'])
+        # Tarjeta e índice de búsqueda al día sin las señales por fila
+        tarjeta = TarjetaProducto.objects.get(pk=nueva.pk)
+        self.assertEqual((tarjeta.categoria_nombre, tarjeta.cuota, tarjeta.en_stock), ('Jeans', Decimal('700.00'), True))
+        self.assertEqual([producto.pk for producto in busqueda.buscar_productos('nueva')], [nueva.pk])
+
+    def test_ndjson_por_id(self):
+        self.lisa.colores.add(Color.objects.create(nombre='Rojo'))
+        archivo = io.StringIO(
+            f'{{"id": {self.lisa.pk}, "nombre": "Lisa 2", "categoria": "Remeras", "precio": 5, "talles": []}}\n'
+            '{"id": 999999, "nombre": "x", "categoria": "a", "precio": 1}\n'
+            'no es json\n'
+        )
+        resultado = importar_productos(leer_ndjson(archivo))
+        self.assertEqual((resultado.creados, resultado.actualizados, resultado.cantidad_errores), (0, 1, 2))
+        self.lisa.refresh_from_db()
+        # Lo que no viene en la fila (colores) no se toca
+        self.assertEqual((self.lisa.nombre, self.lisa.talles.count(), self.lisa.colores.count()), ('Lisa 2', 0, 1))
+
+    def test_comando_y_panel(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        ruta = os.path.join(carpeta, 'proveedor.csv')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write('nombre,categoria,precio\nBuzo,Buzos,10\nMalo,Buzos,x\n')
+        salida = io.StringIO()
+        call_command('importar_productos', ruta, stdout=salida)
+        self.assertIn('1 creados', salida.getvalue())
+        self.assertIn('Línea 3', salida.getvalue())
+
+        self.client.force_login(User.objects.create_superuser('admin', 'a@tienda.com', 'clave'))
+        archivo = SimpleUploadedFile('p.csv', '\ufeffnombre,categoria,precio\nCampera,Abrigos,10\n'.encode('utf-8'))
+        respuesta = self.client.post(reverse('panel_admin:productos_importar'), {'archivo': archivo})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['resultado'].creados, 1)
+        self.assertTrue(Producto.objects.filter(nombre='Campera', categoria__nombre='Abrigos').exists())
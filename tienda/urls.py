@@ -14,8 +14,14 @@ urlpatterns = [
     
     # NUEVA RUTA: Para filtrar por categoría (ej: catalogo/pantalones/)
     path('catalogo/<str:nombre_categoria>/', views.catalogo, name='catalogo_categoria'),
+
+    # Fragmento para el scroll infinito (?cursor=&orden=&nombre_categoria=)
+    path('catalogo-items/', views.catalogo_items, name='catalogo_items'),
     
     path('buscar/', views.buscar_productos, name='buscar_productos'),
+
+    # API para integraciones: exportación del catálogo en streaming
+    path('api/productos/', listar_productos, name='listar_productos'),
     path('producto/<int:id>/', views.producto_detalle, name='producto_detalle'),
     path('comprar-ahora/<int:id>/', views.comprar_ahora, name='comprar_ahora'),
     
@@ -0,0 +1,136 @@
+# tienda/validadores.py
+"""
+GET condicional (ETag / Last-Modified) para las páginas y la API de productos.
+
+Los validadores se calculan SIN renderizar: a lo sumo una consulta
+chiquita (o solo la cache) por request. Si el navegador o el cliente de
+la API manda If-None-Match / If-Modified-Since y nada cambió, Django
+contesta 304 sin cuerpo (ver django.views.decorators.http.condition).
+
+De dónde sale cada validador:
+- Producto.actualizado: también se toca cuando cambian sus imágenes o sus
+  talles/colores (señales en tienda/signals.py).
+- Categoria.actualizado.
+- El catálogo usa los sellos de tienda/cache_grillas.py, que ya cambian
+  con cualquier modificación de productos/categorías: cero consultas.
+- La exportación usa la versión de tienda/exportacion.py: cero consultas.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib import messages
+from django.views.decorators.http import condition
+
+from carrito.backends import CLAVE_RESUMEN
+
+from . import cache_grillas, exportacion
+from .models import Producto
+
+
+def _etag(*partes):
+    return hashlib.md5(repr(partes).encode('utf-8')).hexdigest()
+
+
+def _fecha_sello(valor):
+    # Los sellos son milisegundos desde epoch
+    return datetime.fromtimestamp(valor / 1000, tz=dt_timezone.utc)
+
+
+def _usuario(request):
+    # El HTML lleva el menú según el usuario y el contador del carrito:
+    # no compartir validadores entre sesiones
+    resumen = request.session.get(CLAVE_RESUMEN) or {}
+    return (request.user.pk if request.user.is_authenticated else None), resumen.get('cantidad')
+
+
+def _hay_mensajes(request):
+    # Un 304 no mostraría el mensaje pendiente (ej: "agregado al carrito").
+    # len() los carga sin marcarlos como leídos.
+    return len(messages.get_messages(request)) > 0
+
+
+def _condicion(calcular):
+    """
+    Arma el decorador condition() con una función que devuelve
+    (etag, last_modified). Se calcula una sola vez por request aunque
+    Django pida los dos valores por separado.
+    """
+    def validadores(request, *args, **kwargs):
+        if not hasattr(request, '_validadores'):
+            request._validadores = calcular(request, *args, **kwargs) or (None, None)
+        return request._validadores
+
+    def etag(request, *args, **kwargs):
+        return validadores(request, *args, **kwargs)[0]
+
+    def ultima_modificacion(request, *args, **kwargs):
+        return validadores(request, *args, **kwargs)[1]
+
+    return condition(etag_func=etag, last_modified_func=ultima_modificacion)
+
+
+# ==================== PRODUCTO ====================
+
+def _datos_producto(producto_id):
+    datos = Producto.objects.filter(pk=producto_id).order_by().values_list(
+        'actualizado', 'categoria__actualizado', 'categoria__nombre'
+    ).first()
+    if datos is None:
+        return None
+    actualizado, categoria_actualizada, categoria_nombre = datos
+    # Categorías viejas pueden no tener fecha (el campo admite NULL)
+    return actualizado, categoria_actualizada or actualizado, categoria_nombre
+
+
+def _validadores_detalle(request, id):
+    if _hay_mensajes(request):
+        return None
+    datos = _datos_producto(id)
+    if datos is None:
+        return None  # 404 normal
+    actualizado, categoria_actualizada, categoria_nombre = datos
+    # Los relacionados son tarjetas de otros productos: el sello de la
+    # grilla de la categoría cambia cuando cambia cualquiera de ellos
+    sello = max(cache_grillas.sello(cache_grillas.GLOBAL), cache_grillas.sello(categoria_nombre))
+    etag = _etag('detalle', id, actualizado, categoria_actualizada, sello, _usuario(request))
+    return etag, max(actualizado, categoria_actualizada, _fecha_sello(sello))
+
+
+def _validadores_api_producto(request, producto_id):
+    datos = _datos_producto(producto_id)
+    if datos is None:
+        return None
+    actualizado, categoria_actualizada, _ = datos
+    return _etag('api', producto_id, actualizado, categoria_actualizada), max(actualizado, categoria_actualizada)
+
+
+condicion_detalle = _condicion(_validadores_detalle)
+condicion_api_producto = _condicion(_validadores_api_producto)
+
+
+# ==================== CATÁLOGO ====================
+
+def _validadores_catalogo(request, nombre_categoria=None):
+    if _hay_mensajes(request):
+        return None
+    sellos = (
+        cache_grillas.sello(cache_grillas.GLOBAL),
+        cache_grillas.sello(nombre_categoria or cache_grillas.TODAS),
+    )
+    etag = _etag('catalogo', nombre_categoria, request.GET.urlencode(), sellos, _usuario(request))
+    return etag, _fecha_sello(max(sellos))
+
+
+condicion_catalogo = _condicion(_validadores_catalogo)
+
+
+# ==================== EXPORTACIÓN ====================
+
+def _validadores_exportacion(request):
+    # La versión cambia con altas, bajas y cualquier cambio de un producto
+    # o de su categoría: no hace falta recorrer la tabla
+    version = exportacion.version()
+    return _etag('exportacion', request.GET.urlencode(), version), _fecha_sello(version)
+
+
+condicion_exportacion = _condicion(_validadores_exportacion)
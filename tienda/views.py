@@ -1,6 +1,8 @@
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 # Create your views here.
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required, permission_required
 #from .models import Producto
@@ -8,25 +10,55 @@ import json
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 
-from .models import Producto, Categoria, Favorito
+from .models import Producto, Categoria, Favorito, TarjetaProducto
 from django.conf import settings
 from django.contrib import messages
 from django.shortcuts import redirect  
 from pedidos_pagos.models import Pedido, ItemPedido
 from django.db import transaction
 from carrito.models import Carrito, ItemCarrito
+from carrito.backends import obtener_backend
+from .paginacion import paginar_por_cursor, CursorInvalido
+from . import busqueda, exportacion, cache_grillas, validadores
+from .facetas import filtrar_catalogo, aplicar_filtros, leer_filtros
 
 
 # LISTAR PRODUCTOS
 @login_required
+@validadores.condicion_exportacion
 def listar_productos(request):
-    productos = Producto.objects.all().values(
-        'id', 'nombre', 'descripcion', 'precio', 'stock', 'categoria__nombre'
-    )
-    return JsonResponse(list(productos), safe=False)
+    """
+    Exporta el catálogo en streaming (ver tienda/exportacion.py).
+    Parámetros opcionales:
+        ?formato=json|ndjson
+        ?campos=id,nombre,precio
+        ?updated_since=2026-01-31T00:00:00  (filtra por 'actualizado')
+    """
+    formato = request.GET.get('formato', 'json')
+    if formato not in exportacion.FORMATOS:
+        return JsonResponse({'error': 'Formato no soportado (json o ndjson)'}, status=400)
+
+    try:
+        campos = exportacion.leer_campos(request.GET.get('campos'))
+        desde = exportacion.leer_fecha(request.GET.get('updated_since'))
+    except exportacion.ParametroInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    productos = Producto.objects.all()
+    if desde:
+        productos = productos.filter(actualizado__gte=desde)
+
+    filas = exportacion.filas_productos(productos, campos)
+    if formato == 'ndjson':
+        contenido = exportacion.generar_ndjson(filas)
+    else:
+        contenido = exportacion.generar_json(filas)
+
+    return StreamingHttpResponse(contenido, content_type=exportacion.FORMATOS[formato])
 
 # OBTENER UN PRODUCTO
 @login_required
+@validadores.condicion_api_producto
 def obtener_producto(request, producto_id):
     try:
         p = Producto.objects.get(id=producto_id)
@@ -112,41 +144,113 @@ def eliminar_producto(request, producto_id):
 #     return render(request, 'tienda/producto.html', {'producto': producto})
 
 # Agregamos 'nombre_categoria=None' para que sea opcional
-def catalogo(request, nombre_categoria=None): 
-    # 1. Traemos todos los productos inicialmente
-    productos = Producto.objects.all()
+def _productos_catalogo(nombre_categoria=None):
+    """Queryset base del catálogo (compartido por la página y el scroll infinito)"""
+    # 1. Las tarjetas ya traen imagen, categoría y cuota: una sola consulta por página
+    productos = TarjetaProducto.objects.all()
 
     # 2. Si entramos por una categoría (ej: Pantalones), filtramos
     if nombre_categoria:
-        productos = productos.filter(categoria__nombre=nombre_categoria)
+        productos = productos.filter(categoria_nombre=nombre_categoria)
+
+    return productos
+
+
+def _grilla_catalogo(request, productos, nombre_categoria, cursor):
+    """
+    HTML de una tanda de tarjetas + cursores, guardado en la cache de
+    fragmentos (tienda/cache_grillas.py). Lo comparten la página del
+    catálogo y el scroll infinito: para los mismos parámetros el HTML es igual.
+    """
+    orden = request.GET.get('orden')
+    por_pagina = request.GET.get('por_pagina')
+    filtros = leer_filtros(request.GET)
+    partes = (
+        orden, cursor, por_pagina,
+        tuple((faceta, tuple(sorted(valores))) for faceta, valores in sorted(filtros.items())),
+    )
+
+    def generar():
+        pagina = paginar_por_cursor(productos, orden=orden, cursor=cursor, por_pagina=por_pagina)
+        html = render_to_string('tienda/catalogo_items.html', {
+            'productos': pagina,
+            'primera_pagina': not cursor,
+        })
+        return {
+            'html': mark_safe(html) if pagina.items else '',
+            'cursor_siguiente': pagina.cursor_siguiente,
+            'cursor_anterior': pagina.cursor_anterior,
+        }
 
-    # 3. Mantenemos la lógica de ordenado que ya tenías
+    ambito = nombre_categoria or cache_grillas.TODAS
+    return cache_grillas.obtener_fragmento(ambito, partes, generar)
+
+
+@validadores.condicion_catalogo
+def catalogo(request, nombre_categoria=None): 
+    # 3. Filtros por talle/color/categoría/precio + contadores de cada opción
+    resultado = filtrar_catalogo(_productos_catalogo(nombre_categoria), request.GET, nombre_categoria)
+
+    # 4. El orden elegido define la clave del cursor (precio+id o -id).
+    #    La grilla sale de la cache de fragmentos mientras no cambien los productos.
     ordenar_por = request.GET.get('orden')
-    if ordenar_por == 'menor':
-        productos = productos.order_by('precio')
-    elif ordenar_por == 'mayor':
-        productos = productos.order_by('-precio')
-    elif ordenar_por == 'relevantes':
-        productos = productos.order_by('-id')
+    cursor = request.GET.get('cursor')
+    try:
+        pagina = _grilla_catalogo(request, resultado.productos, nombre_categoria, cursor)
+    except CursorInvalido:
+        # Cursor viejo o manipulado: arrancamos desde la primera página
+        cursor = None
+        pagina = _grilla_catalogo(request, resultado.productos, nombre_categoria, cursor)
 
     return render(request, 'tienda/catalogo.html', {
-        'productos': productos,
+        'pagina': pagina,
+        'orden': ordenar_por or '',
+        'facetas': resultado.facetas,
+        'total_productos': resultado.total,
+        'hay_filtros': resultado.hay_filtros,
         'categoria_actual': nombre_categoria # Esto te sirve para poner un título dinámico
     })
 
+
+def catalogo_items(request):
+    """
+    Fragmento HTML para el scroll infinito del catálogo.
+    Recibe ?cursor=&orden=&nombre_categoria= (más los filtros) y devuelve solo las tarjetas.
+    """
+    nombre_categoria = request.GET.get('nombre_categoria') or None
+    productos = aplicar_filtros(_productos_catalogo(nombre_categoria), leer_filtros(request.GET))
+    try:
+        pagina = _grilla_catalogo(request, productos, nombre_categoria, request.GET.get('cursor'))
+    except CursorInvalido as e:
+        return HttpResponse(str(e), status=400)
+
+    response = HttpResponse(pagina['html'])
+    # El JS lee de acá el cursor de la próxima tanda (vacío = no hay más)
+    response['X-Cursor-Siguiente'] = pagina['cursor_siguiente'] or ''
+    return response
+
+@validadores.condicion_detalle
 def producto_detalle(request, id):
     producto = get_object_or_404(
-        Producto.objects.prefetch_related('imagenes', 'talles', 'colores'), 
+        Producto.objects.select_related('categoria').prefetch_related('imagenes', 'talles', 'colores'), 
         id=id
     )
     
     # Calculamos el valor de la cuota aquí en Python
     cuota = producto.precio / 3
     
-    relacionados = Producto.objects.filter(
-        categoria=producto.categoria, 
+    # Relacionados precalculados por `calcular_recomendaciones` (una consulta por índice)
+    relacionados = list(TarjetaProducto.objects.filter(
+        producto__recomendado_en__producto_id=producto.id,
         activo=True
-    ).exclude(id=producto.id)[:4]
+    ).order_by('producto__recomendado_en__posicion')[:4])
+
+    if not relacionados:
+        # Todavía no se corrió el cálculo: cualquiera de la misma categoría
+        relacionados = TarjetaProducto.objects.filter(
+            categoria_id=producto.categoria_id, 
+            activo=True
+        ).exclude(pk=producto.id)[:4]
     
     return render(request, 'tienda/producto.html', {
         'producto': producto,
@@ -156,14 +260,12 @@ def producto_detalle(request, id):
 
 def buscar_productos(request):
     query = request.GET.get('q', '')
-    if query:
-        productos = Producto.objects.filter(
-            Q(nombre__icontains=query) | 
-            Q(categoria__nombre__icontains=query),
-            activo=True
-        ).prefetch_related('imagenes').distinct() # Agregamos prefetch_related
-    else:
-        productos = Producto.objects.none()
+    # Índice FTS5: sin acentos, por prefijo y ordenado por relevancia (tienda/busqueda.py),
+    # de a una página por cursor
+    try:
+        productos = busqueda.buscar_productos(query, cursor=request.GET.get('cursor')) if query else []
+    except CursorInvalido:
+        productos = busqueda.buscar_productos(query)
 
     return render(request, 'tienda/busqueda.html', {
         'query': query,
@@ -209,26 +311,16 @@ def comprar_ahora(request, id):
         # 1. Obtenemos el producto (que esté activo y con stock)
         producto = get_object_or_404(Producto, id=id, activo=True, stock__gt=0)
         
-        # 2. Aseguramos que el usuario tenga una sesión activa
-        if not request.session.session_key:
-            request.session.create()
-        
-        # 3. Obtenemos o creamos el carrito vinculado a la sesión
-        carrito, created = Carrito.objects.get_or_create(
-            session_key=request.session.session_key
-        )
+        # 2. Obtenemos el carrito de la sesión (ver carrito/backends.py)
+        carrito = obtener_backend(request)
         
-        # 4. LIMPIEZA: Borramos lo que hubiera antes para que sea "Compra Única"
-        carrito.items.all().delete()
+        # 3. LIMPIEZA: Borramos lo que hubiera antes para que sea "Compra Única"
+        carrito.vaciar()
         
-        # 5. Agregamos el producto seleccionado
-        ItemCarrito.objects.create(
-            carrito=carrito,
-            producto=producto,
-            cantidad=1
-        )
+        # 4. Agregamos el producto seleccionado
+        carrito.agregar(producto.id)
         
-        # 6. REDIRECCIÓN: En lugar de crear el pedido aquí, 
+        # 5. REDIRECCIÓN: En lugar de crear el pedido aquí, 
         # lo mandamos a que ponga su Mail y Teléfono
         return redirect('checkout') # Asegúrate que este nombre coincida con tu urls.py
         